@@ -0,0 +1,55 @@
+"""Size and decode time of item modify events stored as full documents versus field deltas.
+
+Sizes are of the events' JSON encoding, a close stand-in for their BSON size in item_changelog.
+Run from the repository root:
+    python -m benchmarks.bench_changelog_size --items 20000
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from benchmarks.mock_api import make_item
+from structural_diff import FULL_DOCUMENTS_ENV, IGNORED_ITEM_PATHS, modify_event
+
+
+def make_modifications(item_count, seed=1):
+    """Pairs of (before, after) items with the kind of small edits a balance patch makes."""
+    rng = random.Random(seed)
+    pairs = []
+    for index in range(item_count):
+        before = make_item(index, rng)
+        after = json.loads(json.dumps(before))
+        stat = rng.choice(list(after['identifications']))
+        after['identifications'][stat]['max'] += 1
+        if rng.random() < 0.3:
+            after['requirements']['level'] += 1
+        after['icon']['value']['customModelData'] += 1
+        pairs.append((before, after))
+    return pairs
+
+
+def measure(pairs, full_documents):
+    os.environ[FULL_DOCUMENTS_ENV] = '1' if full_documents else '0'
+    events = [modify_event(before, after, IGNORED_ITEM_PATHS) for before, after in pairs]
+    encoded = [json.dumps(event) for event in events]
+    start = time.perf_counter()
+    for body in encoded:
+        json.loads(body)
+    return sum(len(body) for body in encoded), time.perf_counter() - start
+
+
+def main(args):
+    pairs = make_modifications(args.items)
+    print(f"{args.items} modify events")
+    print(f"{'format':>15} {'MiB':>8} {'decode s':>9}")
+    for name, full_documents in (('full documents', True), ('deltas', False)):
+        size, seconds = measure(pairs, full_documents)
+        print(f"{name:>15} {size / 1024 / 1024:>8.2f} {seconds:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20000)
+    main(parser.parse_args())
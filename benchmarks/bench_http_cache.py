@@ -0,0 +1,51 @@
+"""Response cache hit/miss and bytes-saved numbers against a local mock API that serves 304s.
+
+Run from the repository root:
+    python -m benchmarks.bench_http_cache --players 2000 --changed 0.1
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.mock_api import MockWynncraftAPI
+from http_cache import ResponseCache
+
+
+async def fetch_all(session, cache, urls):
+    responses = await asyncio.gather(*(cache.get_async(session, url) for url in urls))
+    return sum(1 for response in responses if not response.unchanged)
+
+
+async def main(args):
+    api = MockWynncraftAPI(args.players)
+    base_url = await api.start()
+    urls = [f"{base_url}/v3/player/{uuid}" for uuid in api.player_uuids]
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            connector = aiohttp.TCPConnector(limit=args.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                print(f"{'run':>6} {'seconds':>8} {'changed':>8} {'hits':>6} {'304s':>6} {'bytes saved':>12}")
+                for run in ('cold', 'warm'):
+                    cache = ResponseCache(cache_dir)
+                    start = time.perf_counter()
+                    changed = await fetch_all(session, cache, urls)
+                    elapsed = time.perf_counter() - start
+                    print(f"{run:>6} {elapsed:>8.2f} {changed:>8} {cache.hits:>6} "
+                          f"{cache.not_modified:>6} {cache.bytes_saved:>12}")
+                    # Between runs, a share of the players changes upstream
+                    api.changed_uuids = set(random.sample(api.player_uuids, int(len(urls) * args.changed)))
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--changed', type=float, default=0.1, help="Share of players changed between runs.")
+    parser.add_argument('--concurrency', type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
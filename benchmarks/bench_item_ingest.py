@@ -0,0 +1,116 @@
+"""Time, peak memory and snapshot size of item-detection's ingest modes on a synthetic item database.
+
+Compares the legacy previous_item_data.json format with the hash-indexed snapshot, fed either a
+fully loaded API body or a streamed one.
+
+Run from the repository root:
+    python -m benchmarks.bench_item_ingest --items 20000
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.mock_api import make_item
+from item_snapshot import migrate_from_json
+from item_stream import iter_file_chunks, iter_items
+
+item_detection = importlib.import_module('item-detection')
+
+
+def write_fixture(directory, item_count, seed=1):
+    """Write a previous snapshot and a current API body that differ by a few percent."""
+    rng = random.Random(seed)
+    previous = {f"Item {i}": make_item(i, rng) for i in range(item_count)}
+    current = [dict(item) for name, item in previous.items() if rng.random() > 0.01]
+    for item in rng.sample(current, item_count // 50):
+        item['lore'] = 'Modified lore.'
+    current.extend(make_item(item_count + i, rng) for i in range(item_count // 100))
+
+    previous_path = os.path.join(directory, 'previous_item_data.json')
+    current_path = os.path.join(directory, 'current.json')
+    with open(previous_path, 'w') as file:
+        json.dump(previous, file, indent=4)
+    with open(current_path, 'w') as file:
+        json.dump(current, file)
+    return previous_path, current_path
+
+
+def load_current(current_path):
+    with open(current_path) as file:
+        data = json.load(file)
+    return {item['internalName']: item for item in data if 'internalName' in item}
+
+
+def run_legacy(current_path, legacy_path):
+    """The pre-snapshot flow: load the indent=4 file, deep-compare every item, rewrite the file."""
+    current_data = load_current(current_path)
+    with open(legacy_path) as file:
+        previous_data = json.load(file)
+    changes = item_detection.compare_items(previous_data, current_data, 0)
+    with open(legacy_path, 'w') as file:
+        json.dump(current_data, file, indent=4)
+    return changes
+
+
+def run_snapshot(current_path, legacy_path):
+    current_data = load_current(current_path)
+    changes, writer = item_detection.compare_with_snapshot(current_data.items(), 0)
+    writer.commit()
+    return changes
+
+
+def run_snapshot_streaming(current_path, legacy_path):
+    changes, writer = item_detection.compare_with_snapshot(iter_items(iter_file_chunks(current_path)), 0)
+    writer.commit()
+    return changes
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def measure(run, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        previous_path, current_path = write_fixture(directory, args.items)
+        pristine_path = previous_path + '.orig'
+        shutil.copy(previous_path, pristine_path)
+        snapshot_dir = os.path.join(directory, 'item_snapshot')
+        pristine_snapshot = snapshot_dir + '.orig'
+        migrate_from_json(previous_path, pristine_snapshot)
+        item_detection.SNAPSHOT_DIR = snapshot_dir
+        print(f"{args.items} items")
+
+        print(f"{'mode':>19} {'changes':>8} {'seconds':>8} {'peak MiB':>9} {'on disk MiB':>12}")
+        for name, run, stored in (('json (legacy)', run_legacy, previous_path),
+                                  ('snapshot', run_snapshot, snapshot_dir),
+                                  ('snapshot streaming', run_snapshot_streaming, snapshot_dir)):
+            shutil.copy(pristine_path, previous_path)
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            shutil.copytree(pristine_snapshot, snapshot_dir)
+            changes, elapsed, peak = measure(run, current_path, previous_path)
+            size = directory_size(stored) / 1024 / 1024
+            print(f"{name:>19} {len(changes):>8} {elapsed:>8.2f} {peak:>9.1f} {size:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20000)
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+"""Documents written and wall time of sync_items' incremental and rebuild modes against delete-all + insert.
+
+Each mode syncs the same day-over-day change (a few percent of items added, modified or removed)
+into a scratch database (default wynnpool_bench, dropped afterwards) on the MongoDB at
+MONGODB_URI. Run from the repository root:
+    python -m benchmarks.bench_item_sync --items 20000
+"""
+import argparse
+import random
+import time
+
+import sync_items
+from benchmarks.mock_api import make_item
+from mongo_client import get_client, use_client
+
+
+def make_days(item_count, seed=1):
+    """The item database on two consecutive days, keyed by internalName."""
+    rng = random.Random(seed)
+    previous = {f"Item {i}": make_item(i, rng) for i in range(item_count)}
+    current = {name: dict(item) for name, item in previous.items() if rng.random() > 0.01}
+    for name in rng.sample(sorted(current), item_count // 50):
+        current[name]['lore'] = 'Modified lore.'
+    for i in range(item_count // 100):
+        item = make_item(item_count + i, rng)
+        current[item['internalName']] = item
+    return previous, current
+
+
+def delete_and_insert(item_docs):
+    """The previous behaviour of sync_items."""
+    sync_items.items_collection().delete_many({})
+    sync_items.items_collection().insert_many(item_docs, ordered=False)
+    return [doc['id'] for doc in item_docs]
+
+
+def main(args):
+    client = get_client()
+    use_client(client, args.database)
+
+    previous, current = make_days(args.items)
+    print(f"{args.items} items")
+    print(f"{'mode':>18} {'writes':>8} {'seconds':>8}")
+    for name, apply in (('delete + insert', delete_and_insert),
+                        ('incremental', sync_items.apply_incremental),
+                        ('rebuild (staging)', sync_items.apply_rebuild)):
+        client.drop_database(args.database)
+        sync_items.ensure_indexes()
+        sync_items.apply_incremental(sync_items.build_item_docs(previous))
+
+        item_docs = sync_items.build_item_docs(current)
+        start = time.perf_counter()
+        writes = len(apply(item_docs))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18} {writes:>8} {elapsed:>8.2f}")
+
+    client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--database', default='wynnpool_bench')
+    main(parser.parse_args())
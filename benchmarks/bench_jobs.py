@@ -0,0 +1,326 @@
+"""Throughput and peak memory of every job against the local mock API and a seeded MongoDB.
+
+Each scenario starts from the same synthetic world. MongoDB holds what the job stored for
+day 0; the mock API then serves day 1, where about --churn of the guild members, items and
+aspects changed; the job is timed bringing the database up to date. Nothing talks to
+api.wynncraft.com, sessionserver.mojang.com or a production MongoDB: the database is a
+scratch one (default wynnpool_bench, dropped afterwards) on --mongo, a local mongod by
+default, or mongomock with --mongo memory. Run from the repository root:
+    python -m benchmarks.bench_jobs --players 20000 --guilds 1000 --items 10000 --concurrency 16
+    python -m benchmarks.bench_jobs --scenarios guild,player --latency-ms 50 --throttle 0.01 --json results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import guild
+import name_resolver
+import player
+import sync_items
+import update_last_seen
+from benchmarks.mock_api import ASPECT_CLASSES, MockApiProcess, MockWorld
+from benchmarks.mongo_fixture import BENCH_DATABASE, MEMORY, connect, item_detection, seed_guild_data
+from http_client import ITEM_DATABASE_TIMEOUT, wynncraft_client
+from mongo_client import use_client
+from run_metrics import finish_run, start_run
+from tasks.aspects import sync_aspects
+
+# The mock sends its own rate-limit headers; start the buckets wide open and let those rule
+REQUEST_RATE = 100000
+
+# What mongomock cannot run, so --mongo memory skips it instead of timing a job that failed
+MEMORY_UNSUPPORTED = {
+    'sync_items': "item changelogs are merged with $merge",
+    'sync_aspects': "aspect changes are written in a session",
+}
+MEMORY_UNSUPPORTED_LAST_SEEN_MODES = {
+    'streaming': "the streaming pipeline uses $type",
+}
+
+
+class Scenario:
+    """Setup for one job on day 0 of a fresh world, then its timed run on day 1."""
+
+    def __init__(self, args, server, db, scratch_dir):
+        self.args = args
+        self.server = server
+        self.db = db
+        self.scratch_dir = scratch_dir
+        self.world = MockWorld(**world_config(args))
+
+    def next_day(self):
+        """Advance the server's world and the local copy in step."""
+        self.server.advance(self.args.churn)
+        self.world.advance(self.args.churn)
+
+    def client(self, timeout=60):
+        return wynncraft_client(self.args.concurrency, REQUEST_RATE, timeout)
+
+
+class GuildScenario(Scenario):
+    unit = 'guilds'
+
+    def setup(self):
+        guild.GUILD_LIST_URL = self.server.base_url + '/v3/guild/list/guild'
+        guild.GUILD_DATA_URL_TEMPLATE = self.server.base_url + '/v3/guild/{guild_name}?identifier=uuid'
+        seed_guild_data(self.db, self.world)
+        self.next_day()
+
+    def run(self):
+        api = self.client()
+        guild_list = guild.fetch_guild_list(api)
+        guild.process_all_guilds(guild_list, self.args.concurrency, self.args.batch_size, api=api)
+        return len(guild_list)
+
+
+class PlayerScenario(Scenario):
+    unit = 'players'
+
+    def setup(self):
+        player.PLAYER_LIST_URL = self.server.base_url + '/v3/player?identifier=uuid'
+        player.PLAYER_DATA_URL_TEMPLATE = self.server.base_url + '/v3/player/{uuid}?fullResult'
+        self.next_day()
+
+    def run(self):
+        player.process_all_players(self.args.concurrency, api=self.client())
+        return len(self.world.online)
+
+
+class LastSeenScenario(Scenario):
+    unit = 'guilds'
+
+    def setup(self):
+        update_last_seen.PLAYER_API_URL = self.server.base_url + '/v3/player?identifier=uuid'
+        seed_guild_data(self.db, self.world)
+        update_last_seen.main(self.args.last_seen_mode)
+        self.next_day()
+
+    def run(self):
+        update_last_seen.main(self.args.last_seen_mode)
+        return self.world.guild_count
+
+
+class ItemDetectionScenario(Scenario):
+    unit = 'items'
+
+    def setup(self):
+        item_detection.API_URL = self.server.base_url + '/v3/item/database?fullResult'
+        item_detection.SNAPSHOT_DIR = os.path.join(self.scratch_dir, 'item_snapshot')
+        item_detection.LEGACY_DATA_FILE = os.path.join(self.scratch_dir, 'previous_item_data.json')
+        shutil.rmtree(item_detection.SNAPSHOT_DIR, ignore_errors=True)
+        self.detect_changes()
+        self.db[item_detection.COLLECTION_ITEM_CHANGELOG].drop()
+        self.next_day()
+
+    def run(self):
+        self.detect_changes()
+        return len(self.world.items)
+
+    def detect_changes(self):
+        # Keeps its CHANGES_FOUND marker for the workflow out of the results table
+        with contextlib.redirect_stdout(io.StringIO()):
+            item_detection.main(self.args.item_stream)
+
+
+class SyncItemsScenario(Scenario):
+    unit = 'items'
+
+    def setup(self):
+        sync_items.API_URL = self.server.base_url + '/v3/item/database?fullResult'
+        sync_items.sync_items(api=self.client(ITEM_DATABASE_TIMEOUT))
+        self.next_day()
+
+    def run(self):
+        sync_items.sync_items(api=self.client(ITEM_DATABASE_TIMEOUT))
+        return len(self.world.items)
+
+
+class SyncAspectsScenario(Scenario):
+    unit = 'aspects'
+
+    def setup(self):
+        sync_aspects.ASPECT_URL_TEMPLATE = self.server.base_url + '/v3/aspects/{}'
+        sync_aspects.sync_aspects(list(ASPECT_CLASSES))
+        self.next_day()
+
+    def run(self):
+        sync_aspects.sync_aspects(list(ASPECT_CLASSES))
+        return sum(len(aspects) for aspects in self.world.aspects.values())
+
+
+class NamesScenario(Scenario):
+    unit = 'names'
+
+    def setup(self):
+        name_resolver.MOJANG_PROFILE_URL_TEMPLATE = self.server.base_url + '/session/minecraft/profile/{uuid}'
+        name_resolver.INITIAL_REQUEST_RATE = name_resolver.MAX_REQUEST_RATE = self.args.mojang_rate
+        self.uuids = self.world.player_uuids[:self.args.names]
+
+    def run(self):
+        resolver = name_resolver.NameResolver(self.db, self.args.concurrency)
+        resolver.resolve(self.uuids)
+        return len(self.uuids)
+
+
+SCENARIOS = {
+    'guild': GuildScenario,
+    'player': PlayerScenario,
+    'last_seen': LastSeenScenario,
+    'item_detection': ItemDetectionScenario,
+    'sync_items': SyncItemsScenario,
+    'sync_aspects': SyncAspectsScenario,
+    'names': NamesScenario,
+}
+
+
+def world_config(args):
+    return {
+        'player_count': args.players, 'guild_count': args.guilds, 'item_count': args.items,
+        'aspects_per_class': args.aspects_per_class, 'online': args.online, 'padding': args.padding,
+        'seed': args.seed,
+    }
+
+
+def measure(run, memory=True):
+    """Seconds and peak traced MiB (None without `memory`) of run(), and what it returned."""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def unsupported_reason(name, args):
+    """Why scenario `name` cannot run against the configured store, or None when it can."""
+    if args.mongo != MEMORY:
+        return None
+    if name == 'last_seen':
+        return MEMORY_UNSUPPORTED_LAST_SEEN_MODES.get(args.last_seen_mode)
+    return MEMORY_UNSUPPORTED.get(name)
+
+
+def run_scenario(name, args, server, client, db, scratch_dir):
+    client.drop_database(args.database)
+    server.reset()
+    scenario = SCENARIOS[name](args, server, db, scratch_dir)
+    scenario.setup()
+
+    before = server.stats()
+    start_run(f"bench_{name}")
+    try:
+        elapsed, peak, units = measure(scenario.run, args.memory)
+    except Exception as e:
+        finish_run(status='failed', error=f"{type(e).__name__}: {e}")
+        raise
+    summary = finish_run()
+    if summary['status'] != 'ok':
+        # The job logged its error and carried on; its timing measures nothing
+        raise RuntimeError(f"the job failed: {summary.get('error')}")
+    after = server.stats()
+    return {
+        'scenario': name,
+        'unit': scenario.unit,
+        'units': units,
+        'seconds': round(elapsed, 3),
+        'perSecond': round(units / elapsed, 1) if elapsed > 0 else None,
+        'peakMiB': round(peak, 1) if peak is not None else None,
+        'requests': after['requests'] - before['requests'],
+        'throttled': after['throttled'] - before['throttled'],
+        'MiBServed': round((after['bytesSent'] - before['bytesSent']) / 1024 / 1024, 1),
+        'mongoCommands': sum(stats['count'] for stats in summary['mongo'].values()),
+        'phases': summary['phases'],
+    }
+
+
+def main(args):
+    server_config = dict(world_config(args), latency=args.latency_ms / 1000, rate_limit=args.rate_limit,
+                         rate_window=args.rate_window, throttle=args.throttle, retry_after=args.retry_after)
+    client = connect(args.mongo)
+    db = client[args.database]
+    use_client(client, args.database)
+
+    results = []
+    print(f"{'scenario':>15} {'units':>8} {'seconds':>8} {'units/s':>9} {'peak MiB':>9} {'requests':>9} "
+          f"{'429s':>6} {'MiB in':>7} {'mongo ops':>10}")
+    with MockApiProcess(**server_config) as server, tempfile.TemporaryDirectory() as scratch_dir:
+        try:
+            for name in args.scenarios:
+                reason = unsupported_reason(name, args)
+                if reason:
+                    print(f"{name:>15} skipped: not supported by --mongo {MEMORY} ({reason})")
+                    continue
+                for _ in range(args.repeat):
+                    try:
+                        result = run_scenario(name, args, server, client, db, scratch_dir)
+                    except Exception as e:
+                        print(f"{name:>15} failed: {type(e).__name__}: {e}")
+                        break
+                    results.append(result)
+                    peak = f"{result['peakMiB']:>9.1f}" if result['peakMiB'] is not None else f"{'-':>9}"
+                    print(f"{name:>15} {result['units']:>8} {result['seconds']:>8.2f} {result['perSecond']:>9.1f} "
+                          f"{peak} {result['requests']:>9} {result['throttled']:>6} {result['MiBServed']:>7.1f} "
+                          f"{result['mongoCommands']:>10}")
+        finally:
+            client.drop_database(args.database)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'config': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    def scenario_list(value):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(names) - SCENARIOS.keys()
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        return names
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=scenario_list, default=list(SCENARIOS),
+                        help=f"Comma-separated scenarios to run (default: all of {', '.join(SCENARIOS)}).")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs of each scenario, each from a fresh world.")
+    parser.add_argument('--mongo', help="'memory' for mongomock, or a MongoDB URI (default: $MONGODB_URI or localhost).")
+    parser.add_argument('--database', default=BENCH_DATABASE)
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--memory', action=argparse.BooleanOptionalAction, default=True,
+                        help="Trace peak memory with tracemalloc, which slows allocation-heavy jobs down.")
+
+    world = parser.add_argument_group('synthetic world')
+    world.add_argument('--players', type=int, default=5000)
+    world.add_argument('--guilds', type=int, default=250)
+    world.add_argument('--items', type=int, default=5000)
+    world.add_argument('--aspects-per-class', type=int, default=40)
+    world.add_argument('--online', type=float, default=0.2, help="Share of players in the online player list.")
+    world.add_argument('--padding', type=int, default=0, help="Filler bytes added to player and guild payloads.")
+    world.add_argument('--churn', type=float, default=0.05, help="Share of members, items and aspects changed per day.")
+    world.add_argument('--seed', type=int, default=0)
+
+    api = parser.add_argument_group('mock API')
+    api.add_argument('--latency-ms', type=float, default=0)
+    api.add_argument('--rate-limit', type=int, default=100000, help="Requests per rate-limit window.")
+    api.add_argument('--rate-window', type=float, default=1, help="Rate-limit window in seconds.")
+    api.add_argument('--throttle', type=float, default=0.0, help="Share of requests answered with a 429.")
+    api.add_argument('--retry-after', type=float, default=1, help="Retry-After seconds of the injected 429s.")
+
+    jobs = parser.add_argument_group('jobs')
+    jobs.add_argument('--concurrency', type=int, default=16)
+    jobs.add_argument('--batch-size', type=int, default=guild.DEFAULT_BATCH_SIZE)
+    jobs.add_argument('--last-seen-mode', choices=['full', 'incremental', 'streaming'], default='streaming')
+    jobs.add_argument('--item-stream', action='store_true', help="Run item-detection with --stream.")
+    jobs.add_argument('--names', type=int, default=2000, help="UUIDs resolved by the names scenario.")
+    jobs.add_argument('--mojang-rate', type=float, default=REQUEST_RATE,
+                      help="Request rate of the names scenario's Mojang client.")
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""Runtime and peak memory of update_last_seen's full, streaming and incremental modes on synthetic guilds.
+
+Seeds a scratch database (default wynnpool_bench, dropped afterwards) on the MongoDB at
+MONGODB_URI, then runs each mode at several guild counts. Run from the repository root:
+    python -m benchmarks.bench_last_seen --guilds 1000,10000 --members-per-guild 50 --online 0.02
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from pymongo import InsertOne
+
+import update_last_seen
+from benchmarks.mock_api import make_player_uuids
+from mongo_client import get_client, get_db, use_client
+
+
+def seed_guilds(db, guild_count, members_per_guild):
+    """Insert synthetic guild_data documents and return every member UUID."""
+    player_uuids = make_player_uuids(guild_count * members_per_guild)
+    operations = []
+    for guild_index in range(guild_count):
+        members = player_uuids[guild_index * members_per_guild:(guild_index + 1) * members_per_guild]
+        operations.append(InsertOne({
+            'uuid': f"guild-{guild_index}",
+            'name': f"Guild {guild_index}",
+            'contentHash': f"hash-{guild_index}",
+            'members': {
+                'total': len(members),
+                'recruit': {uuid: {'username': f"player{uuid[-6:]}", 'online': False} for uuid in members},
+            },
+        }))
+        if len(operations) >= 1000:
+            db['guild_data'].bulk_write(operations)
+            operations = []
+    if operations:
+        db['guild_data'].bulk_write(operations)
+    return player_uuids
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def main(args):
+    client = get_client()
+    use_client(client, args.database)
+    bench_db = get_db()
+
+    print(f"{'guilds':>7} {'members':>8} {'mode':>22} {'seconds':>8} {'peak MiB':>9}")
+    for guild_count in args.guilds:
+        client.drop_database(args.database)
+        player_uuids = seed_guilds(bench_db, guild_count, args.members_per_guild)
+        online = set(random.sample(player_uuids, int(len(player_uuids) * args.online)))
+
+        async def fetch_player_list(api):
+            return online
+        update_last_seen.fetch_player_list = fetch_player_list
+
+        runs = [
+            ('full', lambda: asyncio.run(update_last_seen.update_last_seen_and_online_count(
+                list(bench_db['guild_data'].find())))),
+            ('streaming', update_last_seen.update_last_seen_streaming),
+            ('incremental (build)', update_last_seen.update_last_seen_incremental),
+            ('incremental (steady)', update_last_seen.update_last_seen_incremental),
+        ]
+        for name, run in runs:
+            elapsed, peak = measure(run)
+            print(f"{guild_count:>7} {len(player_uuids):>8} {name:>22} {elapsed:>8.2f} {peak:>9.1f}")
+
+    client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=lambda s: [int(x) for x in s.split(',')], default=[1000, 10000])
+    parser.add_argument('--members-per-guild', type=int, default=50)
+    parser.add_argument('--online', type=float, default=0.02, help="Share of members online.")
+    parser.add_argument('--database', default='wynnpool_bench')
+    main(parser.parse_args())
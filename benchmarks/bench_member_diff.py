@@ -0,0 +1,85 @@
+"""Guilds-per-second of member diffing (guild.detect_member_changes) by guild size and churn.
+
+Builds synthetic before/after guild snapshots with some joins, leaves and rank changes and
+times detect_member_changes over them. Only guilds whose content hash changed reach the
+diff, so churn 0 is the floor rather than the common case. Run from the repository root:
+    python -m benchmarks.bench_member_diff --guilds 2000 --members 10,50,150 --churn 0.01,0.05
+"""
+import argparse
+import copy
+import gc
+import random
+import time
+
+import guild
+from benchmarks.mock_api import make_player_uuids
+
+RANKS = ('owner', 'chief', 'strategist', 'captain', 'recruiter', 'recruit')
+
+
+def make_guild(index, member_uuids, rng):
+    members = {rank: {} for rank in RANKS}
+    for uuid in member_uuids:
+        members[rng.choice(RANKS)][uuid] = {
+            'username': f"player{uuid[-6:]}", 'online': False, 'server': None, 'contributed': 0,
+            'joined': '2024-01-01T00:00:00.000Z',
+        }
+    members['total'] = len(member_uuids)
+    return {'uuid': f"guild-{index}", 'name': f"Guild {index}", 'members': members}
+
+
+def churn(guild_data, spare_uuids, rate, rng):
+    """A later snapshot of `guild_data` where about `rate` of the members left, joined or changed rank."""
+    after = copy.deepcopy(guild_data)
+    ranks = {rank: members for rank, members in after['members'].items() if rank != 'total'}
+    for rank, members in ranks.items():
+        for uuid in list(members):
+            roll = rng.random()
+            if roll < rate / 3:
+                del members[uuid]
+            elif roll < rate * 2 / 3:
+                ranks[rng.choice(RANKS)][uuid] = members.pop(uuid)
+            elif roll < rate and spare_uuids:
+                ranks[rng.choice(RANKS)][spare_uuids.pop()] = {
+                    'username': 'newcomer', 'online': True, 'server': 'WC1', 'contributed': 0,
+                    'joined': '2025-01-01T00:00:00.000Z',
+                }
+    return after
+
+
+def run(detect, pairs, repeat=3):
+    """Best guilds/s over `repeat` passes, and the events of the last one."""
+    best = 0.0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        events = [detect(old, new, 1) for old, new in pairs]
+        best = max(best, len(pairs) / (time.perf_counter() - start))
+    return best, events
+
+
+def main(args):
+    rng = random.Random(0)
+    print(f"{'members':>8} {'churn':>6} {'guilds/s':>10} {'events':>8}")
+    for member_count in args.members:
+        uuids = make_player_uuids(args.guilds * member_count * 2)
+        for rate in args.churn:
+            pairs = []
+            for index in range(args.guilds):
+                start = index * member_count * 2
+                before = make_guild(index, uuids[start:start + member_count], rng)
+                spare = uuids[start + member_count:start + member_count * 2]
+                pairs.append((before, churn(before, spare, rate, rng)))
+
+            guilds_per_second, events = run(guild.detect_member_changes, pairs)
+            print(f"{member_count:>8} {rate:>6.2f} {guilds_per_second:>10.0f} {sum(map(len, events)):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=2000)
+    parser.add_argument('--members', type=lambda s: [int(x) for x in s.split(',')], default=[10, 50, 150])
+    parser.add_argument('--churn', type=lambda s: [float(x) for x in s.split(',')], default=[0.01, 0.05],
+                        help="Comma-separated fractions of members that change per snapshot.")
+    args = parser.parse_args()
+    main(args)
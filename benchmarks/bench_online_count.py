@@ -0,0 +1,67 @@
+"""Write cost, read cost and storage size of the guild_online_count storage layouts.
+
+Simulates `--days` of five-minute runs for `--guilds` guilds in a scratch database (default
+wynnpool_bench, dropped afterwards) on the MongoDB at MONGODB_URI. Run from the repository root:
+    python -m benchmarks.bench_online_count --guilds 2000 --days 3
+"""
+import argparse
+import os
+import random
+import time
+
+from pymongo import MongoClient
+
+from online_count_store import ONLINE_COUNT_STORES, get_online_count_store
+
+RUN_INTERVAL = 5 * 60
+
+
+def collection_size(db, name):
+    """Storage plus index size in MiB, as reported by collStats."""
+    stats = db.command('collStats', name)
+    return (stats.get('storageSize', 0) + stats.get('totalIndexSize', 0)) / 1024 / 1024
+
+
+def main(args):
+    client = MongoClient(os.getenv('MONGODB_URI'))
+    client.drop_database(args.database)
+    db = client[args.database]
+
+    guild_uuids = [f"guild-{i}" for i in range(args.guilds)]
+    start = int(time.time()) - args.days * 24 * 60 * 60
+    run_times = list(range(start, start + args.days * 24 * 60 * 60, RUN_INTERVAL))
+    read_guilds = random.sample(guild_uuids, min(args.reads, len(guild_uuids)))
+
+    print(f"{'backend':>11} {'write s':>8} {'ms/run':>7} {'read ms':>8} {'MiB':>8}")
+    for backend in ONLINE_COUNT_STORES:
+        store = get_online_count_store(db, backend)
+        store.setup_indexes()
+
+        write_start = time.perf_counter()
+        for run_time in run_times:
+            # Roughly a third of guilds have someone online in a given run
+            store.insert([
+                {'guild_name': guild_uuid, 'guild_uuid': guild_uuid, 'timestamp': run_time, 'count': random.randint(1, 20)}
+                for guild_uuid in guild_uuids if random.random() < 0.33
+            ])
+        write_seconds = time.perf_counter() - write_start
+
+        read_start = time.perf_counter()
+        for guild_uuid in read_guilds:
+            store.read_series(guild_uuid, start, start + 24 * 60 * 60)
+        read_ms = (time.perf_counter() - read_start) / len(read_guilds) * 1000
+
+        size = collection_size(db, store.collection.name)
+        print(f"{backend:>11} {write_seconds:>8.2f} {write_seconds / len(run_times) * 1000:>7.1f} "
+              f"{read_ms:>8.2f} {size:>8.1f}")
+
+    client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--reads', type=int, default=200, help="Guild series read back per backend.")
+    parser.add_argument('--database', default='wynnpool_bench')
+    main(parser.parse_args())
@@ -0,0 +1,47 @@
+"""Players-per-second of the async player crawl against a local mock API.
+
+Run from the repository root:
+    python -m benchmarks.bench_player_crawl --players 2000 --latency-ms 50 --levels 1,4,16,64
+"""
+import argparse
+import asyncio
+import time
+
+import player
+from benchmarks.mock_api import MockWynncraftAPI
+from http_client import wynncraft_client
+
+# The mock advertises a generous limit, start the bucket wide open too
+REQUEST_RATE = 100000
+
+
+async def run_level(api, concurrency):
+    api.request_count = 0
+    start = time.perf_counter()
+    await player.crawl_players_async(api.player_uuids, wynncraft_client(concurrency, REQUEST_RATE), {})
+    elapsed = time.perf_counter() - start
+    return len(api.player_uuids) / elapsed, elapsed
+
+
+async def main(args):
+    api = MockWynncraftAPI(args.players, latency=args.latency_ms / 1000, rate_window=1)
+    base_url = await api.start()
+    player.PLAYER_DATA_URL_TEMPLATE = base_url + '/v3/player/{uuid}'
+
+    try:
+        print(f"{'concurrency':>11} {'seconds':>9} {'players/s':>10}")
+        for level in args.levels:
+            rate, elapsed = await run_level(api, level)
+            print(f"{level:>11} {elapsed:>9.2f} {rate:>10.1f}")
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--levels', type=lambda s: [int(x) for x in s.split(',')], default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
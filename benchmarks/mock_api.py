@@ -0,0 +1,486 @@
+"""Local stand-ins for the Wynncraft and Mojang APIs, serving a synthetic, deterministic world.
+
+MockWorld holds the players, guilds, items and aspects; MockWynncraftAPI serves it over HTTP
+with configurable latency, rate limiting and injected 429s; MockApiProcess runs that server
+in a child process, so it neither competes with the benchmarked job for the GIL nor shows up
+in its memory numbers. The process can also be started on its own:
+    python -m benchmarks.mock_api --players 10000 --guilds 500 --items 5000 --port 8080
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import uuid as uuid_lib
+
+import requests
+from aiohttp import web
+
+RANKS = ('owner', 'chief', 'strategist', 'captain', 'recruiter', 'recruit')
+ASPECT_CLASSES = ('mage', 'archer', 'shaman', 'warrior', 'assassin')
+ITEM_STATS = ['rawStrength', 'rawDexterity', 'rawIntelligence', 'rawDefence', 'rawAgility', 'healthRegen',
+              'manaRegen', 'lifeSteal', 'manaSteal', 'walkSpeed', 'spellDamage', 'mainAttackDamage',
+              'thorns', 'reflection', 'exploding']
+
+# Guild UUIDs are offset so they never collide with player UUIDs
+GUILD_UUID_OFFSET = 10**9
+# Admin routes a benchmark drives the server with; they are not counted or rate limited
+ADMIN_PREFIX = '/_bench/'
+
+
+def make_player_uuids(count):
+    """Deterministic player UUIDs so repeated benchmark runs hit the same data."""
+    return [str(uuid_lib.UUID(int=i + 1)) for i in range(count)]
+
+
+def make_guild_uuid(index):
+    return str(uuid_lib.UUID(int=GUILD_UUID_OFFSET + index))
+
+
+def make_player(uuid, guild_count=50):
+    """A trimmed-down player payload carrying the fields the crawler reads."""
+    guild_index = int(uuid.replace('-', ''), 16) % guild_count
+    return {
+        'uuid': uuid,
+        'username': f"player{uuid[-6:]}",
+        'online': False,
+        'guild': {
+            'uuid': make_guild_uuid(guild_index),
+            'name': f"Guild {guild_index}",
+            'prefix': f"G{guild_index}",
+            'rank': 'RECRUIT',
+        },
+    }
+
+
+def make_item(index, rng):
+    """An item shaped like an entry of item/database?fullResult."""
+    return {
+        'internalName': f"Item {index}",
+        'type': 'weapon',
+        'weaponType': rng.choice(['spear', 'bow', 'wand', 'dagger', 'relik']),
+        'rarity': rng.choice(['common', 'rare', 'legendary', 'mythic']),
+        'icon': {'format': 'attribute', 'value': {'id': f"minecraft:item_{index % 50}", 'customModelData': index}},
+        'requirements': {'level': rng.randint(1, 105), 'classRequirement': 'mage'},
+        'base': {'baseDamage': {'min': rng.randint(1, 100), 'max': rng.randint(100, 300), 'raw': 150}},
+        'identifications': {
+            stat: {'min': rng.randint(-50, 0), 'max': rng.randint(1, 50), 'raw': rng.randint(-50, 50)}
+            for stat in rng.sample(ITEM_STATS, 8)
+        },
+        'lore': f"A synthetic item used for benchmarking, number {index}.",
+    }
+
+
+def make_aspect(aspect_class, index, rng):
+    """An aspect shaped like an entry of aspects/{class}."""
+    return {
+        'internalName': f"{aspect_class.title()} Aspect {index}",
+        'name': f"Aspect of the {aspect_class.title()} {index}",
+        'requiredClass': aspect_class,
+        'rarity': rng.choice(['legendary', 'fabled', 'mythic']),
+        'icon': {'format': 'legacy', 'value': {'id': 'minecraft:paper', 'customModelData': index}},
+        'tiers': {
+            str(tier): {'threshold': tier * 5, 'description': [f"+{rng.randint(1, 30)}% effect {index}"]}
+            for tier in range(1, 4)
+        },
+    }
+
+
+class MockWorld:
+    """Players, guilds, items and aspects as they stand on one simulated day.
+
+    Everything derives from `seed`, so two worlds built with the same arguments hold the same
+    data: a benchmark seeds MongoDB from its own copy while the server answers from another.
+    Player i belongs to guild (i + 1) % guild_count, like make_player. `advance` moves to the
+    next day, with about `churn` of the guild members leaving, rejoining or changing rank, and
+    of the items and aspects changing.
+    """
+
+    def __init__(self, player_count, guild_count=50, item_count=0, aspects_per_class=0, online=1.0, padding=0,
+                 seed=0):
+        self.player_uuids = make_player_uuids(player_count)
+        self.guild_count = guild_count
+        self.online_fraction = online
+        self.padding = 'x' * padding
+        self.seed = seed
+        self.day = 0
+        rng = random.Random(seed)
+
+        self.guild_members = [[] for _ in range(guild_count)]
+        self.ranks = {}
+        for uuid in self.player_uuids:
+            members = self.guild_members[int(uuid.replace('-', ''), 16) % guild_count]
+            self.ranks[uuid] = 'owner' if not members else rng.choice(RANKS[1:])
+            members.append(uuid)
+        self.left = set()
+        self.guild_names = {f"Guild {index}": index for index in range(guild_count)}
+        self.guild_uuids = {make_guild_uuid(index): index for index in range(guild_count)}
+
+        self.items = {f"Item {index}": make_item(index, rng) for index in range(item_count)}
+        self.next_item = item_count
+        self.aspects = {
+            aspect_class: [make_aspect(aspect_class, index, rng) for index in range(aspects_per_class)]
+            for aspect_class in ASPECT_CLASSES
+        }
+        self.online = self._pick_online(rng)
+
+    def _pick_online(self, rng):
+        if self.online_fraction >= 1:
+            return set(self.player_uuids)
+        return set(rng.sample(self.player_uuids, int(len(self.player_uuids) * self.online_fraction)))
+
+    def advance(self, churn=0.05):
+        """Move to the next day."""
+        self.day += 1
+        rng = random.Random(self.seed * 1000003 + self.day)
+        for members in self.guild_members:
+            for uuid in members[1:]:  # Owners stay put
+                roll = rng.random()
+                if uuid in self.left:
+                    if roll < 0.5:
+                        self.left.discard(uuid)
+                elif roll < churn / 2:
+                    self.left.add(uuid)
+                elif roll < churn:
+                    self.ranks[uuid] = rng.choice(RANKS[1:])
+
+        for name in rng.sample(sorted(self.items), int(len(self.items) * churn / 3)):
+            del self.items[name]
+        for name in rng.sample(sorted(self.items), int(len(self.items) * churn / 3)):
+            self.items[name] = dict(self.items[name], lore=f"Modified on day {self.day}.")
+        for _ in range(int(len(self.items) * churn / 3)):
+            item = make_item(self.next_item, rng)
+            self.items[item['internalName']] = item
+            self.next_item += 1
+
+        for aspects in self.aspects.values():
+            for index in rng.sample(range(len(aspects)), int(len(aspects) * churn)):
+                aspects[index] = dict(aspects[index], name=f"{aspects[index]['name']} ({self.day})")
+        self.online = self._pick_online(rng)
+
+    def player_list(self):
+        players = {uuid: {'server': 'WC1'} for uuid in self.player_uuids if uuid in self.online}
+        return {'total': len(players), 'players': players}
+
+    def player(self, uuid):
+        if uuid not in self.ranks:
+            return None
+        payload = make_player(uuid, self.guild_count)
+        payload['online'] = uuid in self.online
+        if uuid in self.left:
+            payload['guild'] = None
+        else:
+            payload['guild']['rank'] = self.ranks[uuid].upper()
+        if self.padding:
+            payload['padding'] = self.padding
+        return payload
+
+    def guild_list(self):
+        return {name: {'uuid': make_guild_uuid(index), 'prefix': f"G{index}"} for name, index in self.guild_names.items()}
+
+    def guild(self, identifier):
+        """A guild by name or UUID, shaped like guild/{name}."""
+        index = self.guild_names.get(identifier, self.guild_uuids.get(identifier))
+        if index is None:
+            return None
+        members = {rank: {} for rank in RANKS}
+        online_count = 0
+        for uuid in self.guild_members[index]:
+            if uuid in self.left:
+                continue
+            online = uuid in self.online
+            online_count += online
+            members[self.ranks[uuid]][uuid] = {
+                'username': f"player{uuid[-6:]}", 'online': online, 'server': 'WC1' if online else None,
+                'contributed': 1000, 'contributionRank': 1, 'joined': '2024-01-01T00:00:00.000Z',
+            }
+        members['total'] = sum(len(rank_members) for rank_members in members.values())
+        payload = {
+            'uuid': make_guild_uuid(index), 'name': f"Guild {index}", 'prefix': f"G{index}",
+            'level': 50, 'xpPercent': 10, 'territories': 0, 'wars': 0, 'created': '2020-01-01T00:00:00.000Z',
+            'members': members, 'online': online_count, 'banner': None, 'seasonRanks': {},
+        }
+        if self.padding:
+            payload['padding'] = self.padding
+        return payload
+
+    def profile(self, uuid):
+        """A Mojang profile for a player UUID (dashed or not), or None."""
+        try:
+            uuid = str(uuid_lib.UUID(uuid))
+        except ValueError:
+            return None
+        if uuid not in self.ranks:
+            return None
+        return {'id': uuid.replace('-', ''), 'name': f"player{uuid[-6:]}"}
+
+
+class MockWynncraftAPI:
+    """Local stand-in for the Wynncraft endpoints the jobs read, plus Mojang's profile endpoint.
+
+    Every response carries an ETag and answers If-None-Match with a 304, so the response
+    cache can be exercised; `changed_uuids` get a fresh player payload on every request.
+    Rate-limit headers follow a fixed window of `rate_limit` requests per `rate_window`
+    seconds, requests over it get a 429, and `throttle` answers that share of the other
+    requests with a 429 and a Retry-After of `retry_after` seconds.
+    """
+
+    def __init__(self, player_count, latency=0.0, rate_limit=100000, rate_window=60, throttle=0.0, retry_after=1,
+                 **world):
+        self.world_config = dict(world, player_count=player_count)
+        self.world = MockWorld(**self.world_config)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.changed_uuids = set()
+        self.rng = random.Random(0)
+        self.reset_stats()
+        self.window_start = 0.0
+        self.window_count = 0
+        self._cached_bodies = {}
+        self._runner = None
+        self._stopped = None
+        self.base_url = None
+
+    @property
+    def player_uuids(self):
+        return self.world.player_uuids
+
+    def reset_stats(self):
+        self.request_count = 0
+        self.not_modified_count = 0
+        self.throttled_count = 0
+        self.bytes_sent = 0
+
+    def stats(self):
+        return {'requests': self.request_count, 'notModified': self.not_modified_count,
+                'throttled': self.throttled_count, 'bytesSent': self.bytes_sent, 'day': self.world.day}
+
+    def _rate_limit_headers(self, now):
+        reset = max(self.window_start + self.rate_window - now, 0)
+        return {
+            'RateLimit-Limit': str(self.rate_limit),
+            'RateLimit-Remaining': str(max(self.rate_limit - self.window_count, 0)),
+            'RateLimit-Reset': str(math.ceil(reset)),
+        }
+
+    @web.middleware
+    async def _limits(self, request, handler):
+        if request.path.startswith(ADMIN_PREFIX):
+            return await handler(request)
+
+        self.request_count += 1
+        now = asyncio.get_running_loop().time()
+        if now >= self.window_start + self.rate_window:
+            self.window_start = now
+            self.window_count = 0
+        self.window_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        headers = self._rate_limit_headers(now)
+        if self.window_count > self.rate_limit:
+            self.throttled_count += 1
+            headers['Retry-After'] = headers['RateLimit-Reset']
+            return web.Response(status=429, headers=headers)
+        if self.throttle and self.rng.random() < self.throttle:
+            self.throttled_count += 1
+            headers['Retry-After'] = str(self.retry_after)
+            return web.Response(status=429, headers=headers)
+
+        response = await handler(request)
+        response.headers.update(headers)
+        self.bytes_sent += response.content_length or 0
+        return response
+
+    def _json(self, request, payload=None, body=None):
+        """A JSON response with an ETag, or a 304 when the client already has this body."""
+        if body is None:
+            body = json.dumps(payload).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified_count += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    def _cached_body(self, key, build):
+        """Large bodies (the item database) are encoded once per simulated day."""
+        cache_key = (key, self.world.day)
+        if cache_key not in self._cached_bodies:
+            self._cached_bodies = {cache_key: json.dumps(build()).encode('utf-8')}
+        return self._cached_bodies[cache_key]
+
+    async def _player_list(self, request):
+        return self._json(request, self.world.player_list())
+
+    async def _player(self, request):
+        uuid = request.match_info['uuid']
+        payload = self.world.player(uuid)
+        if payload is None:
+            return web.json_response({'error': 'Player not found'}, status=404)
+        if uuid in self.changed_uuids:
+            payload['lastJoin'] = self.request_count
+        return self._json(request, payload)
+
+    async def _guild_list(self, request):
+        return self._json(request, self.world.guild_list())
+
+    async def _guild(self, request):
+        payload = self.world.guild(request.match_info['identifier'])
+        if payload is None:
+            return web.json_response({'error': 'Guild not found'}, status=404)
+        return self._json(request, payload)
+
+    async def _item_database(self, request):
+        return self._json(request, body=self._cached_body('items', lambda: self.world.items))
+
+    async def _aspects(self, request):
+        aspects = self.world.aspects.get(request.match_info['aspect_class'])
+        if aspects is None:
+            return web.json_response({'error': 'Unknown class'}, status=404)
+        return self._json(request, aspects)
+
+    async def _profile(self, request):
+        payload = self.world.profile(request.match_info['uuid'])
+        if payload is None:
+            return web.Response(status=204)
+        return self._json(request, payload)
+
+    async def _advance(self, request):
+        self.world.advance(float(request.query.get('churn', 0.05)))
+        return web.json_response(self.stats())
+
+    async def _reset(self, request):
+        """Back to day 0 of a fresh world, with the counters cleared."""
+        self.world = MockWorld(**self.world_config)
+        self.changed_uuids = set()
+        self.rng = random.Random(0)
+        self.reset_stats()
+        return web.json_response(self.stats())
+
+    async def _stats(self, request):
+        return web.json_response(self.stats())
+
+    async def _shutdown(self, request):
+        self._stopped.set()
+        return web.json_response({})
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application(middlewares=[self._limits])
+        app.router.add_get('/v3/player', self._player_list)
+        app.router.add_get('/v3/player/{uuid}', self._player)
+        app.router.add_get('/v3/guild/list/guild', self._guild_list)
+        app.router.add_get('/v3/guild/{identifier}', self._guild)
+        app.router.add_get('/v3/item/database', self._item_database)
+        app.router.add_get('/v3/aspects/{aspect_class}', self._aspects)
+        app.router.add_get('/session/minecraft/profile/{uuid}', self._profile)
+        app.router.add_post(ADMIN_PREFIX + 'advance', self._advance)
+        app.router.add_post(ADMIN_PREFIX + 'reset', self._reset)
+        app.router.add_get(ADMIN_PREFIX + 'stats', self._stats)
+        app.router.add_post(ADMIN_PREFIX + 'shutdown', self._shutdown)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        self._stopped = asyncio.Event()
+        return self.base_url
+
+    async def serve_forever(self):
+        """Serve until a POST to /_bench/shutdown."""
+        await self._stopped.wait()
+        await self.stop()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def serve(config, connection=None, host='127.0.0.1', port=0):
+    """Run a MockWynncraftAPI until it is shut down, sending its base URL over `connection`."""
+    async def run():
+        api = MockWynncraftAPI(**config)
+        base_url = await api.start(host, port)
+        if connection is not None:
+            connection.send(base_url)
+            connection.close()
+        else:
+            print(f"Serving the mock API at {base_url}")
+        await api.serve_forever()
+
+    asyncio.run(run())
+
+
+class MockApiProcess:
+    """A MockWynncraftAPI in a child process, driven through its admin routes.
+
+        with MockApiProcess(player_count=1000, guild_count=50, latency=0.02) as server:
+            player.PLAYER_LIST_URL = server.base_url + '/v3/player'
+            server.advance(churn=0.05)
+    """
+
+    def __init__(self, **config):
+        self.config = config
+        self.process = None
+        self.base_url = None
+
+    def __enter__(self):
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=serve, args=(self.config, sender), daemon=True)
+        self.process.start()
+        sender.close()
+        self.base_url = receiver.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            requests.post(self.base_url + ADMIN_PREFIX + 'shutdown', timeout=5)
+        except requests.RequestException:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def _admin(self, method, action, **params):
+        response = requests.request(method, self.base_url + ADMIN_PREFIX + action, params=params, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def advance(self, churn=0.05):
+        return self._admin('POST', 'advance', churn=churn)
+
+    def reset(self):
+        return self._admin('POST', 'reset')
+
+    def stats(self):
+        return self._admin('GET', 'stats')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--guilds', type=int, default=500)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--aspects-per-class', type=int, default=40)
+    parser.add_argument('--online', type=float, default=0.1, help="Share of players in the player list.")
+    parser.add_argument('--padding', type=int, default=0, help="Filler bytes added to player and guild payloads.")
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--rate-limit', type=int, default=100000, help="Requests per rate window.")
+    parser.add_argument('--rate-window', type=float, default=60, help="Rate-limit window in seconds.")
+    parser.add_argument('--throttle', type=float, default=0.0, help="Share of requests answered with a 429.")
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    serve({
+        'player_count': args.players, 'guild_count': args.guilds, 'item_count': args.items,
+        'aspects_per_class': args.aspects_per_class, 'online': args.online, 'padding': args.padding,
+        'latency': args.latency_ms / 1000, 'rate_limit': args.rate_limit, 'rate_window': args.rate_window,
+        'throttle': args.throttle,
+    }, port=args.port)
@@ -0,0 +1,49 @@
+"""MongoDB for the offline benchmarks: a scratch database on a local mongod, or an in-memory store.
+
+`memory` uses mongomock, an optional dependency (pip install mongomock). It covers the
+CRUD and bulk writes the jobs use, but not every aggregation stage, command monitoring or
+transactions, so some scenarios need a real mongod. Anything else is taken as a MongoDB URI.
+"""
+import importlib
+import os
+import time
+
+from pymongo import MongoClient
+
+import guild
+
+item_detection = importlib.import_module('item-detection')
+
+MEMORY = 'memory'
+DEFAULT_URI = 'mongodb://localhost:27017'
+BENCH_DATABASE = 'wynnpool_bench'
+SEED_BATCH_SIZE = 1000
+
+
+def connect(target=None):
+    """A client for `target` ('memory', a URI, or MONGODB_URI / localhost when None)."""
+    if target == MEMORY:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("The in-memory store needs mongomock: pip install mongomock")
+        return mongomock.MongoClient()
+    return MongoClient(target or os.getenv('MONGODB_URI') or DEFAULT_URI)
+
+
+def seed_guild_data(db, world, timestamp=None):
+    """Store every guild of `world`'s current day in guild_data, as guild.py would have."""
+    timestamp = timestamp or int(time.time()) - 24 * 60 * 60
+    documents = []
+    for guild_name in world.guild_list():
+        guild_data = world.guild(guild_name)
+        guild_data['timestamp'] = timestamp
+        guild_data['lastChecked'] = timestamp
+        guild_data['contentHash'] = guild.guild_content_hash(guild_data)
+        documents.append(guild_data)
+        if len(documents) >= SEED_BATCH_SIZE:
+            db[guild.COLLECTION_GUILD_DATA].insert_many(documents)
+            documents = []
+    if documents:
+        db[guild.COLLECTION_GUILD_DATA].insert_many(documents)
+    db[guild.COLLECTION_GUILD_DATA].create_index('uuid')
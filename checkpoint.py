@@ -0,0 +1,137 @@
+import argparse
+import hashlib
+import logging
+import time
+
+log = logging.getLogger('checkpoint')
+
+COLLECTION_CRAWL_CHECKPOINTS = 'crawl_checkpoints'
+
+# Checkpointed crawls: player.py's player phase and the guild phase after it, and guild.py alone
+PLAYER_CRAWL_JOB = 'players'
+PLAYER_GUILD_CRAWL_JOB = 'player-guilds'
+GUILD_CRAWL_JOB = 'guilds'
+
+# Progress is written at most this often (seconds), and always when a crawl finishes
+CHECKPOINT_INTERVAL = 30
+
+
+def parse_shard(value):
+    """argparse type for --shard i/N, returning (i, N) with 0 <= i < N."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard like 0/4, got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 0 and {count - 1}, got '{value}'")
+    return index, count
+
+
+def in_shard(key, shard):
+    """Whether `key` belongs to `shard`; a stable hash, so every runner splits the same way."""
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha1(str(key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
+
+
+class CrawlCheckpoint:
+    """Durable progress of one crawl (or one shard of it), stored in crawl_checkpoints.
+
+    The checkpoint holds the crawl's work list as it was when the crawl started, the keys
+    completed so far and any extra state the crawl wants back on resume. A crawl that is
+    resumed continues the same list, skipping completed keys.
+    """
+
+    def __init__(self, db, job, shard=None, interval=CHECKPOINT_INTERVAL):
+        self.collection = db[COLLECTION_CRAWL_CHECKPOINTS]
+        self.job = job
+        self.id = job if shard is None else f"{job}:{shard[0]}/{shard[1]}"
+        self.shard_count = shard[1] if shard else 1
+        self.interval = interval
+        self.items = []
+        self.completed = set()
+        self.extra = {}
+        self.saved_at = 0.0
+        self.dirty = False
+
+    def unfinished(self):
+        """Whether a crawl was started under this checkpoint and has not finished."""
+        state = self.collection.find_one({'_id': self.id}, {'finished': 1})
+        return bool(state) and not state.get('finished')
+
+    def begin(self, load_items, resume=False, key=None):
+        """Return the items left to process.
+
+        With `resume` and an unfinished checkpoint, the saved list and progress are restored;
+        otherwise the crawl starts over with `load_items()`. `key` maps an item to the id it
+        is completed under (default: the item itself). An empty list (a failed fetch) is not
+        saved, and a resumed checkpoint with nothing left is marked finished, so neither
+        keeps the next --resume from starting over; its extra state is still restored.
+        """
+        key = key or (lambda item: item)
+        state = self.collection.find_one({'_id': self.id}) if resume else None
+        if state and not state.get('finished'):
+            self.items = state.get('items', [])
+            self.completed = set(state.get('completed', []))
+            self.extra = state.get('extra', {})
+            remaining = [item for item in self.items if key(item) not in self.completed]
+            if not remaining:
+                log.info("Checkpoint %s has nothing left to do, marking it finished.", self.id)
+                self.finish()
+            else:
+                log.info("Resuming %s: %d of %d done.", self.id, len(self.completed), len(self.items))
+            return remaining
+
+        if resume:
+            log.info("No unfinished checkpoint for %s, starting over.", self.id)
+        self.items = load_items()
+        self.completed = set()
+        self.extra = {}
+        if not self.items:
+            log.warning("Nothing to crawl for %s, not saving a checkpoint.", self.id)
+            return []
+        self.collection.replace_one({'_id': self.id}, {
+            '_id': self.id,
+            'job': self.job,
+            'shardCount': self.shard_count,
+            'items': self.items,
+            'completed': [],
+            'extra': {},
+            'finished': False,
+            'startedAt': int(time.time()),
+            'updatedAt': int(time.time()),
+        }, upsert=True)
+        self.saved_at = time.monotonic()
+        return list(self.items)
+
+    def done(self, item_key):
+        """Record a completed key; progress is saved every `interval` seconds."""
+        self.completed.add(item_key)
+        self.dirty = True
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.collection.update_one({'_id': self.id}, {'$set': {
+            'completed': list(self.completed),
+            'extra': self.extra,
+            'updatedAt': int(time.time()),
+        }})
+        self.saved_at = time.monotonic()
+        self.dirty = False
+
+    def finish(self):
+        """Mark the crawl complete, so the next --resume starts a new one."""
+        self.dirty = True
+        self.save()
+        self.collection.update_one({'_id': self.id}, {'$set': {'finished': True}})
+
+
+def load_checkpoint_extras(db, job, shard_count=1):
+    """The extra state saved by every shard of the latest `job` crawl split `shard_count` ways."""
+    cursor = db[COLLECTION_CRAWL_CHECKPOINTS].find({'job': job, 'shardCount': shard_count}, {'extra': 1})
+    return [doc.get('extra', {}) for doc in cursor]
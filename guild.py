@@ -1,60 +1,144 @@
+import argparse
+import asyncio
+import hashlib
 import json
-import requests
+import logging
 import time
-from pymongo import MongoClient
-import os
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from checkpoint import (GUILD_CRAWL_JOB, PLAYER_CRAWL_JOB, PLAYER_GUILD_CRAWL_JOB, CrawlCheckpoint, in_shard,
+                        load_checkpoint_extras, parse_shard)
+from http_cache import get_response_cache
+from guild_members import extract_members
+from http_client import WYNNCRAFT_REQUEST_RATE, wynncraft_client
+from mongo_client import get_db
+from run_logging import Progress, setup_logging
+from run_metrics import count, fail_run, job_run, phase
+
+log = logging.getLogger('guild')
 
 # Database configuration
-DB_NAME = 'wynnpool'
 COLLECTION_EVENTS = 'guild_member_events'
 COLLECTION_GUILD_DATA = 'guild_data'
 
-# MongoDB connection
-mongodb_uri = os.getenv('MONGODB_URI')
-client = MongoClient(mongodb_uri)
-db = client[DB_NAME]
-guild_data_collection = db[COLLECTION_GUILD_DATA]
-events_collection = db[COLLECTION_EVENTS]
-
 # API URL to get the list of guilds
 GUILD_LIST_URL = 'https://api.wynncraft.com/v3/guild/list/guild'
+GUILD_DATA_URL_TEMPLATE = 'https://api.wynncraft.com/v3/guild/{guild_name}?identifier=uuid'
+
+DEFAULT_BATCH_SIZE = 100
+
+# Fields left out of a guild's content hash because they change without the guild changing
+VOLATILE_GUILD_FIELDS = ('_id', 'timestamp', 'lastChecked', 'contentHash', 'online')
+VOLATILE_MEMBER_FIELDS = ('online', 'server')
+
+# Returned by the guild fetches for a guild the response cache reports unchanged since the
+# last stored run, which is handled like a guild whose content hash matched
+UNCHANGED = object()
+
+# Member events are buffered and flushed once this many are pending or the oldest is this old
+EVENT_FLUSH_SIZE = 500
+EVENT_FLUSH_INTERVAL = 10
+
+
+def guild_data_collection():
+    return get_db()[COLLECTION_GUILD_DATA]
+
+
+def events_collection():
+    return get_db()[COLLECTION_EVENTS]
 
 
-def fetch_guild_list():
+def fetch_guild_list(api):
     """Fetch the list of all guilds from the API."""
     try:
-        response = requests.get(GUILD_LIST_URL)
+        response = api.get_json(GUILD_LIST_URL, endpoint='guild/list')
         if response.status_code == 200:
-            return response.json()
+            return response.data
         else:
             raise Exception(f"Failed to fetch guild list. Status code: {response.status_code}")
     except Exception as e:
-        print(f"Error fetching guild list: {e}")
+        log.error("Error fetching guild list: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
         return {}
 
 
-def fetch_guild_data(guild_name):
-    """Fetch the latest guild data from the API for a specific guild."""
+def fetch_guild_data(api, guild_name, cache=None):
+    """Fetch the latest guild data from the API for a specific guild.
+
+    With a response cache, guilds whose payload is unchanged since the last stored run
+    return UNCHANGED so their diff and write are skipped; commit the URL once it is stored.
+    Returns None when the fetch failed.
+    """
     try:
-        api_url = f'https://api.wynncraft.com/v3/guild/{guild_name}?identifier=uuid'
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to fetch data for guild '{guild_name}'. Status code: {response.status_code}")
+        response = api.get_json(GUILD_DATA_URL_TEMPLATE.format(guild_name=guild_name), cache,
+                                endpoint='guild', defer_commit=True)
     except Exception as e:
-        print(f"Error fetching data for guild '{guild_name}': {e}")
+        log.warning("Error fetching data for guild '%s': %s", guild_name, e)
         return None
+    return _guild_response_data(guild_name, response)
+
+
+async def fetch_guild_data_async(api, guild_name, cache=None):
+    """Async counterpart of fetch_guild_data; `api` must be entered with `async with`."""
+    try:
+        response = await api.get_json_async(GUILD_DATA_URL_TEMPLATE.format(guild_name=guild_name), cache,
+                                            endpoint='guild', defer_commit=True)
+    except Exception as e:
+        log.warning("Error fetching data for guild '%s': %s", guild_name, e)
+        return None
+    return _guild_response_data(guild_name, response)
+
+
+def _guild_response_data(guild_name, response):
+    """What fetch_guild_data returns for a guild API response."""
+    if response.status_code != 200:
+        log.warning("Error fetching data for guild '%s': status code %s", guild_name, response.status_code)
+        return None
+    if response.unchanged:
+        log.debug("Guild '%s' is unchanged since the last run, skipping.", guild_name)
+        return UNCHANGED
+    return response.data
 
 
 def get_existing_guild_data(guild_uuid):
     """Get the most recent stored guild data from MongoDB using guild UUID."""
-    return guild_data_collection.find_one({"uuid": guild_uuid}, sort=[("_id", -1)])
+    return guild_data_collection().find_one({"uuid": guild_uuid}, sort=[("_id", -1)])
+
+
+def guild_content_hash(guild_data):
+    """Hash a guild snapshot's canonical JSON, ignoring fields that change on their own."""
+    content = {key: value for key, value in guild_data.items() if key not in VOLATILE_GUILD_FIELDS}
+    members = content.get('members')
+    if isinstance(members, dict):
+        content['members'] = {
+            rank: {
+                uuid: {key: value for key, value in member.items() if key not in VOLATILE_MEMBER_FIELDS}
+                for uuid, member in rank_members.items()
+            } if isinstance(rank_members, dict) else rank_members
+            for rank, rank_members in members.items()
+        }
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def is_guild_unchanged(old_data, content_hash):
+    """Whether a stored snapshot already holds content with this hash."""
+    return bool(old_data) and old_data.get('contentHash') == content_hash
+
+
+def touch_guild_data(guild_uuid, timestamp):
+    """Record that an unchanged guild was checked, without rewriting the document."""
+    guild_data_collection().update_many({"uuid": guild_uuid}, {"$set": {"lastChecked": timestamp}})
+
 
+def store_guild_data(guild_data, timestamp=None, content_hash=None):
+    """Store or update the fetched guild data into MongoDB.
 
-def store_guild_data(guild_data):
-    """Store or update the fetched guild data into MongoDB."""
-    guild_data['timestamp'] = int(time.time())  # Add timestamp
+    Returns False when the stored snapshot already has the same content hash; only its
+    lastChecked time is updated then.
+    """
+    timestamp = timestamp or int(time.time())
+    content_hash = content_hash or guild_content_hash(guild_data)
 
     # Extract the guild UUID for the current guild
     guild_uuid = guild_data.get('uuid')
@@ -62,137 +146,514 @@ def store_guild_data(guild_data):
         raise Exception("Guild UUID not found in the API response.")
 
     # Check if this guild data already exists (using guild UUID as the unique key)
-    existing_data = guild_data_collection.find_one({"uuid": guild_uuid})
+    existing_data = guild_data_collection().find_one({"uuid": guild_uuid}, {"contentHash": 1})
+    if is_guild_unchanged(existing_data, content_hash):
+        touch_guild_data(guild_uuid, timestamp)
+        log.debug("Guild data for UUID %s is unchanged.", guild_uuid)
+        return False
+
+    write_guild_data(guild_data, existing_data, timestamp, content_hash)
+    return True
+
+
+def write_guild_data(guild_data, existing_data, timestamp, content_hash):
+    """Write a changed guild snapshot over `existing_data`, the stored document already loaded
+    for it (None to insert one)."""
+    guild_uuid = guild_data.get('uuid')
+    guild_data['timestamp'] = timestamp  # Add timestamp
+    guild_data['lastChecked'] = timestamp
+    guild_data['contentHash'] = content_hash
 
     if existing_data:
         # Update the existing document
-        update_result = guild_data_collection.update_one(
+        update_result = guild_data_collection().update_one(
             {"_id": existing_data["_id"]}, 
             {"$set": guild_data}
         )
         if update_result.modified_count > 0:
-            print(f"Guild data for UUID {guild_uuid} updated successfully.")
+            log.debug("Guild data for UUID %s updated successfully.", guild_uuid)
         else:
-            print(f"No changes were made to the guild data for UUID {guild_uuid}.")
+            log.debug("No changes were made to the guild data for UUID %s.", guild_uuid)
     else:
         # Insert a new document if it doesn't exist
-        guild_data_collection.insert_one(guild_data)
-        print(f"New guild data for UUID {guild_uuid} inserted successfully.")
+        guild_data_collection().insert_one(guild_data)
+        log.debug("New guild data for UUID %s inserted successfully.", guild_uuid)
 
 
-def detect_member_changes(old_data, new_data):
-    """Detect member join, leave, and rank changes."""
+def detect_member_changes(old_data, new_data, timestamp):
+    """Detect member join, leave, and rank changes.
+
+    Returns the event documents instead of writing them, so callers can buffer them in an
+    EventBuffer. Every event is stamped with the given run timestamp.
+    """
+    events = []
     if not old_data:
-        return
+        return events
 
     old_members = extract_members(old_data)
     new_members = extract_members(new_data)
     guild_uuid = new_data.get('uuid', 'Unknown UUID')
     guild_name = new_data.get('name', 'Unknown Name')
 
-    # 1. Check for new members (join)
+    # 1. New members (join)
     for uuid, member in new_members.items():
         if uuid not in old_members:
-            event = {
-                'timestamp': int(time.time()),
+            events.append({
+                'timestamp': timestamp,
                 'event': 'join',
                 'uuid': uuid,
                 'name': member['username'],
                 'guild_uuid': guild_uuid,
                 'guild_name': guild_name
-            }
-            events_collection.insert_one(event)
-            print(f"New member joined: {member['username']}")
+            })
 
-    # 2. Check for members who left
+    # 2. Members who left
     for uuid, member in old_members.items():
         if uuid not in new_members:
-            event = {
-                'timestamp': int(time.time()),
+            events.append({
+                'timestamp': timestamp,
                 'event': 'leave',
                 'uuid': uuid,
                 'name': member['username'],
                 'guild_uuid': guild_uuid,
                 'guild_name': guild_name,
                 'rank': member['rank']
-            }
-            events_collection.insert_one(event)
-            print(f"Member left: {member['username']}")
+            })
 
-    # 3. Check for rank changes
+    # 3. Rank changes
     for uuid, new_member in new_members.items():
-        if uuid in old_members:
-            old_member = old_members[uuid]
-            if old_member['rank'] != new_member['rank']:
-                event = {
-                    'timestamp': int(time.time()),
-                    'event': 'rank_change',
-                    'uuid': uuid,
-                    'name': new_member['username'],
-                    'guild_uuid': guild_uuid,
-                    'guild_name': guild_name,
-                    'old_rank': old_member['rank'],
-                    'new_rank': new_member['rank']
-                }
-                events_collection.insert_one(event)
-                print(f"Rank change for {new_member['username']}: {old_member['rank']} -> {new_member['rank']}")
-
-
-def extract_members(guild_data):
-    """Extract members as a flat list of users with their ranks."""
-    members = {}
-    for rank, rank_members in guild_data.get('members', {}).items():
-        if rank != 'total':  # Skip 'total' field
-            for uuid, member_data in rank_members.items():
-                members[uuid] = {
-                    'username': member_data['username'],
-                    'rank': rank,
-                    'joined': member_data['joined']
-                }
-    return members
-
-
-def process_all_guilds(guild_list):
-    """Process all guilds from the guild list."""
+        old_member = old_members.get(uuid)
+        if old_member and old_member['rank'] != new_member['rank']:
+            events.append({
+                'timestamp': timestamp,
+                'event': 'rank_change',
+                'uuid': uuid,
+                'name': new_member['username'],
+                'guild_uuid': guild_uuid,
+                'guild_name': guild_name,
+                'old_rank': old_member['rank'],
+                'new_rank': new_member['rank']
+            })
+
+    return events
+
+
+class SnapshotStats:
+    """Counts stored and unchanged guild snapshots over a run."""
+
+    def __init__(self):
+        self.stored = 0
+        self.unchanged = 0
+
+    def report(self):
+        """Log how many guilds were skipped because their content hash matched."""
+        total = self.stored + self.unchanged
+        skip_ratio = self.unchanged / total * 100 if total else 0.0
+        log.info("Stored %d changed guilds, skipped %d unchanged (%.1f%% skip ratio).",
+                 self.stored, self.unchanged, skip_ratio)
+        count('guilds_stored', self.stored)
+        count('guilds_unchanged', self.unchanged)
+
+
+class EventBuffer:
+    """Buffers member events and writes them to MongoDB with unordered insert_many calls."""
+
+    def __init__(self, collection, max_size=EVENT_FLUSH_SIZE, max_age=EVENT_FLUSH_INTERVAL):
+        self.collection = collection
+        self.max_size = max_size
+        self.max_age = max_age
+        self.events = []
+        self.oldest_event_at = None
+        self.started_at = time.monotonic()
+        self.flushed_events = 0
+        self.flush_calls = 0
+        self.write_seconds = 0.0
+
+    def add(self, events):
+        """Queue events, flushing when the buffer is full or has been waiting too long."""
+        if not events:
+            return
+        if not self.events:
+            self.oldest_event_at = time.monotonic()
+        self.events.extend(events)
+
+        if len(self.events) >= self.max_size or time.monotonic() - self.oldest_event_at >= self.max_age:
+            self.flush()
+
+    def flush(self):
+        """Write every pending event in one unordered insert_many."""
+        if not self.events:
+            return
+        events, self.events = self.events, []
+
+        start = time.monotonic()
+        try:
+            self.collection.insert_many(events, ordered=False)
+            inserted = len(events)
+        except BulkWriteError as e:
+            # Unordered writes keep going past a bad document, so only the failures are lost
+            inserted = e.details.get('nInserted', 0)
+            log.error("Failed to insert %d of %d member events: %s", len(events) - inserted, len(events), e)
+        except Exception as e:
+            inserted = 0
+            log.error("Error inserting %d member events: %s", len(events), e)
+        self.write_seconds += time.monotonic() - start
+        self.flushed_events += inserted
+        self.flush_calls += 1
+
+    def report(self):
+        """Log how many events were flushed and how fast."""
+        elapsed = time.monotonic() - self.started_at
+        run_rate = self.flushed_events / elapsed if elapsed > 0 else 0.0
+        write_rate = self.flushed_events / self.write_seconds if self.write_seconds > 0 else 0.0
+        log.info("Flushed %d member events in %d writes (%.1f events/s over the run, %.1f events/s while writing).",
+                 self.flushed_events, self.flush_calls, run_rate, write_rate)
+        count('member_events', self.flushed_events)
+
+
+def log_member_events(events):
+    """Log a human readable line per member event, at DEBUG."""
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    for event in events:
+        if event['event'] == 'join':
+            log.debug("New member joined: %s", event['name'])
+        elif event['event'] == 'leave':
+            log.debug("Member left: %s", event['name'])
+        else:
+            log.debug("Rank change for %s: %s -> %s", event['name'], event['old_rank'], event['new_rank'])
+
+
+def store_guild_batch(batch, timestamp, event_buffer, stats):
+    """Diff and store a batch of fetched guilds with one bulk read and one bulk write.
+
+    `batch` is a list of (guild_uuid, new_data) pairs in guild list order. The stored
+    documents and member events match what the serial path produces for the same guilds.
+    Returns the UUIDs of the guilds stored or found unchanged, or None when the batch failed.
+    """
+    try:
+        guild_uuids = [guild_uuid for guild_uuid, _ in batch]
+        with phase('db_read'):
+            existing = {}
+            for doc in guild_data_collection().find({"uuid": {"$in": guild_uuids}}).sort("_id", 1):
+                existing[doc["uuid"]] = doc  # Later documents win, like get_existing_guild_data
+
+        events = []
+        operations = []
+        unchanged_uuids = []
+        handled_uuids = set()
+        with phase('diff'):
+            for guild_uuid, new_data in batch:
+                if new_data is UNCHANGED:
+                    handled_uuids.add(guild_uuid)
+                    unchanged_uuids.append(guild_uuid)
+                    continue
+                new_uuid = new_data.get('uuid')
+                if not new_uuid:
+                    log.warning("Skipping guild %s: guild UUID not found in the API response.", guild_uuid)
+                    continue
+
+                old_data = existing.get(guild_uuid)
+                content_hash = guild_content_hash(new_data)
+                handled_uuids.add(guild_uuid)
+                if is_guild_unchanged(old_data, content_hash):
+                    unchanged_uuids.append(new_uuid)
+                    continue
+                if old_data:
+                    events.extend(detect_member_changes(old_data, new_data, timestamp))
+
+                new_data['timestamp'] = timestamp
+                new_data['lastChecked'] = timestamp
+                new_data['contentHash'] = content_hash
+                operations.append(UpdateOne({"uuid": new_uuid}, {"$set": new_data}, upsert=True))
+                # A guild appearing twice in one batch is diffed against its newer snapshot
+                existing[new_uuid] = new_data
+
+        log_member_events(events)
+        stored = len(operations)
+        if unchanged_uuids:
+            operations.append(UpdateMany({"uuid": {"$in": unchanged_uuids}}, {"$set": {"lastChecked": timestamp}}))
+        with phase('db_write'):
+            # Flush this batch's events before writing the snapshots they were detected against
+            event_buffer.add(events)
+            event_buffer.flush()
+            if operations:
+                result = guild_data_collection().bulk_write(operations)
+                log.debug("Stored %d guilds: %d inserted, %d updated, %d unchanged, %d member events.",
+                          stored, result.upserted_count, stored - result.upserted_count, len(unchanged_uuids),
+                          len(events))
+        stats.stored += stored
+        stats.unchanged += len(unchanged_uuids)
+        return handled_uuids
+    except Exception as e:
+        log.error("An error occurred while storing a batch of %d guilds: %s", len(batch), e)
+        return None
+
+
+async def process_guild_chunks(chunks, api, timestamp, event_buffer, stats, cache=None, on_stored=None, total=None):
+    """Fetch each chunk of (guild_name, guild_uuid) pairs concurrently, storing it while the next one downloads.
+
+    `chunks` is an async iterable; `on_stored(pairs)` is called once a chunk's batch is in MongoDB,
+    with the pairs of the guilds that were stored or found unchanged (not those whose fetch failed).
+    Progress is logged against `total` guilds when it is known.
+    """
+    loop = asyncio.get_running_loop()
+    progress = Progress(log, 'guilds', total)
+    pending_store = None
+    pending_fetched = []
+    pending_size = 0
+
+    async def finish_store():
+        # Only remember a guild's payload in the cache, or report it stored, once its batch made it to MongoDB
+        handled_uuids = await pending_store
+        progress.advance(pending_size)
+        if handled_uuids is None:
+            return
+        stored = [(guild_name, guild_uuid) for guild_name, guild_uuid in pending_fetched
+                  if guild_uuid in handled_uuids]
+        if cache:
+            for guild_name, _ in stored:
+                cache.commit(GUILD_DATA_URL_TEMPLATE.format(guild_name=guild_name))
+        if on_stored:
+            on_stored(stored)
+
+    async with api:
+        async for chunk in chunks:
+            with phase('fetch'):
+                results = await asyncio.gather(
+                    *(fetch_guild_data_async(api, guild_name, cache) for guild_name, _ in chunk)
+                )
+            fetched = [(guild_name, guild_uuid, new_data)
+                       for (guild_name, guild_uuid), new_data in zip(chunk, results) if new_data]
+            batch = [(guild_uuid, new_data) for _, guild_uuid, new_data in fetched]
+
+            # Batches are stored one at a time and in order, so events keep the serial ordering
+            if pending_store:
+                await finish_store()
+            pending_store = loop.run_in_executor(None, store_guild_batch, batch, timestamp, event_buffer, stats)
+            pending_fetched = [(guild_name, guild_uuid) for guild_name, guild_uuid, _ in fetched]
+            pending_size = len(chunk)
+
+        if pending_store:
+            await finish_store()
+    progress.finish()
+
+
+async def process_all_guilds_async(guild_items, api, batch_size, timestamp, event_buffer, stats, cache=None,
+                                   checkpoint=None):
+    """Fetch guilds concurrently in batches, storing each batch while the next one downloads."""
+    async def chunks():
+        for start in range(0, len(guild_items), batch_size):
+            yield guild_items[start:start + batch_size]
+
+    def mark_done(chunk):
+        for guild_name, _ in chunk:
+            checkpoint.done(guild_name)
+
+    await process_guild_chunks(chunks(), api, timestamp, event_buffer, stats, cache,
+                               mark_done if checkpoint else None, len(guild_items))
+
+
+async def iter_queue_chunks(queue, batch_size):
+    """Yield chunks of whatever is waiting on `queue` (at most batch_size), until a None item ends it."""
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        chunk = [item]
+        while len(chunk) < batch_size:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                yield chunk
+                return
+            chunk.append(item)
+        yield chunk
+
+
+async def process_guild_queue(queue, api, batch_size=DEFAULT_BATCH_SIZE, cache=None, on_stored=None):
+    """Process guilds as they are put on `queue` as (guild_name, guild_uuid), until a None item.
+
+    Used to store guilds while they are still being discovered; a guild waits at most for
+    the batch in flight instead of for the whole discovery to finish.
+    """
+    run_timestamp = int(time.time())
+    event_buffer = EventBuffer(events_collection())
+    stats = SnapshotStats()
+
+    await process_guild_chunks(iter_queue_chunks(queue, batch_size), api, run_timestamp,
+                               event_buffer, stats, cache, on_stored)
+    event_buffer.report()
+    stats.report()
+    if cache:
+        cache.report()
+    log.info("Finished processing all guilds.")
+
+
+def process_all_guilds(guild_list, concurrency=1, batch_size=DEFAULT_BATCH_SIZE, cache=None,
+                       checkpoint=None, resume=False, shard=None, api=None):
+    """Process all guilds from the guild list.
+
+    With a concurrency above 1 the guilds go through the pipelined batch mode instead of
+    the serial fetch/read/diff/write loop. With a response cache, guilds whose payload has
+    not changed since the last run are skipped. With a checkpoint, finished guilds are
+    recorded as the crawl goes and `resume` continues the last unfinished crawl's list.
+    With a shard, only guilds whose UUID falls in that shard are processed.
+    """
+    api = api or wynncraft_client(concurrency, WYNNCRAFT_REQUEST_RATE)
     try:
         # Step 1: Fetch the list of all guilds
+        def load_guild_items():
+            return [[guild_name, guild_info] for guild_name, guild_info in guild_list.items()
+                    if in_shard(guild_info.get('uuid'), shard)]
+
+        if checkpoint:
+            guild_list = dict(checkpoint.begin(load_guild_items, resume, key=lambda item: item[0]))
+        elif shard:
+            guild_list = dict(load_guild_items())
+
         if not guild_list:
-            print("No guilds found in the guild list.")
+            log.info("No guilds found in the guild list.")
             return
 
         total_guilds = len(guild_list)
-        print(f"Total guilds to process: {total_guilds}")
+        log.info("Total guilds to process: %d", total_guilds)
+
+        # One timestamp for every event and snapshot written by this run
+        run_timestamp = int(time.time())
+        event_buffer = EventBuffer(events_collection())
+        stats = SnapshotStats()
+
+        if concurrency > 1:
+            guild_items = []
+            for guild_name, guild_info in guild_list.items():
+                if not guild_info.get('uuid'):
+                    log.warning("Skipping guild '%s' due to missing UUID.", guild_name)
+                    continue
+                guild_items.append((guild_name, guild_info['uuid']))
+
+            asyncio.run(process_all_guilds_async(
+                guild_items, api, batch_size, run_timestamp, event_buffer, stats, cache, checkpoint
+            ))
+            if checkpoint:
+                checkpoint.finish()
+            event_buffer.report()
+            stats.report()
+            if cache:
+                cache.report()
+            api.report()
+            log.info("Finished processing all guilds.")
+            return
+
+        progress = Progress(log, 'guilds', total_guilds)
         for guild_name, guild_info in guild_list.items():
             try:
                 guild_uuid = guild_info.get('uuid')
                 if not guild_uuid:
-                    print(f"Skipping guild '{guild_name}' due to missing UUID.")
+                    log.warning("Skipping guild '%s' due to missing UUID.", guild_name)
                     continue
                 
-                print(f"\nProcessing guild: {guild_name} (UUID: {guild_info['uuid']})")
+                log.debug("Processing guild: %s (UUID: %s)", guild_name, guild_uuid)
 
                 # Step 2: Fetch the latest data for this guild
-                new_data = fetch_guild_data(guild_name)
+                with phase('fetch'):
+                    new_data = fetch_guild_data(api, guild_name, cache)
                 if not new_data:
                     continue
 
-                # Step 3: Get the existing data from MongoDB
-                old_data = get_existing_guild_data(guild_info['uuid'])
-
-                # Step 4: Detect changes (join, leave, rank change)
-                detect_member_changes(old_data, new_data)
-
-                # Step 5: Store or update the new guild data in MongoDB
-                store_guild_data(new_data)
+                # Step 3: Get the existing data from MongoDB, unless the response cache already
+                # reported the guild unchanged
+                unchanged = new_data is UNCHANGED
+                if not unchanged:
+                    with phase('db_read'):
+                        old_data = get_existing_guild_data(guild_info['uuid'])
+                    content_hash = guild_content_hash(new_data)
+                    unchanged = is_guild_unchanged(old_data, content_hash)
+
+                # Step 4: Skip the diff and write when the guild has not changed
+                if unchanged:
+                    with phase('db_write'):
+                        touch_guild_data(guild_uuid, run_timestamp)
+                    stats.unchanged += 1
+                    if cache:
+                        cache.commit(GUILD_DATA_URL_TEMPLATE.format(guild_name=guild_name))
+                    if checkpoint:
+                        checkpoint.done(guild_name)
+                    continue
 
-                time.sleep(0.2)
+                # Step 5: Detect changes (join, leave, rank change)
+                with phase('diff'):
+                    events = detect_member_changes(old_data, new_data, run_timestamp)
+                log_member_events(events)
+
+                # Step 6: Store or update the new guild data in MongoDB
+                with phase('db_write'):
+                    event_buffer.add(events)
+                    write_guild_data(new_data, old_data, run_timestamp, content_hash)
+                stats.stored += 1
+                if cache:
+                    cache.commit(GUILD_DATA_URL_TEMPLATE.format(guild_name=guild_name))
+                # Guilds that failed are left out of the checkpoint, so a resumed crawl retries them
+                if checkpoint:
+                    checkpoint.done(guild_name)
             except Exception as e:
-                print(f"An error occurred while processing guild '{guild_name}': {e}")
-
-        print("Finished processing all guilds.")
+                log.error("An error occurred while processing guild '%s': %s", guild_name, e)
+            finally:
+                progress.advance()
+        progress.finish()
+
+        with phase('db_write'):
+            event_buffer.flush()
+        if checkpoint:
+            checkpoint.finish()
+        event_buffer.report()
+        stats.report()
+        if cache:
+            cache.report()
+        api.report()
+        log.info("Finished processing all guilds.")
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
+
+
+def load_player_crawl_guilds(shard_count):
+    """Merge the guilds collected by every shard of the last sharded player.py crawl."""
+    guild_list = {}
+    for extra in load_checkpoint_extras(get_db(), PLAYER_CRAWL_JOB, shard_count):
+        guild_list.update(extra.get('guilds', {}))
+    return guild_list
 
 
 if __name__ == "__main__":
-    process_all_guilds(fetch_guild_list())
+    parser = argparse.ArgumentParser(description="Refresh stored guild data and record member events.")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="Number of concurrent guild requests (1 keeps the serial loop).")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Guilds read, diffed and written together in pipelined mode.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the last crawl from its checkpoint instead of starting over.")
+    parser.add_argument('--shard', type=parse_shard,
+                        help="Process only the guilds in shard i of N (e.g. 0/4).")
+    parser.add_argument('--from-player-crawl', action='store_true',
+                        help="Process the guilds collected by a sharded player.py crawl instead of the full guild list.")
+    args = parser.parse_args()
+
+    setup_logging('guild')
+    db = get_db()
+    with job_run('guild', db):
+        api = wynncraft_client(args.concurrency, WYNNCRAFT_REQUEST_RATE)
+        job = PLAYER_GUILD_CRAWL_JOB if args.from_player_crawl else GUILD_CRAWL_JOB
+        checkpoint = CrawlCheckpoint(db, job, args.shard)
+        if args.resume and checkpoint.unfinished():
+            guild_list = {}  # The checkpoint holds the list being resumed
+        elif args.from_player_crawl:
+            guild_list = load_player_crawl_guilds(args.shard[1] if args.shard else 1)
+        else:
+            with phase('fetch'):
+                guild_list = fetch_guild_list(api)
+
+        process_all_guilds(guild_list, args.concurrency, args.batch_size, get_response_cache(),
+                           checkpoint, args.resume, args.shard, api)
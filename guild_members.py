@@ -0,0 +1,24 @@
+def extract_members(guild_data):
+    """Flatten a guild document's members ({rank: {uuid: {username, ...}}}) into {uuid: {username, rank}}.
+
+    The 'total' count and anything that is not a rank or member object are skipped. A UUID
+    listed under two ranks is kept once, with the last of them.
+    """
+    members = {}
+    members_data = guild_data.get('members') if isinstance(guild_data, dict) else None
+    if not isinstance(members_data, dict):
+        return members
+
+    for rank, rank_members in members_data.items():
+        if rank == 'total' or not isinstance(rank_members, dict):
+            continue
+        for uuid, member_data in rank_members.items():
+            if isinstance(member_data, dict):
+                members[uuid] = {'username': member_data.get('username'), 'rank': rank}
+    return members
+
+
+def iter_guild_members(guild):
+    """Yield (uuid, username) for every member of a stored guild document."""
+    for uuid, member in extract_members(guild).items():
+        yield uuid, member['username']
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+import requests
+
+log = logging.getLogger('http_cache')
+
+# Set HTTP_CACHE_DIR to turn on the on-disk response cache for every job
+CACHE_DIR_ENV = 'HTTP_CACHE_DIR'
+
+# data is the decoded JSON body (served from disk on a 304); unchanged is True when the
+# body is identical to the one stored by the last successful run; size is the body bytes
+# actually read off the connection, 0 for a 304
+CachedResponse = namedtuple('CachedResponse', ['status_code', 'headers', 'data', 'unchanged', 'size'],
+                            defaults=(0,))
+
+
+class ResponseCache:
+    """On-disk HTTP response cache keyed by URL, refreshed with conditional requests.
+
+    A 304 or a body whose content hash matches the stored one counts as "unchanged", so
+    callers can skip their diff and database write for that entity. Bodies that changed are
+    only written to disk once `commit` is called, after the caller has stored them; a run
+    that fails halfway therefore never hides a change from the next run.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.pending = {}
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+
+    def _path(self, url, suffix):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _load_entry(self, url):
+        try:
+            with open(self._path(url, '.json'), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _load_body(self, url):
+        with open(self._path(url, '.body'), 'rb') as file:
+            return file.read()
+
+    def _conditional_headers(self, entry, headers):
+        request_headers = dict(headers or {})
+        if entry:
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+        return request_headers
+
+    def _handle(self, url, entry, status_code, headers, body, defer_commit):
+        size = len(body)
+        if status_code == 304 and entry:
+            try:
+                body = self._load_body(url)
+            except OSError:
+                # The body went missing; drop the entry so the next request is unconditional
+                os.remove(self._path(url, '.json'))
+                self.misses += 1
+                return CachedResponse(status_code, headers, None, False, size)
+            self.hits += 1
+            self.not_modified += 1
+            self.bytes_saved += len(body)
+            return CachedResponse(200, headers, json.loads(body), True, size)
+
+        if status_code != 200:
+            return CachedResponse(status_code, headers, None, False, size)
+
+        self.bytes_downloaded += len(body)
+        content_hash = hashlib.sha256(body).hexdigest()
+        if entry and entry.get('content_hash') == content_hash:
+            self.hits += 1
+            return CachedResponse(200, headers, json.loads(body), True, size)
+
+        self.misses += 1
+        self.pending[url] = ({
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_hash': content_hash,
+        }, body)
+        if not defer_commit:
+            self.commit(url)
+        return CachedResponse(200, headers, json.loads(body), False, size)
+
+    def get(self, url, headers=None, session=None, timeout=None, defer_commit=False):
+        """Conditionally GET a JSON endpoint through requests."""
+        entry = self._load_entry(url)
+        response = (session or requests).get(url, headers=self._conditional_headers(entry, headers), timeout=timeout)
+        return self._handle(url, entry, response.status_code, response.headers, response.content, defer_commit)
+
+    async def get_async(self, session, url, headers=None, defer_commit=False):
+        """Conditionally GET a JSON endpoint through an aiohttp session."""
+        entry = self._load_entry(url)
+        async with session.get(url, headers=self._conditional_headers(entry, headers)) as response:
+            body = await response.read() if response.status == 200 else b''
+            return self._handle(url, entry, response.status, response.headers, body, defer_commit)
+
+    def commit(self, url):
+        """Persist the body fetched for `url` once the caller has stored it downstream.
+
+        Committing an unchanged URL only refreshes its `stored_at` time.
+        """
+        pending = self.pending.pop(url, None)
+        if pending:
+            entry, body = pending
+            files = [('.body', body, 'wb')]
+        else:
+            entry = self._load_entry(url)
+            if not entry:
+                return
+            files = []
+        entry['stored_at'] = int(time.time())
+        files.append(('.json', json.dumps(entry), 'w'))
+
+        # Write the body before the entry so a crash never leaves an entry without its body
+        for suffix, content, mode in files:
+            path = self._path(url, suffix)
+            with open(path + '.tmp', mode) as file:
+                file.write(content)
+            os.replace(path + '.tmp', path)
+
+    def stored_at(self, url):
+        """Unix time the body currently cached for `url` was committed, or None."""
+        entry = self._load_entry(url)
+        return entry.get('stored_at') if entry else None
+
+    def report(self):
+        """Print the hit/miss counters for this run."""
+        total = self.hits + self.misses
+        hit_ratio = self.hits / total * 100 if total else 0.0
+        log.info("HTTP cache: %d unchanged (%d not modified), %d changed, %.1f%% hit ratio, %d bytes saved, "
+                 "%d bytes downloaded.", self.hits, self.not_modified, self.misses, hit_ratio, self.bytes_saved,
+                 self.bytes_downloaded)
+
+
+def fetch_json(url, cache=None, headers=None, session=None, timeout=None, defer_commit=False):
+    """GET a JSON endpoint, going through the response cache when one is given."""
+    if cache:
+        return cache.get(url, headers=headers, session=session, timeout=timeout, defer_commit=defer_commit)
+    response = (session or requests).get(url, headers=headers, timeout=timeout)
+    data = response.json() if response.status_code == 200 else None
+    return CachedResponse(response.status_code, response.headers, data, False, len(response.content))
+
+
+async def fetch_json_async(session, url, cache=None, headers=None, defer_commit=False):
+    """Async counterpart of fetch_json for an aiohttp session."""
+    if cache:
+        return await cache.get_async(session, url, headers=headers, defer_commit=defer_commit)
+    async with session.get(url, headers=headers) as response:
+        body = await response.read()
+        data = json.loads(body) if response.status == 200 else None
+        return CachedResponse(response.status, response.headers, data, False, len(body))
+
+
+def get_response_cache():
+    """The response cache configured through HTTP_CACHE_DIR, or None when caching is off."""
+    cache_dir = os.getenv(CACHE_DIR_ENV)
+    return ResponseCache(cache_dir) if cache_dir else None
@@ -0,0 +1,390 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_cache import CachedResponse, fetch_json, fetch_json_async
+from ratelimit import TokenBucket, retry_after_seconds
+from run_metrics import track_http_client
+
+log = logging.getLogger('http_client')
+
+WYNNCRAFT_API_KEY_ENV = 'WYNNCRAFT_API_KEY'
+# Requests per second a Wynncraft client starts at, until the API reports its own rate limit
+WYNNCRAFT_REQUEST_RATE = 5
+# The player crawl starts slower, at the pace of the fixed half-second sleep it used to have
+WYNNCRAFT_PLAYER_REQUEST_RATE = 2
+# Caps the requests kept in flight to any one host, whatever concurrency a job asks for
+MAX_CONCURRENCY_ENV = 'HTTP_MAX_CONCURRENCY'
+
+DEFAULT_TIMEOUT = 30
+# Seconds to wait for each read of the (large) item database response
+ITEM_DATABASE_TIMEOUT = 60
+DEFAULT_MAX_RETRIES = 3
+# Retry n waits a random delay of up to BACKOFF_BASE * 2**n seconds, capped at BACKOFF_MAX
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# Server errors worth another try; a 429 is retried after the API's own Retry-After instead
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff, so concurrent workers do not retry in lockstep."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def content_length(headers):
+    """The Content-Length of a response as an int, or None when it sent none."""
+    length = headers.get('Content-Length') if headers else None
+    return int(length) if length and length.isdigit() else None
+
+
+def request_size(method, url, headers=None, body=None):
+    """Bytes of a request's line, the headers we set on it and its body.
+
+    Headers the HTTP library adds itself (Host, Accept-Encoding, ...) are not known here, so
+    this slightly undercounts what goes on the wire.
+    """
+    size = len(f"{method} {url} HTTP/1.1\r\n\r\n")
+    for key, value in (headers or {}).items():
+        size += len(f"{key}: {value}\r\n")
+    return size + len(body or b'')
+
+
+def concurrency_cap(concurrency):
+    """`concurrency` lowered to HTTP_MAX_CONCURRENCY when that is set."""
+    cap = os.getenv(MAX_CONCURRENCY_ENV)
+    if cap and cap.isdigit() and int(cap) > 0:
+        return min(concurrency, int(cap))
+    return concurrency
+
+
+class HostLimits:
+    """The token bucket and in-flight cap shared by every client of one API host.
+
+    The bucket starts at the rate of the first client for the host, after which the API's
+    rate-limit headers set it. The cap is the largest concurrency any of the clients asked
+    for, so two jobs on the same host share it rather than doubling it.
+    """
+
+    def __init__(self, rate, concurrency):
+        self.limiter = TokenBucket(rate=rate, capacity=concurrency)
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def raise_concurrency(self, concurrency):
+        if concurrency <= self.concurrency:
+            return
+        if self._semaphore is not None:
+            # Hand the new slots to the current loop's semaphore, whose waiters may be using it
+            for _ in range(concurrency - self.concurrency):
+                self._semaphore.release()
+        self.concurrency = concurrency
+
+    def semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            # Like the bucket's lock, the limits outlive asyncio.run(), so each new loop gets its own
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+
+# HostLimits by scheme://host[:port], shared by every ApiClient in the process
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def host_limits(url, rate, concurrency):
+    """The HostLimits of the host `url` points at, created on the first request to it."""
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _host_limits_lock:
+        limits = _host_limits.get(key)
+        if limits is None:
+            limits = _host_limits[key] = HostLimits(rate, concurrency)
+        else:
+            limits.raise_concurrency(concurrency)
+        return limits
+
+
+class LatencyHistogram:
+    """Request latencies of one endpoint, bucketed by LATENCY_BUCKETS."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, ok=True):
+        index = 0
+        while index < len(self.bounds) and seconds > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.errors += not ok
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of requests (the max for the last one)."""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'meanMs': round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            'p50Ms': round(self.percentile(0.5) * 1000, 1),
+            'p95Ms': round(self.percentile(0.95) * 1000, 1),
+            'maxMs': round(self.max * 1000, 1),
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['inf'], self.counts)),
+        }
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        return (f"{self.count} requests, {self.errors} failed, mean {mean * 1000:.0f} ms, "
+                f"p50 <= {self.percentile(0.5) * 1000:.0f} ms, p95 <= {self.percentile(0.95) * 1000:.0f} ms, "
+                f"max {self.max * 1000:.0f} ms")
+
+
+class ApiClient:
+    """Pooled keep-alive HTTP client for one API, with sync and async facades.
+
+    Every request waits for its host's token bucket, which follows the API's rate-limit
+    headers, and for its host's concurrency cap; both are shared with the other clients of
+    that host (see HostLimits), so jobs in one process share the API's budget. Connection errors, timeouts and 5xx responses are
+    retried with jittered exponential backoff; a 429 blocks the bucket for Retry-After (or
+    the rate-limit reset). With `adaptive_rate` as (min_rate, max_rate, step), for APIs that
+    send no rate-limit headers, a 429 also halves the rate and each success raises it a step.
+    Latencies are recorded per endpoint and printed by `report`; the client is included in
+    the current run_metrics run, if any.
+
+    Async requests need the client entered with `async with client:`, which opens one
+    aiohttp session shared by everything running inside it.
+    """
+
+    def __init__(self, name, rate, concurrency=1, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 headers=None, adaptive_rate=None):
+        self.name = name
+        self.concurrency = concurrency_cap(concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.headers = dict(headers or {})
+        self.adaptive_rate = adaptive_rate
+        self.rate = rate
+        self.histograms = {}
+        self.retries = 0
+        # Content-Length (compressed bytes on the wire) when sent, else the body bytes read
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._session = None
+        self._async_session = None
+        self._async_users = 0
+        track_http_client(self)
+
+    @property
+    def session(self):
+        """requests.Session with a connection pool sized to the concurrency, created on first use."""
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        if self._async_users == 0:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self._async_users += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._async_users -= 1
+        if self._async_users == 0:
+            await self._async_session.close()
+            self._async_session = None
+
+    def _request_headers(self, headers):
+        return {**self.headers, **(headers or {})} or None
+
+    def _observe(self, url, endpoint, seconds, ok):
+        endpoint = endpoint or urlsplit(url).path
+        histogram = self.histograms.get(endpoint)
+        if histogram is None:
+            histogram = self.histograms[endpoint] = LatencyHistogram()
+        histogram.observe(seconds, ok)
+
+    def _count_response(self, response, streamed=False):
+        """Add a response's size to bytes_received.
+
+        Its Content-Length when it sent one; otherwise the body bytes read, which for a
+        streamed response are counted as iter_content reads them.
+        """
+        length = content_length(response.headers)
+        if length is not None:
+            self.bytes_received += length
+        elif isinstance(response, CachedResponse):
+            self.bytes_received += response.size
+        elif not streamed:
+            self.bytes_received += len(response.content)
+
+    def iter_content(self, response, chunk_size):
+        """Iterate the body of a response from `get(..., stream=True)`, counting the bytes read.
+
+        Only responses without a Content-Length are counted here; the rest already were.
+        """
+        counted = content_length(response.headers) is not None
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not counted:
+                self.bytes_received += len(chunk)
+            yield chunk
+
+    def _should_retry(self, limiter, url, status_code, headers, attempt):
+        """Feed a response to the rate limiter and decide whether to send the request again.
+
+        Returns the seconds to sleep before retrying (0 when the limiter already waits), or None.
+        """
+        limiter.update_from_headers(headers)
+        if status_code == 429:
+            if self.adaptive_rate:
+                limiter.slow_down(self.adaptive_rate[0])
+            if attempt >= self.max_retries:
+                return None
+            delay = retry_after_seconds(headers)
+            log.warning("Rate limited by the %s API on %s, backing off for %s seconds...", self.name, url, delay)
+            limiter.block(delay)
+            self.retries += 1
+            return 0
+        if self.adaptive_rate and status_code < 400:
+            limiter.speed_up(self.adaptive_rate[1], self.adaptive_rate[2])
+        if status_code in RETRY_STATUSES and attempt < self.max_retries:
+            self.retries += 1
+            return backoff_delay(attempt)
+        return None
+
+    def _send(self, url, endpoint, send, sent_bytes=0, streamed=False):
+        limits = host_limits(url, self.rate, self.concurrency)
+        for attempt in range(self.max_retries + 1):
+            limits.limiter.acquire_blocking()
+            start = time.monotonic()
+            self.bytes_sent += sent_bytes
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe(url, endpoint, time.monotonic() - start, False)
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(backoff_delay(attempt))
+                continue
+            self._observe(url, endpoint, time.monotonic() - start, response.status_code < 500)
+            self._count_response(response, streamed)
+
+            delay = self._should_retry(limits.limiter, url, response.status_code, response.headers, attempt)
+            if delay is None:
+                return response
+            if hasattr(response, 'close'):
+                response.close()
+            time.sleep(delay)
+
+    async def _send_async(self, url, endpoint, send, sent_bytes=0):
+        limits = host_limits(url, self.rate, self.concurrency)
+        for attempt in range(self.max_retries + 1):
+            await limits.limiter.acquire()
+            start = time.monotonic()
+            self.bytes_sent += sent_bytes
+            try:
+                async with limits.semaphore():
+                    response = await send()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._observe(url, endpoint, time.monotonic() - start, False)
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            self._observe(url, endpoint, time.monotonic() - start, response.status_code < 500)
+            self._count_response(response)
+
+            delay = self._should_retry(limits.limiter, url, response.status_code, response.headers, attempt)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+
+    def get(self, url, headers=None, endpoint=None, stream=False):
+        """GET through the pooled session, returning the requests.Response.
+
+        Read a streamed body through `iter_content` so its bytes are counted.
+        """
+        headers = self._request_headers(headers)
+        return self._send(url, endpoint, lambda: self.session.get(
+            url, headers=headers, timeout=self.timeout, stream=stream
+        ), request_size('GET', url, headers), stream)
+
+    def get_json(self, url, cache=None, headers=None, endpoint=None, defer_commit=False):
+        """fetch_json through the pooled session, with the client's rate limiting and retries."""
+        headers = self._request_headers(headers)
+        return self._send(url, endpoint, lambda: fetch_json(
+            url, cache, headers=headers, session=self.session, timeout=self.timeout, defer_commit=defer_commit
+        ), request_size('GET', url, headers))
+
+    async def get_json_async(self, url, cache=None, headers=None, endpoint=None, defer_commit=False):
+        """Async counterpart of get_json; the client must be entered with `async with`."""
+        headers = self._request_headers(headers)
+        return await self._send_async(url, endpoint, lambda: fetch_json_async(
+            self._async_session, url, cache, headers=headers, defer_commit=defer_commit
+        ), request_size('GET', url, headers))
+
+    def stats(self):
+        """Request, retry and byte counts and per-endpoint latencies, for run summaries."""
+        return {
+            'name': self.name,
+            'requests': sum(histogram.count for histogram in self.histograms.values()),
+            'retries': self.retries,
+            'bytesSent': self.bytes_sent,
+            'bytesReceived': self.bytes_received,
+            'endpoints': {endpoint: histogram.as_dict() for endpoint, histogram in self.histograms.items()},
+        }
+
+    def report(self):
+        """Print the request count, retries and latency histogram summary of every endpoint."""
+        total = sum(histogram.count for histogram in self.histograms.values())
+        log.info("%s API: %d requests, %d retries, %d bytes sent, %d bytes received.", self.name, total,
+                 self.retries, self.bytes_sent, self.bytes_received)
+        for endpoint, histogram in sorted(self.histograms.items()):
+            log.info("  %s: %s", endpoint, histogram.summary())
+
+
+def wynncraft_client(concurrency=1, rate=WYNNCRAFT_REQUEST_RATE, timeout=DEFAULT_TIMEOUT):
+    """Client for the Wynncraft API, authenticated with WYNNCRAFT_API_KEY when it is set."""
+    api_key = os.getenv(WYNNCRAFT_API_KEY_ENV)
+    headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+    return ApiClient('Wynncraft', rate, concurrency, timeout, headers=headers)
@@ -1,8 +1,19 @@
+import argparse
 import time
-from pymongo import MongoClient
-import requests
 import json
+import logging
 import os
+from http_cache import get_response_cache
+from http_client import ITEM_DATABASE_TIMEOUT, wynncraft_client
+from item_snapshot import SnapshotWriter, iter_snapshot_items, load_index, migrate_from_json, snapshot_exists
+from item_stream import CHUNK_SIZE, iter_items
+from mongo_client import get_db
+from run_logging import setup_logging
+from run_metrics import count, fail_run, job_run, phase
+from structural_diff import IGNORED_ITEM_PATHS, modify_event
+
+log = logging.getLogger('item_detection')
+
 # from dotenv import load_dotenv
 # load_dotenv()
 
@@ -10,29 +21,22 @@ import os
 API_URL = "https://api.wynncraft.com/v3/item/database?fullResult"
 
 # MongoDB Configuration
-DB_NAME = "wynnpool"
 COLLECTION_ITEM_CHANGELOG = "item_changelog"
 
-# MongoDB Connection
-mongodb_uri = os.getenv("MONGODB_URI")
-client = MongoClient(mongodb_uri)
-db = client[DB_NAME]
-item_changelog_collection = db[COLLECTION_ITEM_CHANGELOG]
-
-# Path to store the previous data
-DATA_FILE = "previous_item_data.json"
+# Directory holding the previous item snapshot (hash index + compressed items)
+SNAPSHOT_DIR = "item_snapshot"
+# Pretty-printed JSON file the previous data used to be kept in, migrated on first run
+LEGACY_DATA_FILE = "previous_item_data.json"
 
 
 # Function to fetch the data from the API
-def fetch_data():
-    api_key = os.getenv("WYNNCRAFT_API_KEY")
-    headers = {}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
-
-    response = requests.get(API_URL, headers=headers)
+# With a response cache, returns None when the database is unchanged since the last saved run
+def fetch_data(api, cache=None):
+    response = api.get_json(API_URL, cache, endpoint="item/database", defer_commit=True)
     if response.status_code == 200:
-        data = response.json()
+        if response.unchanged:
+            return None
+        data = response.data
         # API returns a list; index by internalName for consistent lookup
         if isinstance(data, list):
             return {
@@ -43,19 +47,24 @@ def fetch_data():
         raise Exception(f"Failed to fetch data. Status code: {response.status_code}")
 
 
-# Function to load previous data from the file, if it exists
-def load_previous_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as file:
-            return json.load(file)
-    else:
-        return {}
+# Function to stream the data from the API as (internalName, item) pairs
+def stream_data(api):
+    response = api.get(API_URL, endpoint="item/database", stream=True)
+    try:
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch data. Status code: {response.status_code}")
+        yield from iter_items(api.iter_content(response, CHUNK_SIZE))
+    finally:
+        response.close()
 
 
-# Function to save current data to a file for future comparisons
-def save_current_data(data):
-    with open(DATA_FILE, "w") as file:
-        json.dump(data, file, indent=4)
+# Function to convert the legacy previous data file into a snapshot, once
+def migrate_legacy_data():
+    if snapshot_exists(SNAPSHOT_DIR) or not os.path.exists(LEGACY_DATA_FILE):
+        return
+    count = migrate_from_json(LEGACY_DATA_FILE, SNAPSHOT_DIR)
+    os.remove(LEGACY_DATA_FILE)
+    log.info("Migrated %d items from %s to %s/.", count, LEGACY_DATA_FILE, SNAPSHOT_DIR)
 
 
 # Function to compare previous and current data
@@ -104,71 +113,108 @@ def compare_items(previous_data, current_data, timestamp):
         prev_item = previous_by_internal[item_id]
         curr_item = current_by_internal[item_id]
 
-        if prev_item == curr_item:
+        # Store only the fields that changed, ignoring ones like icon.value.customModelData
+        delta = modify_event(prev_item, curr_item, IGNORED_ITEM_PATHS)
+        if delta is None:
             continue
 
-        # Ensure both items are dictionaries before attempting key removal
-        if isinstance(prev_item, dict) and isinstance(curr_item, dict):
-            # Deep copy to avoid modifying the original data
-            temp_prev = prev_item.copy()
-            temp_curr = curr_item.copy()
-
-            # Safely remove customModelData if present
-            try:
-                if "icon" in temp_prev and "icon" in temp_curr:
-                    if "value" in temp_prev["icon"] and "value" in temp_curr["icon"]:
-                        if isinstance(temp_prev["icon"]["value"], dict) and isinstance(
-                            temp_curr["icon"]["value"], dict
-                        ):
-                            temp_prev["icon"]["value"].pop("customModelData", None)
-                            temp_curr["icon"]["value"].pop("customModelData", None)
-            except (KeyError, TypeError):
-                pass  # Ignore errors if the structure is incorrect
-
-            # If the items are now identical after ignoring customModelData, skip it
-            if temp_prev == temp_curr:
-                continue
-
-        # Otherwise, register the modification
         item_change = {
             "itemName": item_id,
             "status": "modify",
             "timestamp": timestamp,
-            "before": prev_item,
-            "after": curr_item,
+            **delta,
         }
         changes.append(item_change)
 
     return changes
 
 
-def main():
+# Function to compare items against the previous snapshot while writing the new one
+# Only items whose content hash differs are deep-compared; the previous snapshot is read back
+# just for those. Returns the changes and the writer, to be committed once they are stored
+def compare_with_snapshot(current_items, timestamp):
+    previous_index = load_index(SNAPSHOT_DIR)
+
+    current_subset = {}
+    writer = SnapshotWriter(SNAPSHOT_DIR)
     try:
-        # Fetch the current data
-        current_data = fetch_data()
+        for name, item in current_items:
+            if previous_index.get(name) != writer.write(name, item):
+                current_subset[name] = item
 
-        # Load the previous data
-        previous_data = load_previous_data()
+        wanted = set(current_subset) | (previous_index.keys() - writer.index.keys())
+        previous_subset = {}
+        if wanted & previous_index.keys():
+            previous_subset = dict(iter_snapshot_items(SNAPSHOT_DIR, wanted))
+
+        return compare_items(previous_subset, current_subset, timestamp), writer
+    except BaseException:
+        # Includes KeyboardInterrupt, so an interrupted run leaves no half-written snapshot behind
+        writer.abort()
+        raise
 
-        # Generate a consistent timestamp for all changes in this update
-        timestamp = int(time.time())
 
-        # Compare the previous and current data
-        changes = compare_items(previous_data, current_data, timestamp)
+def main(stream=False):
+    try:
+        cache = None if stream else get_response_cache()
+        api = wynncraft_client(timeout=ITEM_DATABASE_TIMEOUT)
+        migrate_legacy_data()
+
+        # Fetch the current data, streamed or whole
+        if stream:
+            current_items = stream_data(api)
+        else:
+            with phase("fetch"):
+                current_data = fetch_data(api, cache)
+            if current_data is None:
+                log.info("Item database is unchanged since the last run, nothing to compare.")
+                cache.report()
+                return
+            current_items = (
+                (item["internalName"], item) for item in current_data.values() if "internalName" in item
+            )
 
-        if changes:
-            # Insert changes into MongoDB
-            item_changelog_collection.insert_many(changes)
-            print(f"Stored {len(changes)} item changes into the database.")
-            print("CHANGES_FOUND")
+        # Generate a consistent timestamp for all changes in this update
+        timestamp = int(time.time())
 
-        # Save the current data for future comparisons
-        save_current_data(current_data)
-        print("New item datasets saved!")
+        # Compare the current data against the previous snapshot
+        # Streamed items are downloaded as they are compared, so the diff phase includes the fetch
+        with phase("diff"):
+            changes, writer = compare_with_snapshot(current_items, timestamp)
+        count("item_changes", len(changes))
+
+        try:
+            if changes:
+                # Insert changes into MongoDB
+                with phase("db_write"):
+                    get_db()[COLLECTION_ITEM_CHANGELOG].insert_many(changes)
+                log.info("Stored %d item changes into the database.", len(changes))
+                # Marker the item-changelog workflow greps for, so it is printed whatever the log level or format
+                print("CHANGES_FOUND")
+
+            # Keep the new snapshot for future comparisons
+            with phase("snapshot_write"):
+                writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        log.info("New item datasets saved!")
+
+        if cache:
+            cache.commit(API_URL)
+            cache.report()
 
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Detect item changes and store them in the item changelog.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse the API response incrementally instead of loading it whole.")
+    args = parser.parse_args()
+
+    setup_logging("item_detection")
+    with job_run("item_detection", get_db()):
+        main(stream=args.stream)
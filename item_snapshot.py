@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+
+from item_stream import canonical_hash, canonical_json, iter_file_chunks, iter_items
+
+# A snapshot is a directory holding a sorted internalName -> content hash index and the items
+# themselves as gzip-compressed NDJSON
+INDEX_FILE = "index.json"
+ITEMS_FILE = "items.ndjson.gz"
+
+
+def _paths(directory):
+    return os.path.join(directory, INDEX_FILE), os.path.join(directory, ITEMS_FILE)
+
+
+def snapshot_exists(directory):
+    return all(os.path.exists(path) for path in _paths(directory))
+
+
+def load_index(directory):
+    """Load the internalName -> content hash index, or an empty one when there is no snapshot."""
+    index_path, _ = _paths(directory)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r") as file:
+        return json.load(file)
+
+
+def iter_snapshot_items(directory, names=None):
+    """Yield (internalName, item) from the snapshot, optionally only for the given names."""
+    _, items_path = _paths(directory)
+    with gzip.open(items_path, "rt", encoding="utf-8") as file:
+        for line in file:
+            item = json.loads(line)
+            name = item.get("internalName")
+            if names is None or name in names:
+                yield name, item
+
+
+class SnapshotWriter:
+    """Writes a new snapshot next to the current one; `commit` swaps it in."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}
+        self.index_path, self.items_path = _paths(directory)
+        # mtime=0 keeps the archive byte-identical when the items are, so git sees no change
+        self._raw = open(self.items_path + ".tmp", "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0)
+
+    def write(self, name, item):
+        """Append an item and return its content hash."""
+        line = canonical_json(item)
+        content_hash = canonical_hash(line)
+        self._file.write(line + b"\n")
+        self.index[name] = content_hash
+        return content_hash
+
+    def _close(self):
+        if not self._raw.closed:
+            self._file.close()
+            self._raw.close()
+
+    def commit(self):
+        """Replace the current snapshot with the one written so far."""
+        self._close()
+        with open(self.index_path + ".tmp", "w") as file:
+            json.dump(self.index, file, sort_keys=True, indent=0)
+        os.replace(self.items_path + ".tmp", self.items_path)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def abort(self):
+        """Throw the new snapshot away, leaving the current one untouched. Safe to call twice."""
+        self._close()
+        for path in (self.items_path + ".tmp", self.index_path + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def migrate_from_json(json_path, directory):
+    """One-time conversion of a previous_item_data.json file into a snapshot directory."""
+    writer = SnapshotWriter(directory)
+    try:
+        for name, item in iter_items(iter_file_chunks(json_path)):
+            writer.write(name, item)
+        writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    return len(writer.index)
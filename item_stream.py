@@ -0,0 +1,143 @@
+import codecs
+import hashlib
+import json
+
+# Bytes read per chunk when streaming files and HTTP responses
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield a file's contents in binary chunks."""
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _iter_text(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class _JsonStreamReader:
+    """Decodes consecutive JSON values out of a stream of text chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = _iter_text(chunks)
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        # Drop what has been consumed so the buffer stays around one value in size
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def next_char(self):
+        """Consume and return the next non-whitespace character, or None at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                char = self.buffer[self.pos]
+                self.pos += 1
+                return char
+            if not self._fill():
+                return None
+
+    def peek_char(self):
+        char = self.next_char()
+        if char is not None:
+            self.pos -= 1
+        return char
+
+    def decode_value(self):
+        """Decode the next complete JSON value, reading more chunks until it is whole."""
+        self.peek_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number running up to the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_members(chunks):
+    """Yield (key, value) for every member of a top-level JSON object, or (None, value) for an array.
+
+    Only one member is decoded at a time, so memory stays proportional to the largest member
+    rather than to the whole document.
+    """
+    reader = _JsonStreamReader(chunks)
+    opening = reader.next_char()
+    if opening == '{':
+        closing, keyed = '}', True
+    elif opening == '[':
+        closing, keyed = ']', False
+    else:
+        raise ValueError(f"Expected a JSON object or array, got {opening!r}")
+
+    if reader.peek_char() == closing:
+        reader.next_char()
+        return
+
+    while True:
+        key = None
+        if keyed:
+            key = reader.decode_value()
+            if reader.next_char() != ':':
+                raise ValueError(f"Expected ':' after key {key!r}")
+        yield key, reader.decode_value()
+
+        separator = reader.next_char()
+        if separator == closing:
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or {closing!r}, got {separator!r}")
+
+
+def iter_items(chunks):
+    """Yield (internalName, item) for every item in an item database list or internalName-keyed object."""
+    for _, item in iter_json_members(chunks):
+        if isinstance(item, dict) and 'internalName' in item:
+            yield item['internalName'], item
+
+
+def canonical_json(item):
+    """An item's canonical JSON encoding, the bytes its content hash is taken over."""
+    return json.dumps(item, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def canonical_hash(canonical):
+    """Content hash of a canonical_json encoding."""
+    return hashlib.sha1(canonical).hexdigest()
+
+
+def item_hash(item):
+    """Hash an item's canonical JSON, so unchanged items can be recognised without keeping them."""
+    return canonical_hash(canonical_json(item))
+
@@ -0,0 +1,84 @@
+from pymongo import DeleteMany, UpdateOne
+
+from guild_members import iter_guild_members
+
+# Collections
+COLLECTION_GUILD_DATA = 'guild_data'
+COLLECTION_MEMBER_INDEX = 'guild_member_index'  # player UUID -> guild it belongs to
+COLLECTION_MEMBER_INDEX_STATE = 'guild_member_index_state'  # guild UUID -> indexed snapshot version
+
+# Guilds re-indexed per bulk write, and online UUIDs looked up per query
+REINDEX_BATCH_SIZE = 200
+LOOKUP_BATCH_SIZE = 1000
+
+
+def guild_version(guild):
+    """Identify a stored guild snapshot, so only guilds whose snapshot changed are re-indexed."""
+    return guild.get('contentHash') or guild.get('timestamp')
+
+
+def reindex_guilds(db, guild_uuids):
+    """Rewrite the index entries of the given guilds from their current guild_data documents."""
+    index_operations = []
+    state_operations = []
+    projection = {'uuid': 1, 'name': 1, 'members': 1, 'contentHash': 1, 'timestamp': 1}
+
+    for guild in db[COLLECTION_GUILD_DATA].find({'uuid': {'$in': guild_uuids}}, projection):
+        guild_uuid = guild['uuid']
+        member_uuids = []
+        for uuid, username in iter_guild_members(guild):
+            member_uuids.append(uuid)
+            index_operations.append(UpdateOne(
+                {'_id': uuid},
+                {'$set': {'guild_uuid': guild_uuid, 'guild_name': guild.get('name'), 'username': username}},
+                upsert=True
+            ))
+        # Members who left are dropped; members who moved guild already point elsewhere
+        index_operations.append(DeleteMany({'guild_uuid': guild_uuid, '_id': {'$nin': member_uuids}}))
+        state_operations.append(UpdateOne({'_id': guild_uuid}, {'$set': {'version': guild_version(guild)}}, upsert=True))
+
+    if index_operations:
+        db[COLLECTION_MEMBER_INDEX].bulk_write(index_operations, ordered=False)
+    if state_operations:
+        db[COLLECTION_MEMBER_INDEX_STATE].bulk_write(state_operations, ordered=False)
+
+
+def refresh_member_index(db):
+    """Bring the member index up to date with guild_data.
+
+    Only guilds whose snapshot version differs from the indexed one are re-read, so a run
+    where no guild changed costs one small projection over guild_data. Returns the number of
+    re-indexed and removed guilds.
+    """
+    index_collection = db[COLLECTION_MEMBER_INDEX]
+    state_collection = db[COLLECTION_MEMBER_INDEX_STATE]
+    index_collection.create_index('guild_uuid')
+
+    indexed_versions = {doc['_id']: doc.get('version') for doc in state_collection.find({}, {'version': 1})}
+    changed_guilds = []
+    current_guilds = set()
+    for guild in db[COLLECTION_GUILD_DATA].find({}, {'uuid': 1, 'contentHash': 1, 'timestamp': 1}):
+        guild_uuid = guild.get('uuid')
+        if not guild_uuid:
+            continue
+        current_guilds.add(guild_uuid)
+        if guild_uuid not in indexed_versions or indexed_versions[guild_uuid] != guild_version(guild):
+            changed_guilds.append(guild_uuid)
+
+    for start in range(0, len(changed_guilds), REINDEX_BATCH_SIZE):
+        reindex_guilds(db, changed_guilds[start:start + REINDEX_BATCH_SIZE])
+
+    removed_guilds = [guild_uuid for guild_uuid in indexed_versions if guild_uuid not in current_guilds]
+    if removed_guilds:
+        index_collection.delete_many({'guild_uuid': {'$in': removed_guilds}})
+        state_collection.delete_many({'_id': {'$in': removed_guilds}})
+
+    return len(changed_guilds), len(removed_guilds)
+
+
+def find_guild_members(db, player_uuids):
+    """Yield the index entries ({_id, guild_uuid, guild_name, username}) of players in a guild."""
+    player_uuids = list(player_uuids)
+    index_collection = db[COLLECTION_MEMBER_INDEX]
+    for start in range(0, len(player_uuids), LOOKUP_BATCH_SIZE):
+        yield from index_collection.find({'_id': {'$in': player_uuids[start:start + LOOKUP_BATCH_SIZE]}})
@@ -0,0 +1,50 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+MONGODB_URI_ENV = 'MONGODB_URI'
+DB_NAME = 'wynnpool'
+
+# Connections kept per MongoDB server. Jobs write from the event loop and a few executor
+# threads, so the driver's default of 100 would mostly be idle sockets
+MAX_POOL_SIZE_ENV = 'MONGODB_MAX_POOL_SIZE'
+DEFAULT_MAX_POOL_SIZE = 20
+# Pooled connections idle for longer than this are closed
+MAX_IDLE_TIME_MS = 5 * 60 * 1000
+
+_client = None
+_db = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """The process's one MongoClient, connected to MONGODB_URI on first use.
+
+    Every job module shares it, so jobs run in the same process share one connection pool.
+    """
+    global _client, _db
+    if _client is None:
+        with _lock:
+            if _client is None:
+                max_pool_size = int(os.getenv(MAX_POOL_SIZE_ENV, DEFAULT_MAX_POOL_SIZE))
+                client = MongoClient(os.getenv(MONGODB_URI_ENV), maxPoolSize=max_pool_size,
+                                     maxIdleTimeMS=MAX_IDLE_TIME_MS)
+                _db = client[DB_NAME]
+                _client = client
+    return _client
+
+
+def get_db():
+    """The wynnpool database on the shared client."""
+    if _db is None:
+        get_client()
+    return _db
+
+
+def use_client(client, db_name=DB_NAME):
+    """Point every job at `client` and its `db_name` database instead, e.g. a scratch database."""
+    global _client, _db
+    with _lock:
+        _client = client
+        _db = client[db_name]
@@ -0,0 +1,303 @@
+import argparse
+import logging
+import time
+import uuid as uuid_lib
+
+from pymongo import ASCENDING, DESCENDING, UpdateMany, UpdateOne
+
+from member_index import find_guild_members
+from mongo_client import get_db
+from name_resolver import DEFAULT_CONCURRENCY, NameResolver, normalize_uuid
+from run_logging import setup_logging
+from run_metrics import count, job_run, phase
+
+log = logging.getLogger('name_refresh_queue')
+
+# Collections
+COLLECTION_NAME_REFRESH_QUEUE = 'name_refresh_queue'  # normalized UUID -> refresh schedule
+COLLECTION_NAME_REFRESH_STATE = 'name_refresh_queue_state'  # when reprioritize last ran
+COLLECTION_GUILD_LAST_SEEN = 'guild_last_seen'
+
+# Collections holding Minecraft names to keep fresh: collection -> (uuid field, name field)
+NAME_SOURCES = {
+    'verified_item_data': ('uuid', 'owner'),
+    'users': ('minecraftProfile.uuid', 'minecraftProfile.name'),
+}
+
+# Players seen online within ACTIVE_WINDOW are refreshed daily, everyone else monthly
+ACTIVE_WINDOW = 7 * 24 * 60 * 60
+ACTIVE_REFRESH_INTERVAL = 24 * 60 * 60
+IDLE_REFRESH_INTERVAL = 30 * 24 * 60 * 60
+
+# Mojang lookups per run, claimed CLAIM_BATCH_SIZE at a time; a claim is held for LEASE_SECONDS
+DEFAULT_BUDGET = 5000
+CLAIM_BATCH_SIZE = 100
+LEASE_SECONDS = 10 * 60
+# A lookup that failed is retried after this long, rather than again in the same run
+FAILED_RETRY_DELAY = 60 * 60
+WRITE_BATCH_SIZE = 1000
+LOOKUP_BATCH_SIZE = 1000
+
+# State document recording when reprioritize last ran
+REPRIORITIZE_STATE_ID = 'reprioritize'
+# guild_last_seen updates this much older than the last reprioritize are read again, in case a
+# last-seen write was still landing when that run read the collection
+PRESENCE_OVERLAP = 10 * 60
+
+
+def dashed_uuid(key):
+    """Turn a normalized UUID back into the dashed form Wynncraft uses."""
+    return f"{key[:8]}-{key[8:12]}-{key[12:16]}-{key[16:20]}-{key[20:]}"
+
+
+def refresh_interval(last_seen, now):
+    if last_seen and now - last_seen < ACTIVE_WINDOW:
+        return ACTIVE_REFRESH_INTERVAL
+    return IDLE_REFRESH_INTERVAL
+
+
+def get_path(doc, path):
+    for key in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+class NameRefreshQueue:
+    """UUIDs due for a Minecraft name refresh, shared by every collection in NAME_SOURCES.
+
+    Each entry records the UUID's spellings and source collections, when its name was last
+    refreshed and when its player was last seen online. Entries are claimed in due_at order,
+    so the stalest names of the most active players go first, and under a lease, so a run that
+    dies halfway leaves the rest of its work for the next one.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[COLLECTION_NAME_REFRESH_QUEUE]
+        self.state_collection = db[COLLECTION_NAME_REFRESH_STATE]
+
+    def setup(self):
+        self.collection.create_index([('due_at', ASCENDING), ('last_seen', DESCENDING)])
+        self.collection.create_index('lease_owner')
+
+    def _flush(self, operations):
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        return []
+
+    def _source_spellings(self, source, uuid_field):
+        """Normalized UUID -> the spellings of it that `source` documents currently hold."""
+        pipeline = [
+            {'$match': {uuid_field: {'$exists': True, '$ne': None}}},
+            {'$group': {'_id': f'${uuid_field}'}},
+        ]
+        spellings = {}
+        for doc in self.db[source].aggregate(pipeline):
+            if isinstance(doc['_id'], str) and doc['_id']:
+                spellings.setdefault(normalize_uuid(doc['_id']), set()).add(doc['_id'])
+        return spellings
+
+    def discover(self):
+        """Bring the queue in line with the UUIDs the sources currently hold.
+
+        Each source's distinct UUIDs are diffed against the queue, so profiles linked onto
+        existing documents and changed UUIDs are queued too. Entries no source references any
+        more are dropped. Returns the number of UUIDs added or given new spellings.
+        """
+        added = 0
+        unreferenced = set()
+        for source, (uuid_field, _) in NAME_SOURCES.items():
+            spellings = self._source_spellings(source, uuid_field)
+            queued = {doc['_id']: set(doc.get('forms', ())) for doc in self.collection.find({'sources': source},
+                                                                                           {'forms': 1})}
+
+            operations = []
+            for key, forms in spellings.items():
+                if key in queued and forms <= queued[key]:
+                    continue
+                operations.append(UpdateOne(
+                    {'_id': key},
+                    {
+                        '$addToSet': {'forms': {'$each': sorted(forms)}, 'sources': source},
+                        '$setOnInsert': {'refreshed_at': 0, 'last_seen': 0, 'due_at': 0},
+                    },
+                    upsert=True
+                ))
+                added += 1
+                if len(operations) >= WRITE_BATCH_SIZE:
+                    operations = self._flush(operations)
+            for key in queued.keys() - spellings.keys():
+                unreferenced.add(key)
+                operations.append(UpdateOne({'_id': key}, {'$pull': {'sources': source}}))
+                if len(operations) >= WRITE_BATCH_SIZE:
+                    operations = self._flush(operations)
+            self._flush(operations)
+
+        removed = 0
+        unreferenced = list(unreferenced)
+        for start in range(0, len(unreferenced), LOOKUP_BATCH_SIZE):
+            batch = unreferenced[start:start + LOOKUP_BATCH_SIZE]
+            removed += self.collection.delete_many({'_id': {'$in': batch}, 'sources': {'$size': 0}}).deleted_count
+        if removed:
+            log.info("Dropped %d UUIDs no source references any more.", removed)
+        return added
+
+    def _last_seen_times(self, keys):
+        """When each queued player was last seen online, from guild_last_seen via the member index."""
+        guild_members = {}
+        for entry in find_guild_members(self.db, [dashed_uuid(key) for key in keys]):
+            guild_members.setdefault(entry['guild_uuid'], []).append(entry['_id'])
+
+        last_seen = {}
+        cursor = self.db[COLLECTION_GUILD_LAST_SEEN].find(
+            {'guild_uuid': {'$in': list(guild_members)}}, {'guild_uuid': 1, 'members': 1}
+        )
+        for guild in cursor:
+            members = guild.get('members') or {}
+            for member_uuid in guild_members.get(guild['guild_uuid'], ()):
+                seen = (members.get(member_uuid) or {}).get('lastSeen')
+                if seen:
+                    last_seen[normalize_uuid(member_uuid)] = seen
+        return last_seen
+
+    def _presence_since(self, since):
+        """When each player seen online after `since` was last seen, from the guild_last_seen
+        documents updated after it."""
+        last_seen = {}
+        cursor = self.db[COLLECTION_GUILD_LAST_SEEN].find({'updated_at': {'$gt': since}}, {'members': 1})
+        for guild in cursor:
+            for member_uuid, member in (guild.get('members') or {}).items():
+                seen = (member or {}).get('lastSeen')
+                if seen and seen > since:
+                    key = normalize_uuid(member_uuid)
+                    last_seen[key] = max(seen, last_seen.get(key, 0))
+        return last_seen
+
+    def reprioritize(self, now):
+        """Refresh last_seen and recompute due_at = refreshed_at + interval, holding back entries
+        whose last lookup failed until their retry_at.
+
+        After the first run only due entries, whose interval may have run out or which were
+        just discovered, and entries whose player was seen since the last run are read; every
+        other entry's due_at is still right.
+        """
+        state = self.state_collection.find_one({'_id': REPRIORITIZE_STATE_ID}) or {}
+        since = state.get('reprioritized_at')
+        projection = {'refreshed_at': 1, 'last_seen': 1, 'due_at': 1, 'retry_at': 1}
+
+        query = {} if since is None else {'due_at': {'$lte': now}}
+        entries = {entry['_id']: entry for entry in self.collection.find(query, projection)}
+        last_seen = self._last_seen_times(list(entries))
+        if since is not None:
+            presence = self._presence_since(since - PRESENCE_OVERLAP)
+            missing = [key for key in presence if key not in entries]
+            for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                batch = missing[start:start + LOOKUP_BATCH_SIZE]
+                for entry in self.collection.find({'_id': {'$in': batch}}, projection):
+                    entries[entry['_id']] = entry
+            for key, seen in presence.items():
+                last_seen[key] = max(seen, last_seen.get(key, 0))
+
+        operations = []
+        for entry in entries.values():
+            seen = max(entry.get('last_seen') or 0, last_seen.get(entry['_id'], 0))
+            due_at = max((entry.get('refreshed_at') or 0) + refresh_interval(seen, now), entry.get('retry_at') or 0)
+            if seen != entry.get('last_seen') or due_at != entry.get('due_at'):
+                operations.append(UpdateOne({'_id': entry['_id']}, {'$set': {'last_seen': seen, 'due_at': due_at}}))
+                if len(operations) >= WRITE_BATCH_SIZE:
+                    operations = self._flush(operations)
+        self._flush(operations)
+        self.state_collection.update_one(
+            {'_id': REPRIORITIZE_STATE_ID}, {'$set': {'reprioritized_at': now}}, upsert=True
+        )
+        count('entries_reprioritized', len(entries))
+
+    def claim(self, limit, now):
+        """Lease up to `limit` due entries, most overdue first."""
+        unleased = {'$or': [{'lease_until': {'$exists': False}}, {'lease_until': {'$lt': now}}]}
+        query = {'due_at': {'$lte': now}, **unleased}
+        keys = [
+            doc['_id'] for doc in
+            self.collection.find(query, {'_id': 1}).sort([('due_at', ASCENDING), ('last_seen', DESCENDING)]).limit(limit)
+        ]
+        if not keys:
+            return []
+
+        owner = uuid_lib.uuid4().hex
+        self.collection.update_many(
+            {'_id': {'$in': keys}, **unleased},
+            {'$set': {'lease_until': now + LEASE_SECONDS, 'lease_owner': owner}}
+        )
+        return list(self.collection.find({'lease_owner': owner}, {'forms': 1, 'sources': 1, 'last_seen': 1}))
+
+    def complete(self, entries, resolved_keys, now):
+        """Schedule the next refresh of resolved entries, retry the rest later, and release the leases."""
+        operations = []
+        for entry in entries:
+            update = {'$unset': {'lease_until': '', 'lease_owner': ''}}
+            if entry['_id'] in resolved_keys:
+                update['$unset']['retry_at'] = ''
+                update['$set'] = {
+                    'refreshed_at': now,
+                    'due_at': now + refresh_interval(entry.get('last_seen'), now),
+                }
+            else:
+                update['$set'] = {'due_at': now + FAILED_RETRY_DELAY, 'retry_at': now + FAILED_RETRY_DELAY}
+            operations.append(UpdateOne({'_id': entry['_id']}, update))
+        self._flush(operations)
+
+
+def apply_names(db, entries, names):
+    """Write resolved names to every source collection the entries came from."""
+    for source, (uuid_field, name_field) in NAME_SOURCES.items():
+        operations = [
+            UpdateMany({uuid_field: form, name_field: {'$ne': names[form]}}, {'$set': {name_field: names[form]}})
+            for entry in entries if source in entry.get('sources', ())
+            for form in entry.get('forms', ()) if form in names
+        ]
+        if operations:
+            with phase('db_write'):
+                result = db[source].bulk_write(operations, ordered=False)
+            log.info("Updated %d %s documents.", result.modified_count, source)
+
+
+def refresh_names(db, budget=DEFAULT_BUDGET, concurrency=DEFAULT_CONCURRENCY):
+    queue = NameRefreshQueue(db)
+    queue.setup()
+    log.info("Discovered %d UUIDs.", queue.discover())
+    queue.reprioritize(int(time.time()))
+
+    resolver = NameResolver(db, concurrency)
+    processed = 0
+    while processed < budget:
+        now = int(time.time())
+        entries = queue.claim(min(CLAIM_BATCH_SIZE, budget - processed), now)
+        if not entries:
+            break
+
+        forms = [form for entry in entries for form in entry.get('forms', ())]
+        names = resolver.resolve(forms)
+        apply_names(db, entries, names)
+
+        # Unknown profiles count as refreshed too; only lookups that failed stay due
+        failed = {normalize_uuid(form) for form in forms} - set(resolver.resolved_keys)
+        queue.complete(entries, {entry['_id'] for entry in entries} - failed, now)
+        processed += len(entries)
+
+    resolver.report()
+    count('uuids_refreshed', processed)
+    log.info("Refreshed %d queued UUIDs.", processed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the Minecraft names that are most likely to have changed.")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="Queued UUIDs to refresh this run.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    setup_logging("name_refresh")
+    db = get_db()
+    with job_run("name_refresh", db):
+        refresh_names(db, args.budget, args.concurrency)
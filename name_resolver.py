@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+
+from http_client import ApiClient
+from run_metrics import count, phase
+
+log = logging.getLogger('name_resolver')
+
+MOJANG_PROFILE_URL_TEMPLATE = 'https://sessionserver.mojang.com/session/minecraft/profile/{uuid}'
+
+# uuid -> (name, fetched_at), shared by every name script so a UUID is looked up once per TTL
+COLLECTION_NAME_CACHE = 'mojang_name_cache'
+NAME_CACHE_TTL = 24 * 60 * 60
+
+DEFAULT_CONCURRENCY = 4
+REQUEST_TIMEOUT = 15
+
+# Mojang sends no rate-limit headers, so the rate adapts: halved on a 429, nudged up on success
+INITIAL_REQUEST_RATE = 2
+MIN_REQUEST_RATE = 0.2
+MAX_REQUEST_RATE = 10
+REQUEST_RATE_STEP = 0.05
+
+
+def normalize_uuid(uuid):
+    """Mojang accepts UUIDs with or without dashes; cache them in one form."""
+    return str(uuid).replace('-', '').lower()
+
+
+class NameResolver:
+    """Resolves player UUIDs to their current Minecraft names through a persistent cache."""
+
+    def __init__(self, db, concurrency=DEFAULT_CONCURRENCY, ttl=NAME_CACHE_TTL):
+        self.cache_collection = db[COLLECTION_NAME_CACHE]
+        self.ttl = ttl
+        self.api = ApiClient('Mojang', INITIAL_REQUEST_RATE, concurrency, REQUEST_TIMEOUT,
+                             adaptive_rate=(MIN_REQUEST_RATE, MAX_REQUEST_RATE, REQUEST_RATE_STEP))
+        self.cached = 0
+        self.fetched = 0
+        self.failed = 0
+        self.resolved_keys = set()  # Normalized UUIDs the last resolve() got an answer for
+
+    def _cached_names(self, uuids, now):
+        """Cache entries fresher than the TTL, as {uuid: name}; name is None for unknown profiles."""
+        cursor = self.cache_collection.find(
+            {'_id': {'$in': list(uuids)}, 'fetched_at': {'$gte': now - self.ttl}},
+            {'name': 1}
+        )
+        return {doc['_id']: doc.get('name') for doc in cursor}
+
+    async def _fetch_name(self, uuid):
+        response = await self.api.get_json_async(MOJANG_PROFILE_URL_TEMPLATE.format(uuid=uuid), endpoint='profile')
+        if response.status_code == 200:
+            return response.data.get('name')
+        if response.status_code in (204, 404):
+            return None
+        raise Exception(f"Status code: {response.status_code}")
+
+    async def _fetch_names(self, uuids):
+        pending_uuids = iter(uuids)
+        names = {}
+
+        async def worker():
+            for uuid in pending_uuids:
+                try:
+                    names[uuid] = await self._fetch_name(uuid)
+                except Exception as e:
+                    self.failed += 1
+                    log.warning("Error resolving UUID %s: %s", uuid, e)
+
+        async with self.api:
+            await asyncio.gather(*(worker() for _ in range(self.api.concurrency)))
+        return names
+
+    def resolve(self, uuids):
+        """Map each UUID to its current name, leaving out UUIDs with no profile or that failed."""
+        keys = {uuid: normalize_uuid(uuid) for uuid in uuids if uuid}
+        wanted = set(keys.values())
+        now = int(time.time())
+
+        with phase('db_read'):
+            names = self._cached_names(wanted, now)
+        self.cached += len(names)
+        missing = sorted(wanted - names.keys())
+        if missing:
+            with phase('fetch'):
+                fetched = asyncio.run(self._fetch_names(missing))
+            self.fetched += len(fetched)
+            names.update(fetched)
+            if fetched:
+                with phase('db_write'):
+                    self.cache_collection.bulk_write([
+                        UpdateOne({'_id': uuid}, {'$set': {'name': name, 'fetched_at': now}}, upsert=True)
+                        for uuid, name in fetched.items()
+                    ], ordered=False)
+        count('names_resolved', len(names))
+
+        self.resolved_keys = set(names)
+        return {uuid: names[key] for uuid, key in keys.items() if names.get(key)}
+
+    def report(self):
+        log.info("Names: %d from cache, %d fetched from Mojang, %d failed.", self.cached, self.fetched, self.failed)
+        self.api.report()
@@ -0,0 +1,155 @@
+import datetime
+import os
+
+from pymongo import ASCENDING, UpdateOne
+
+# Collections, one per storage layout
+COLLECTION_GUILD_ONLINE_COUNT = 'guild_online_count'
+COLLECTION_GUILD_ONLINE_COUNT_SERIES = 'guild_online_count_series'
+COLLECTION_GUILD_ONLINE_COUNT_BUCKETS = 'guild_online_count_buckets'
+
+# Online count samples are kept for 14 days
+RETENTION_SECONDS = 14 * 24 * 60 * 60
+BUCKET_SECONDS = 24 * 60 * 60
+
+# Selects the storage layout: documents (one per guild per run), timeseries or buckets
+BACKEND_ENV = 'ONLINE_COUNT_BACKEND'
+
+
+def to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+class DocumentOnlineCountStore:
+    """The original layout: one document per guild per run, expired with a manual delete."""
+
+    def __init__(self, db):
+        self.collection = db[COLLECTION_GUILD_ONLINE_COUNT]
+
+    def setup(self):
+        pass  # The existing collection and its indexes are left as they are
+
+    def setup_indexes(self):
+        """Index read_series' lookups; a one-time build on a large collection (update_last_seen.py --setup)."""
+        self.collection.create_index([('guild_uuid', ASCENDING), ('timestamp', ASCENDING)])
+
+    def insert(self, samples):
+        self.collection.insert_many(samples)
+
+    def expire(self, now):
+        """Delete samples past the retention window, returning how many were removed."""
+        return self.collection.delete_many({"timestamp": {"$lt": now - RETENTION_SECONDS}}).deleted_count
+
+    def read_series(self, guild_uuid, start, end):
+        """A guild's (timestamp, count) samples with start <= timestamp < end, oldest first."""
+        cursor = self.collection.find(
+            {'guild_uuid': guild_uuid, 'timestamp': {'$gte': start, '$lt': end}},
+            {'_id': 0, 'timestamp': 1, 'count': 1}
+        ).sort('timestamp', ASCENDING)
+        return [(doc['timestamp'], doc['count']) for doc in cursor]
+
+
+class TimeSeriesOnlineCountStore:
+    """A MongoDB time-series collection keyed by guild, expired by the server."""
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[COLLECTION_GUILD_ONLINE_COUNT_SERIES]
+
+    def setup(self):
+        if COLLECTION_GUILD_ONLINE_COUNT_SERIES not in self.db.list_collection_names():
+            self.db.create_collection(
+                COLLECTION_GUILD_ONLINE_COUNT_SERIES,
+                timeseries={'timeField': 'time', 'metaField': 'guild_uuid', 'granularity': 'minutes'},
+                expireAfterSeconds=RETENTION_SECONDS,
+            )
+
+    def setup_indexes(self):
+        self.setup()
+
+    def insert(self, samples):
+        self.collection.insert_many([
+            {
+                'time': to_datetime(sample['timestamp']),
+                'guild_uuid': sample['guild_uuid'],
+                'guild_name': sample['guild_name'],
+                'count': sample['count'],
+            }
+            for sample in samples
+        ], ordered=False)
+
+    def expire(self, now):
+        return 0  # expireAfterSeconds drops old buckets
+
+    def read_series(self, guild_uuid, start, end):
+        cursor = self.collection.find(
+            {'guild_uuid': guild_uuid, 'time': {'$gte': to_datetime(start), '$lt': to_datetime(end)}},
+            {'_id': 0, 'time': 1, 'count': 1}
+        ).sort('time', ASCENDING)
+        return [(int(doc['time'].replace(tzinfo=datetime.timezone.utc).timestamp()), doc['count']) for doc in cursor]
+
+
+class BucketedOnlineCountStore:
+    """One document per guild per day holding packed timestamp and count arrays, expired by TTL."""
+
+    def __init__(self, db):
+        self.collection = db[COLLECTION_GUILD_ONLINE_COUNT_BUCKETS]
+
+    def setup(self):
+        self.collection.create_index('expireAt', expireAfterSeconds=0)
+        self.collection.create_index([('guild_uuid', ASCENDING), ('day', ASCENDING)])
+
+    def setup_indexes(self):
+        self.setup()
+
+    def insert(self, samples):
+        operations = []
+        for sample in samples:
+            day = sample['timestamp'] - sample['timestamp'] % BUCKET_SECONDS
+            operations.append(UpdateOne(
+                {'_id': f"{sample['guild_uuid']}:{day}"},
+                {
+                    '$push': {'timestamps': sample['timestamp'], 'counts': sample['count']},
+                    '$set': {'guild_name': sample['guild_name']},
+                    # The whole bucket goes once its newest possible sample is past retention
+                    '$setOnInsert': {
+                        'guild_uuid': sample['guild_uuid'],
+                        'day': day,
+                        'expireAt': to_datetime(day + BUCKET_SECONDS + RETENTION_SECONDS),
+                    },
+                },
+                upsert=True
+            ))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def expire(self, now):
+        return 0  # The expireAt TTL index drops old buckets
+
+    def read_series(self, guild_uuid, start, end):
+        cursor = self.collection.find(
+            {'guild_uuid': guild_uuid, 'day': {'$gt': start - BUCKET_SECONDS, '$lt': end}},
+            {'_id': 0, 'timestamps': 1, 'counts': 1}
+        ).sort('day', ASCENDING)
+        series = []
+        for doc in cursor:
+            series.extend(
+                (timestamp, count) for timestamp, count in zip(doc['timestamps'], doc['counts'])
+                if start <= timestamp < end
+            )
+        return series
+
+
+ONLINE_COUNT_STORES = {
+    'documents': DocumentOnlineCountStore,
+    'timeseries': TimeSeriesOnlineCountStore,
+    'buckets': BucketedOnlineCountStore,
+}
+
+
+def get_online_count_store(db, backend=None):
+    """The online count store selected by `backend` or ONLINE_COUNT_BACKEND (default: documents)."""
+    backend = backend or os.getenv(BACKEND_ENV, 'documents')
+    if backend not in ONLINE_COUNT_STORES:
+        raise ValueError(f"Unknown online count backend '{backend}'. Expected one of: {', '.join(ONLINE_COUNT_STORES)}")
+    return ONLINE_COUNT_STORES[backend](db)
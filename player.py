@@ -1,132 +1,314 @@
-import os
-import requests
-import time
-from pymongo import MongoClient
-from guild import process_all_guilds
-
-# MongoDB connection
-mongodb_uri = os.getenv('MONGODB_URI')  # Get the MongoDB URI from environment variable
-client = MongoClient(mongodb_uri)  # Connect to MongoDB using the URI
-db = client['wynnpool']
-player_data_collection = db['player_data']
+import argparse
+import asyncio
+import logging
+from checkpoint import PLAYER_CRAWL_JOB, PLAYER_GUILD_CRAWL_JOB, CrawlCheckpoint, in_shard, parse_shard
+from guild import process_all_guilds, process_guild_queue
+from http_cache import get_response_cache
+from http_client import WYNNCRAFT_PLAYER_REQUEST_RATE, wynncraft_client
+from mongo_client import get_db
+from run_logging import Progress, setup_logging
+from run_metrics import count, fail_run, job_run, phase
+
+log = logging.getLogger('player')
 
 # API URLs
 PLAYER_LIST_URL = 'https://api.wynncraft.com/v3/player?identifier=uuid'
 PLAYER_DATA_URL_TEMPLATE = 'https://api.wynncraft.com/v3/player/{uuid}?fullResult'
 
-# Collect all guild UUIDs in this set to avoid duplicates
-collected_guild_uuids = {}
+# Newly collected guilds waiting for the guild worker; a full queue holds the player crawl back
+GUILD_QUEUE_SIZE = 200
+
+
+def player_data_collection():
+    return get_db()['player_data']
 
-def fetch_player_uuids():
+
+def fetch_player_uuids(api):
     """Fetch the list of player UUIDs from Wynncraft API."""
     try:
-        response = requests.get(PLAYER_LIST_URL)
+        response = api.get_json(PLAYER_LIST_URL, endpoint='player/list')
         if response.status_code == 200:
-            player_data = response.json()
+            player_data = response.data
             player_uuids = list(player_data.get('players', {}).keys())
-            print(f"Fetched {len(player_uuids)} player UUIDs.")
+            log.info("Fetched %d player UUIDs.", len(player_uuids))
             return player_uuids
         else:
             raise Exception(f"Failed to fetch player UUIDs. Status code: {response.status_code}")
     except Exception as e:
-        print(f"Error fetching player UUIDs: {e}")
+        log.error("Error fetching player UUIDs: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
         return []
 
 
-def fetch_player_data(uuid):
-    """Fetch the detailed player data from Wynncraft API for a specific UUID."""
+def fetch_player_data(api, uuid, cache=None):
+    """Fetch the detailed player data from Wynncraft API for a specific UUID.
+
+    Players are only read for their guild, so a cached payload is returned even when it is
+    unchanged; the cache just saves the download. Returns an empty dict for a player that
+    does not exist (404) and None when the fetch failed.
+    """
     try:
-        url = PLAYER_DATA_URL_TEMPLATE.format(uuid=uuid)
-        response = requests.get(url)
-        if response.status_code == 200:
-            player_data = response.json()
-            print(f"Successfully fetched data for UUID: {uuid}")
-            return player_data
-        elif response.status_code == 404:
-            print(f"Player with UUID {uuid} not found.")
-            return None
-        else:
-            raise Exception(f"Failed to fetch player data for UUID {uuid}. Status code: {response.status_code}")
+        response = api.get_json(PLAYER_DATA_URL_TEMPLATE.format(uuid=uuid), cache, endpoint='player')
+    except Exception as e:
+        log.warning("Error fetching data for UUID %s: %s", uuid, e)
+        return None
+    return _player_response_data(uuid, response)
+
+
+async def fetch_player_data_async(api, uuid, cache=None):
+    """Async counterpart of fetch_player_data; `api` must be entered with `async with`."""
+    try:
+        response = await api.get_json_async(PLAYER_DATA_URL_TEMPLATE.format(uuid=uuid), cache, endpoint='player')
     except Exception as e:
-        print(f"Error fetching data for UUID {uuid}: {e}")
+        log.warning("Error fetching data for UUID %s: %s", uuid, e)
         return None
+    return _player_response_data(uuid, response)
+
+
+def _player_response_data(uuid, response):
+    """What fetch_player_data returns for a player API response."""
+    if response.status_code == 200:
+        log.debug("Successfully fetched data for UUID: %s", uuid)
+        return response.data
+    if response.status_code == 404:
+        log.debug("Player with UUID %s not found.", uuid)
+        return {}
+    log.warning("Error fetching data for UUID %s: status code %s", uuid, response.status_code)
+    return None
 
 
 def store_or_update_player_data(player_data):
     """Store or update the player data in the player_data collection."""
     uuid = player_data.get('uuid')
     if not uuid:
-        print("UUID not found in player data, skipping.")
+        log.warning("UUID not found in player data, skipping.")
         return
 
-    existing_data = player_data_collection.find_one({"uuid": uuid})
+    existing_data = player_data_collection().find_one({"uuid": uuid})
 
     if existing_data:
         # Update the existing document
-        update_result = player_data_collection.update_one(
+        update_result = player_data_collection().update_one(
             {"_id": existing_data["_id"]}, 
             {"$set": player_data}
         )
         if update_result.modified_count > 0:
-            print(f"Player data for UUID {uuid} updated successfully.")
+            log.debug("Player data for UUID %s updated successfully.", uuid)
         else:
-            print(f"No changes were made to the player data for UUID {uuid}.")
+            log.debug("No changes were made to the player data for UUID %s.", uuid)
     else:
         # Insert a new document if it doesn't exist
-        player_data_collection.insert_one(player_data)
-        print(f"New player data for UUID {uuid} inserted successfully.")
+        player_data_collection().insert_one(player_data)
+        log.debug("New player data for UUID %s inserted successfully.", uuid)
+
 
+def collect_guild_uuid(player_data, guilds):
+    """Collect the player's guild into `guilds` (guild name -> uuid and prefix), if it has one.
 
-def collect_guild_uuid(player_data):
-    """Collect the unique guild UUID if it exists in the player data."""
+    Returns (guild_name, guild_uuid) the first time a guild is collected, otherwise None.
+    """
     guild_info = player_data.get('guild')
     if guild_info and 'uuid' in guild_info and 'name' in guild_info and 'prefix' in guild_info:
         guild_name = guild_info['name']
         guild_uuid = guild_info['uuid']
         guild_prefix = guild_info['prefix']
+        is_new = guild_name not in guilds
 
-        collected_guild_uuids[guild_name] = {
+        guilds[guild_name] = {
             'uuid': guild_uuid,
             'prefix': guild_prefix
         }
 
-        print(f"Collected guild '{guild_name}' with UUID: {guild_uuid} and prefix: {guild_prefix}")
+        log.debug("Collected guild '%s' with UUID: %s and prefix: %s", guild_name, guild_uuid, guild_prefix)
+        if is_new:
+            return guild_name, guild_uuid
+    return None
+
+
+async def crawl_players_async(player_uuids, api, guilds, cache=None, checkpoint=None, guild_queue=None):
+    """Fetch player data for every UUID with at most `api.concurrency` requests in flight.
+
+    Guilds are collected into `guilds`; with a guild_queue, each newly collected guild is
+    also put on it as (guild_name, guild_uuid).
+    """
+    pending_uuids = iter(player_uuids)
+    progress = Progress(log, 'players', len(player_uuids))
+
+    async def worker():
+        # Workers share one iterator, so each UUID is fetched exactly once
+        for uuid in pending_uuids:
+            try:
+                with phase('fetch'):
+                    player_data = await fetch_player_data_async(api, uuid, cache)
+                if player_data is None:
+                    continue
+
+                new_guild = collect_guild_uuid(player_data, guilds)
+                if new_guild and guild_queue is not None:
+                    await guild_queue.put(new_guild)
+                # Players whose fetch failed are left out of the checkpoint, so a resumed crawl retries them
+                if checkpoint:
+                    checkpoint.done(uuid)
+            except Exception as e:
+                log.error("An error occurred while processing UUID '%s': %s", uuid, e)
+            finally:
+                progress.advance()
+
+    async with api:
+        await asyncio.gather(*(worker() for _ in range(api.concurrency)))
+    progress.finish()
+
+
+async def crawl_players_and_guilds(player_uuids, api, guilds, cache=None, checkpoint=None):
+    """Crawl players while a guild worker stores each guild as soon as it is first collected.
+
+    Guilds go through a bounded queue, so the crawl waits for the guild worker rather than
+    piling guilds up in memory. Both share `api`, and with it the rate limit and the cap on
+    requests in flight. Stored guilds are recorded in the checkpoint, and a resumed
+    crawl queues the guilds it had collected but not stored yet. If the guild worker
+    fails, the crawl is cancelled instead of blocking on the full queue.
+    """
+    guild_queue = asyncio.Queue(maxsize=GUILD_QUEUE_SIZE)
+    processed_guilds = set(checkpoint.extra.get('processedGuilds', [])) if checkpoint else set()
+
+    def mark_processed(stored):
+        processed_guilds.update(guild_name for guild_name, _ in stored)
+        if checkpoint:
+            checkpoint.extra['processedGuilds'] = sorted(processed_guilds)
+
+    async def crawl():
+        for guild_name, guild_info in list(guilds.items()):
+            if guild_name not in processed_guilds:
+                await guild_queue.put((guild_name, guild_info['uuid']))
+        await crawl_players_async(player_uuids, api, guilds, cache, checkpoint, guild_queue)
+
+    async with api:
+        guild_worker = asyncio.ensure_future(
+            process_guild_queue(guild_queue, api, cache=cache, on_stored=mark_processed)
+        )
+        crawler = asyncio.ensure_future(crawl())
+        try:
+            await asyncio.wait((guild_worker, crawler), return_when=asyncio.FIRST_COMPLETED)
+            if not crawler.done():
+                # The worker only returns at the end-of-queue marker, so it failed: stop the crawl feeding it
+                crawler.cancel()
+                await asyncio.gather(crawler, return_exceptions=True)
+                guild_worker.result()
+            crawler.result()
+        finally:
+            if not guild_worker.done():
+                await guild_queue.put(None)
+                await guild_worker
+
 
+def process_all_players(concurrency=1, cache=None, checkpoint=None, resume=False, shard=None, process_guilds=False,
+                        api=None):
+    """Fetch the player UUIDs, then request player data for each UUID and return the guilds collected.
 
-def process_all_players():
-    """Fetch the player UUIDs, then request player data for each UUID and store it."""
+    The guilds are returned as {guild_name: {'uuid': ..., 'prefix': ...}}. With a concurrency
+    above 1 the players are crawled through the async crawler instead of the serial loop
+    with its fixed sleep between requests, and with `process_guilds` the collected guilds
+    are stored while the crawl runs. With a checkpoint, progress and the collected guilds
+    are saved as the crawl goes, and `resume` continues the last unfinished crawl, storing
+    its pending guilds even when no players are left. With a shard, only that shard's
+    UUIDs are crawled.
+    """
+    api = api or wynncraft_client(concurrency, WYNNCRAFT_PLAYER_REQUEST_RATE)
+    guilds = {}
     try:
         # Step 1: Fetch all player UUIDs from the Wynncraft API
-        player_uuids = fetch_player_uuids()
+        def load_player_uuids():
+            return [uuid for uuid in fetch_player_uuids(api) if in_shard(uuid, shard)]
+
+        if checkpoint:
+            player_uuids = checkpoint.begin(load_player_uuids, resume)
+            guilds.update(checkpoint.extra.get('guilds', {}))
+            checkpoint.extra['guilds'] = guilds
+        else:
+            player_uuids = load_player_uuids()
+
+        if not player_uuids and not guilds:
+            log.info("No player UUIDs found.")
+            return guilds
 
-        if not player_uuids:
-            print("No player UUIDs found.")
-            return
+        log.info("Processing %d player UUIDs...", len(player_uuids))
+        count('players', len(player_uuids))
 
-        print(f"Processing {len(player_uuids)} player UUIDs...")
+        if concurrency > 1:
+            if process_guilds:
+                asyncio.run(crawl_players_and_guilds(player_uuids, api, guilds, cache, checkpoint))
+            else:
+                asyncio.run(crawl_players_async(player_uuids, api, guilds, cache, checkpoint))
+            if checkpoint:
+                checkpoint.finish()
+            api.report()
+            count('guilds_collected', len(guilds))
+            log.info("Finished processing all players. Collected %d unique guild UUIDs.", len(guilds))
+            return guilds
 
+        progress = Progress(log, 'players', len(player_uuids))
         for uuid in player_uuids:
             try:
                 # Step 2: Fetch the player data for this UUID
-                player_data = fetch_player_data(uuid)
-                if not player_data:
+                with phase('fetch'):
+                    player_data = fetch_player_data(api, uuid, cache)
+                if player_data is None:
                     continue
 
                 # Step 3: Store or update player data in MongoDB
                 # store_or_update_player_data(player_data)
 
                 # Step 4: Collect unique guild UUID from the player data
-                collect_guild_uuid(player_data)
-
-                time.sleep(0.5)
+                collect_guild_uuid(player_data, guilds)
+                # Players whose fetch failed are left out of the checkpoint, so a resumed crawl retries them
+                if checkpoint:
+                    checkpoint.done(uuid)
             except Exception as e:
-                print(f"An error occurred while processing UUID '{uuid}': {e}")
+                log.error("An error occurred while processing UUID '%s': %s", uuid, e)
+            finally:
+                progress.advance()
 
-        print(f"Finished processing all players. Collected {len(collected_guild_uuids)} unique guild UUIDs.")
+        progress.finish()
+        if checkpoint:
+            checkpoint.finish()
+        api.report()
+        count('guilds_collected', len(guilds))
+        log.info("Finished processing all players. Collected %d unique guild UUIDs.", len(guilds))
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
+    return guilds
 
 
 if __name__ == "__main__":
-    process_all_players()
-    process_all_guilds(collected_guild_uuids)
+    parser = argparse.ArgumentParser(description="Crawl Wynncraft players and update their guilds.")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="Number of concurrent player and guild requests (1 keeps the serial crawl).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the last crawl from its checkpoint instead of starting over.")
+    parser.add_argument('--shard', type=parse_shard,
+                        help="Crawl only shard i of N (e.g. 0/4); guilds are then processed by guild.py --from-player-crawl.")
+    args = parser.parse_args()
+
+    setup_logging('player')
+    db = get_db()
+    with job_run('player', db):
+        response_cache = get_response_cache()
+        player_checkpoint = CrawlCheckpoint(db, PLAYER_CRAWL_JOB, args.shard)
+        guild_checkpoint = CrawlCheckpoint(db, PLAYER_GUILD_CRAWL_JOB)
+
+        # Async unsharded crawls store guilds as they are collected; the others run a guild phase after the players
+        pipelined = args.concurrency > 1 and not args.shard
+
+        # A crawl that died in its guild phase picks up there, with the guilds it had collected
+        if (args.resume and not args.shard and not player_checkpoint.unfinished()
+                and guild_checkpoint.unfinished()):
+            process_all_guilds({}, args.concurrency, cache=response_cache, checkpoint=guild_checkpoint, resume=True)
+        else:
+            guilds = process_all_players(args.concurrency, response_cache, player_checkpoint, args.resume, args.shard,
+                                         pipelined)
+            if args.shard:
+                log.info("Sharded crawl: run guild.py --from-player-crawl to process the collected guilds.")
+            elif not pipelined:
+                process_all_guilds(guilds, args.concurrency, cache=response_cache,
+                                   checkpoint=guild_checkpoint)
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+# Rate-limit headers sent back by the Wynncraft API on every response
+RATE_LIMIT_HEADER = 'RateLimit-Limit'
+RATE_REMAINING_HEADER = 'RateLimit-Remaining'
+RATE_RESET_HEADER = 'RateLimit-Reset'
+
+
+def _header_number(headers, name):
+    """Read a numeric header, returning None when it is missing or malformed."""
+    value = headers.get(name) if headers else None
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Async token bucket whose refill rate follows the API's rate-limit headers."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)  # tokens per second
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = None  # Created lazily so it binds to the running event loop
+        self._lock_loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            # A bucket outlives asyncio.run(), so each new event loop gets its own lock
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def acquire_blocking(self):
+        """Synchronous acquire, for clients sending one request at a time."""
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                time.sleep(self.blocked_until - now)
+                continue
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers):
+        """Spread the remaining request budget evenly over the time left in the window."""
+        limit = _header_number(headers, RATE_LIMIT_HEADER)
+        remaining = _header_number(headers, RATE_REMAINING_HEADER)
+        reset = _header_number(headers, RATE_RESET_HEADER)
+
+        if limit and limit > 0:
+            self.capacity = limit
+        if remaining is None or not reset or reset <= 0:
+            return
+
+        self._refill()
+        self.rate = max(remaining, 1) / reset
+        self.tokens = min(self.tokens, remaining)
+
+    def slow_down(self, min_rate, factor=0.5):
+        """Cut the rate after a 429, for APIs that do not send rate-limit headers."""
+        self._refill()
+        self.rate = max(min_rate, self.rate * factor)
+
+    def speed_up(self, max_rate, step):
+        """Raise the rate a little after a successful request, up to `max_rate`."""
+        self._refill()
+        self.rate = min(max_rate, self.rate + step)
+
+    def block(self, seconds):
+        """Stop handing out tokens for the given number of seconds (e.g. after a 429)."""
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def retry_after_seconds(headers, default=60):
+    """How long to back off after a 429, from Retry-After or the rate-limit reset header."""
+    for name in ('Retry-After', RATE_RESET_HEADER):
+        seconds = _header_number(headers, name)
+        if seconds is not None and seconds >= 0:
+            return seconds
+    return default
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Lowest level logged (DEBUG, INFO, WARNING, ...); per-item lines are only logged at DEBUG
+LOG_LEVEL_ENV = 'LOG_LEVEL'
+# 'text' (the default) or 'json' for one JSON object per line
+LOG_FORMAT_ENV = 'LOG_FORMAT'
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Warnings and errors logged per message template and period; the rest are counted and
+# reported with the next one let through
+LOG_BURST = 20
+LOG_BURST_PERIOD = 60
+
+# A Progress line is logged every PROGRESS_EVERY items or PROGRESS_INTERVAL seconds
+PROGRESS_EVERY = 10000
+PROGRESS_INTERVAL = 30
+
+# Libraries that log every command or connection at DEBUG
+QUIET_LOGGERS = ('pymongo', 'urllib3', 'asyncio')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the job name and any `extra={'fields': {...}}` merged in."""
+
+    def __init__(self, job=None):
+        super().__init__()
+        self.job = job
+
+    def format(self, record):
+        doc = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if self.job:
+            doc['job'] = self.job
+        fields = getattr(record, 'fields', None)
+        if fields:
+            doc.update(fields)
+        if record.exc_info:
+            doc['exception'] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `burst` warnings or errors with the same message template through per `period` seconds.
+
+    Lower levels pass untouched; they are already kept down by the log level.
+    """
+
+    def __init__(self, burst=LOG_BURST, period=LOG_BURST_PERIOD):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.windows = {}  # (logger, template) -> [window start, records let through, records dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        with self._lock:
+            window = self.windows.get(key)
+            if window is None or record.created - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [record.created, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def setup_logging(job=None, level=None, fmt=None):
+    """Log to stdout at LOG_LEVEL (INFO by default), as text or, with LOG_FORMAT=json, JSON lines.
+
+    Replaces any handlers already on the root logger, so calling it again is harmless.
+    """
+    level = (level or os.getenv(LOG_LEVEL_ENV) or 'INFO').upper()
+    fmt = (fmt or os.getenv(LOG_FORMAT_ENV) or 'text').lower()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter(job) if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+class Progress:
+    """Log how far a loop has got, with its rate and ETA, every `every` items or `interval` seconds.
+
+    advance() is cheap enough to call per item; the line itself is only built when one is due.
+    """
+
+    def __init__(self, log, label, total=None, every=PROGRESS_EVERY, interval=PROGRESS_INTERVAL):
+        self.log = log
+        self.label = label
+        self.total = total
+        self.every = every
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self._next_count = every
+        self._next_time = self.start + interval
+
+    def advance(self, count=1):
+        self.done += count
+        if self.done >= self._next_count or time.monotonic() >= self._next_time:
+            self._report()
+
+    def finish(self):
+        """Log the final count and rate."""
+        self._report(final=True)
+
+    def _report(self, final=False):
+        now = time.monotonic()
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        fields = {'progress': self.label, 'done': self.done, 'total': self.total, 'rate': round(rate, 2),
+                  'elapsedSeconds': round(elapsed, 1)}
+
+        if final:
+            self.log.info("%s: %d done in %.0fs (%.1f/s)", self.label, self.done, elapsed, rate,
+                          extra={'fields': fields})
+        elif self.total:
+            eta = (self.total - self.done) / rate if rate > 0 else None
+            fields['etaSeconds'] = round(eta) if eta is not None else None
+            self.log.info("%s: %d/%d (%.1f%%), %.1f/s, ETA %s", self.label, self.done, self.total,
+                          self.done / self.total * 100, rate, format_duration(eta), extra={'fields': fields})
+        else:
+            self.log.info("%s: %d done, %.1f/s", self.label, self.done, rate, extra={'fields': fields})
+
+        self._next_count = self.done + self.every
+        self._next_time = now + self.interval
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'unknown'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
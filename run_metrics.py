@@ -0,0 +1,213 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import socket
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from pymongo import monitoring
+
+log = logging.getLogger('run_metrics')
+
+# One summary document per job run
+COLLECTION_JOB_RUNS = 'job_runs'
+
+# Comma-separated profilers to run alongside a job: 'cpu' (cProfile) and/or 'memory' (tracemalloc)
+PROFILE_ENV = 'RUN_PROFILE'
+# Where cProfile dumps (<job>-<started_at>.prof) go; the current directory by default
+PROFILE_DIR_ENV = 'RUN_PROFILE_DIR'
+# Also write each run's summary as JSON to this file
+METRICS_FILE_ENV = 'RUN_METRICS_FILE'
+
+# Functions / allocation sites listed in a profiled run's summary
+PROFILE_TOP = 20
+
+_current = None
+
+
+class MongoCommandStats(monitoring.CommandListener):
+    """Counts MongoDB commands and their server round-trip time for the current run.
+
+    Registered globally when this module is imported, so it sees every MongoClient created
+    afterwards; scripts import it before connecting.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if _current:
+            _current.record_command(event.command_name, event.duration_micros, True)
+
+    def failed(self, event):
+        if _current:
+            _current.record_command(event.command_name, event.duration_micros, False)
+
+
+monitoring.register(MongoCommandStats())
+
+
+class RunMetrics:
+    """Phase timings, counters, HTTP and MongoDB statistics of one job run."""
+
+    def __init__(self, job):
+        self.job = job
+        self.started_at = int(time.time())
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.commands = {}
+        self.http_clients = []
+        self.profile = {}
+        self.error = None  # Set by fail_run, for jobs that log an error instead of raising it
+        self._lock = threading.Lock()  # Phases and commands are also recorded from executor threads
+        self._profiler = None
+        profilers = os.getenv(PROFILE_ENV, '')
+        self.profilers = {name.strip() for name in profilers.split(',') if name.strip()}
+
+    def start_profiling(self):
+        if 'memory' in self.profilers:
+            tracemalloc.start()
+        if 'cpu' in self.profilers:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop_profiling(self):
+        if self._profiler:
+            self._profiler.disable()
+            path = os.path.join(os.getenv(PROFILE_DIR_ENV, '.'), f"{self.job}-{self.started_at}.prof")
+            self._profiler.dump_stats(path)
+            output = io.StringIO()
+            pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            self.profile['cpu'] = {'file': path, 'top': output.getvalue().splitlines()}
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+            tracemalloc.stop()
+            self.profile['memory'] = {
+                'peakMiB': round(peak / 1024 / 1024, 2),
+                'top': [str(stat) for stat in top],
+            }
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block under `name`; time spent in concurrent tasks adds up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                phase = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                phase['seconds'] += elapsed
+                phase['calls'] += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_command(self, command_name, duration_micros, ok):
+        with self._lock:
+            stats = self.commands.setdefault(command_name, {'count': 0, 'failed': 0, 'totalMs': 0.0, 'maxMs': 0.0})
+            stats['count'] += 1
+            stats['failed'] += not ok
+            stats['totalMs'] += duration_micros / 1000
+            stats['maxMs'] = max(stats['maxMs'], duration_micros / 1000)
+
+    def summary(self, status='ok', error=None):
+        """The run as one JSON-serializable document."""
+        doc = {
+            'job': self.job,
+            'host': socket.gethostname(),
+            'startedAt': self.started_at,
+            'finishedAt': int(time.time()),
+            'durationSeconds': round(time.perf_counter() - self.start, 3),
+            'status': status,
+            'phases': {name: {'seconds': round(phase['seconds'], 3), 'calls': phase['calls']}
+                       for name, phase in self.phases.items()},
+            'counters': dict(self.counters),
+            'http': [client.stats() for client in self.http_clients],
+            'mongo': {name: {**stats, 'totalMs': round(stats['totalMs'], 1), 'maxMs': round(stats['maxMs'], 1)}
+                      for name, stats in self.commands.items()},
+        }
+        if error:
+            doc['error'] = error
+        if self.profile:
+            doc['profile'] = self.profile
+        return doc
+
+
+def start_run(job):
+    """Make `job` the current run, so phase(), count() and MongoDB commands are recorded for it."""
+    global _current
+    _current = RunMetrics(job)
+    _current.start_profiling()
+    return _current
+
+
+def finish_run(db=None, status='ok', error=None):
+    """Stop the current run and store its summary in job_runs (and RUN_METRICS_FILE when set)."""
+    global _current
+    run, _current = _current, None
+    if run is None:
+        return None
+    run.stop_profiling()
+    if status == 'ok' and run.error:
+        status, error = 'failed', run.error
+    doc = run.summary(status, error)
+
+    phases = ', '.join(f"{name} {phase['seconds']:.2f}s" for name, phase in doc['phases'].items())
+    commands = sum(stats['count'] for stats in doc['mongo'].values())
+    log.info("Run %s %s in %.2fs (%s; %d MongoDB commands).", run.job, status, doc['durationSeconds'],
+             phases or 'no phases', commands, extra={'fields': {'runSummary': doc}})
+
+    path = os.getenv(METRICS_FILE_ENV)
+    if path:
+        with open(path, 'w') as file:
+            json.dump(doc, file, indent=2)
+    if db is not None:
+        try:
+            db[COLLECTION_JOB_RUNS].insert_one(doc)
+        except Exception as e:
+            log.error("Failed to store the run summary: %s", e)
+    return doc
+
+
+@contextmanager
+def job_run(job, db=None):
+    """start_run/finish_run around a block, marking the run failed if the block raises."""
+    start_run(job)
+    try:
+        yield
+    except BaseException as e:
+        finish_run(db, 'failed', f"{type(e).__name__}: {e}")
+        raise
+    finish_run(db)
+
+
+def fail_run(error):
+    """Mark the current run failed without raising, for jobs that log an error and carry on."""
+    if _current:
+        _current.error = error
+
+
+def phase(name):
+    """Time a block as phase `name` of the current run (a no-op outside a run)."""
+    return _current.phase(name) if _current else nullcontext()
+
+
+def count(name, value=1):
+    """Add to counter `name` of the current run."""
+    if _current:
+        _current.count(name, value)
+
+
+def track_http_client(client):
+    """Include an http_client.ApiClient's request statistics in the current run's summary."""
+    if _current and client not in _current.http_clients:
+        _current.http_clients.append(client)
@@ -0,0 +1,99 @@
+import copy
+import os
+
+# Modify events keep the whole before/after documents next to their changes until every
+# changelog consumer reads `changes`; set CHANGELOG_FULL_DOCUMENTS=0 to store only the changes
+FULL_DOCUMENTS_ENV = 'CHANGELOG_FULL_DOCUMENTS'
+
+# Paths (JSON pointers) whose changes are not worth a changelog entry
+IGNORED_ITEM_PATHS = ('/icon/value/customModelData',)
+
+
+def include_full_documents():
+    return os.getenv(FULL_DOCUMENTS_ENV, '1').lower() in ('1', 'true', 'yes')
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def diff(before, after, ignored_paths=(), path=''):
+    """JSON-patch style operations turning `before` into `after`.
+
+    Replace and remove operations also carry the `oldValue` they overwrite, so the operations
+    can be undone with revert_patch to rebuild `before` from `after`.
+
+    Objects are compared member by member and equal-length arrays element by element; anything
+    else that differs is replaced whole. Changes at or below an ignored path are left out, so an
+    empty result means the documents are equal apart from ignored fields.
+    """
+    if path in ignored_paths or before == after:
+        return []
+
+    operations = []
+    if isinstance(before, dict) and isinstance(after, dict):
+        for key, value in before.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in after:
+                if child not in ignored_paths:
+                    operations.append({'op': 'remove', 'path': child, 'oldValue': value})
+            else:
+                operations.extend(diff(value, after[key], ignored_paths, child))
+        for key, value in after.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in before and child not in ignored_paths:
+                operations.append({'op': 'add', 'path': child, 'value': value})
+    elif isinstance(before, list) and isinstance(after, list) and len(before) == len(after):
+        for index, (old, new) in enumerate(zip(before, after)):
+            operations.extend(diff(old, new, ignored_paths, f"{path}/{index}"))
+    else:
+        operations.append({'op': 'replace', 'path': path, 'value': after, 'oldValue': before})
+    return operations
+
+
+def apply_patch(document, operations):
+    """Return a copy of `document` with the operations from `diff` applied, e.g. to rebuild `after`."""
+    document = copy.deepcopy(document)
+    for operation in operations:
+        tokens = [_unescape(token) for token in operation['path'].split('/')[1:]]
+        if not tokens:
+            document = copy.deepcopy(operation['value'])
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        if operation['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(operation['value'])
+    return document
+
+
+def revert_patch(document, operations):
+    """Return a copy of `document` with the operations from `diff` undone, e.g. to rebuild `before`."""
+    inverse = []
+    for operation in reversed(operations):
+        if operation['op'] == 'add':
+            inverse.append({'op': 'remove', 'path': operation['path']})
+        elif operation['op'] == 'remove':
+            inverse.append({'op': 'add', 'path': operation['path'], 'value': operation['oldValue']})
+        else:
+            inverse.append({'op': 'replace', 'path': operation['path'], 'value': operation['oldValue']})
+    return apply_patch(document, inverse)
+
+
+def modify_event(before, after, ignored_paths=()):
+    """The body of a modify changelog entry, or None when nothing but ignored fields changed."""
+    operations = diff(before, after, ignored_paths)
+    if not operations:
+        return None
+    event = {'changes': operations}
+    if include_full_documents():
+        event['before'] = before
+        event['after'] = after
+    return event
@@ -1,92 +1,241 @@
-import os
+import argparse
+import logging
 import requests
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, DeleteMany, UpdateOne
 from pymongo.errors import BulkWriteError
+from http_cache import get_response_cache
+from http_client import ITEM_DATABASE_TIMEOUT, wynncraft_client
+from item_stream import item_hash
+from mongo_client import get_db
+from run_logging import setup_logging
+from run_metrics import count, fail_run, job_run, phase
 
-# MongoDB connection setup
-DB_NAME = "wynnpool"
+log = logging.getLogger('sync_items')
+
+# MongoDB collections
 COLLECTION_ITEM = "item_data"
 COLLECTION_CHANGELOG = "item_changelog"
-
-mongodb_uri = os.getenv("MONGODB_URI")
-client = MongoClient(mongodb_uri)
-db = client[DB_NAME]
-items_collection = db[COLLECTION_ITEM]
-changelog_collection = db[COLLECTION_CHANGELOG]
+# Full rebuilds are written here, then renamed over item_data
+COLLECTION_ITEM_STAGING = "item_data_staging"
+# Index options carried over to the staging collection; the rest are server-managed or
+# specific to index types (text, 2dsphere) that a plain create_index cannot rebuild
+COPIED_INDEX_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+# Remembers the newest changelog timestamp already merged into item_data
+COLLECTION_SYNC_STATE = "sync_state"
+CHANGELOG_STATE_ID = "item_changelog"
 
 API_URL = "https://api.wynncraft.com/v3/item/database?fullResult"
 
 
-def fetch_api_data():
-    try:
-        api_key = os.getenv("WYNNCRAFT_API_KEY")
-        headers = {}
-        if api_key:
-            headers["Authorization"] = f"Bearer {api_key}"
-
-        response = requests.get(API_URL, headers=headers)
-        response.raise_for_status()  # Will raise an error for non-2xx status codes
-        data = response.json()
-        # API returns a list; index by internalName for consistent lookup
-        if isinstance(data, list):
-            return {
-                item["internalName"]: item for item in data if "internalName" in item
-            }
-        return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from API: {e}")
-        return {}
+def items_collection():
+    return get_db()[COLLECTION_ITEM]
 
 
-def fetch_all_changelogs():
-    """Fetch all changelogs at once and store in a dictionary for quick lookup."""
-    changelog_data = {}
-    for entry in changelog_collection.find(
-        {}, {"_id": 0}
-    ):  # Fetch all fields except _id
-        item_name = entry["itemName"]
-        if item_name not in changelog_data:
-            changelog_data[item_name] = []
-        changelog_data[item_name].append(entry)
+def changelog_collection():
+    return get_db()[COLLECTION_CHANGELOG]
 
-    # Ensure all changelogs are sorted in descending order by timestamp
-    for key in changelog_data:
-        changelog_data[key].sort(key=lambda x: x["timestamp"], reverse=True)
 
-    return changelog_data
+def sync_state_collection():
+    return get_db()[COLLECTION_SYNC_STATE]
 
 
-def sync_items():
-    # Fetch the latest data from the API
-    api_data = fetch_api_data()
-    if not api_data:
-        print("No data retrieved from API.")
-        return
-
-    print("Fetching changelog data in bulk...")
-    changelog_data = fetch_all_changelogs()
-    print("Cleaning up the existing item data collection...")
-    items_collection.delete_many({})  # Clears the collection
-
+def fetch_api_data(api, cache=None):
+    """Fetch the item database as (items, unchanged since the last cached sync)."""
+    try:
+        response = api.get_json(API_URL, cache, endpoint="item/database", defer_commit=True)
+        if response.status_code != 200:
+            raise requests.exceptions.RequestException(f"Unexpected status code {response.status_code}")
+        data = response.data
+        # API returns a list; index by internalName for consistent lookup
+        if isinstance(data, list):
+            data = {
+                item["internalName"]: item for item in data if "internalName" in item
+            }
+        return data, response.unchanged
+    except requests.exceptions.RequestException as e:
+        log.error("Error fetching data from API: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
+        return {}, False
+
+
+def ensure_indexes():
+    """Create the indexes the sync relies on; a no-op when they already exist."""
+    # $merge matches item_data documents on id, which needs a unique index
+    items_collection().create_index("id", unique=True)
+    # Serves the per-item newest-first $sort and the "written since" lookups
+    changelog_collection().create_index([("itemName", ASCENDING), ("timestamp", DESCENDING)])
+    changelog_collection().create_index("timestamp")
+
+
+def merge_changelogs(item_ids=None, target=COLLECTION_ITEM):
+    """Group changelogs per item, newest first, and $merge them into the items' documents.
+
+    With `item_ids` only those items are regrouped, so the work follows what changed rather than
+    the whole changelog history. Entries for items that are not in `target` are discarded.
+    """
+    pipeline = []
+    if item_ids is not None:
+        pipeline.append({"$match": {"itemName": {"$in": list(item_ids)}}})
+    pipeline.extend([
+        {"$sort": {"itemName": 1, "timestamp": -1}},
+        {"$project": {"_id": 0}},
+        {"$group": {"_id": "$itemName", "changelog": {"$push": "$$ROOT"}}},
+        {"$project": {"_id": 0, "id": "$_id", "changelog": 1}},
+        {"$merge": {"into": target, "on": "id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ])
+    changelog_collection().aggregate(pipeline, allowDiskUse=True)
+
+
+def latest_changelog_timestamp():
+    newest = changelog_collection().find_one({}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", DESCENDING)])
+    return newest["timestamp"] if newest else None
+
+
+def changelog_items_since(last_timestamp, until):
+    """Names of items with changelog entries in [last_timestamp, until]."""
+    query = {"$lte": until}
+    if last_timestamp is not None:
+        query["$gte"] = last_timestamp
+    return set(changelog_collection().distinct("itemName", {"timestamp": query}))
+
+
+def build_item_docs(api_data):
+    """item_data documents with a hash of their content; changelogs are merged in separately."""
     item_docs = []
-    items_with_changelog = 0
-
     for item_id, details in api_data.items():
         item_data = {"id": item_id, **details}
-
-        if item_id in changelog_data:
-            item_data["changelog"] = changelog_data[item_id]
-            items_with_changelog += 1
-
+        item_data["contentHash"] = item_hash(item_data)
         item_docs.append(item_data)
+    return item_docs
+
+
+def apply_incremental(item_docs):
+    """Write only added and changed items and delete removed ones, in one unordered bulk write.
+
+    Changed items get their content fields set and their dropped fields unset, so their merged
+    changelog is never removed, not even for a moment. Returns the ids of the documents written.
+    """
+    stored_hashes = {
+        doc["id"]: doc.get("contentHash")
+        for doc in items_collection().find({}, {"_id": 0, "id": 1, "contentHash": 1})
+    }
+
+    changed_docs = [doc for doc in item_docs if stored_hashes.get(doc["id"]) != doc["contentHash"]]
+    stored_fields = {
+        doc["id"]: doc.keys() - {"_id", "changelog"}
+        for doc in items_collection().find({"id": {"$in": [doc["id"] for doc in changed_docs]}}, {"changelog": 0})
+    }
+    operations = []
+    for doc in changed_docs:
+        update = {"$set": doc}
+        dropped_fields = stored_fields.get(doc["id"], set()) - doc.keys()
+        if dropped_fields:
+            update["$unset"] = {field: "" for field in dropped_fields}
+        operations.append(UpdateOne({"id": doc["id"]}, update, upsert=True))
+    removed_ids = list(stored_hashes.keys() - {doc["id"] for doc in item_docs})
+    if removed_ids:
+        operations.append(DeleteMany({"id": {"$in": removed_ids}}))
+
+    if not operations:
+        log.info("Item data is already up to date.")
+        return []
+    result = items_collection().bulk_write(operations, ordered=False)
+    log.info("Items added: %d, updated: %d, removed: %d",
+             result.upserted_count, result.modified_count, result.deleted_count)
+    return [doc["id"] for doc in changed_docs]
+
+
+def apply_rebuild(item_docs):
+    """Build the collection afresh in a staging collection and swap it in with renameCollection.
+
+    Every changelog is merged into the staging collection before the swap. Returns the ids written.
+    """
+    staging_collection = get_db()[COLLECTION_ITEM_STAGING]
+    staging_collection.drop()
+    staging_collection.insert_many(item_docs, ordered=False)
+
+    # The rename replaces item_data's indexes with the staging collection's, so carry them over
+    for name, info in items_collection().index_information().items():
+        if name == "_id_":
+            continue
+        if any(field == "_fts" for field, _ in info["key"]):
+            log.warning("Not carrying text index %s over to the rebuilt item data; recreate it by hand.", name)
+            continue
+        options = {option: info[option] for option in COPIED_INDEX_OPTIONS if option in info}
+        staging_collection.create_index(info["key"], name=name, **options)
+    staging_collection.create_index("id", unique=True)
+    merge_changelogs(target=COLLECTION_ITEM_STAGING)
+
+    staging_collection.rename(COLLECTION_ITEM, dropTarget=True)
+    log.info("Rebuilt item data with %d items.", len(item_docs))
+    return [doc["id"] for doc in item_docs]
+
+
+def sync_items(cache=None, rebuild=False, api=None):
+    # Fetch the latest data from the API
+    with phase("fetch"):
+        api_data, unchanged = fetch_api_data(api or wynncraft_client(timeout=ITEM_DATABASE_TIMEOUT), cache)
+    if unchanged and not rebuild:
+        # item_data only has to be updated if a changelog was written since the last sync
+        last_sync = cache.stored_at(API_URL) or 0
+        if not changelog_collection().find_one({"timestamp": {"$gte": last_sync}}, {"_id": 1}):
+            log.info("Item database and changelogs are unchanged since the last sync, skipping.")
+            cache.report()
+            return
+    if not api_data:
+        log.info("No data retrieved from API.")
+        return
+
+    ensure_indexes()
+    with phase("diff"):
+        item_docs = build_item_docs(api_data)
+    count("items", len(item_docs))
+    with phase("db_read"):
+        state = sync_state_collection().find_one({"_id": CHANGELOG_STATE_ID}) or {}
+        newest_timestamp = latest_changelog_timestamp()
 
     try:
-        print("Inserting items into database...")
-        items_collection.insert_many(item_docs, ordered=False)  # Optimized bulk insert
-        print(f"Item sync successful! {items_with_changelog} items have changelogs.")
+        if rebuild:
+            log.info("Rebuilding the item data collection...")
+            with phase("db_write"):
+                apply_rebuild(item_docs)
+        else:
+            log.info("Applying item changes to the database...")
+            with phase("db_write"):
+                written_ids = apply_incremental(item_docs)
+            count("items_written", len(written_ids))
+
+            # Added items have no changelog yet and items with new entries need theirs regrouped
+            touched_ids = set(written_ids)
+            if newest_timestamp is not None:
+                with phase("db_read"):
+                    touched_ids |= changelog_items_since(state.get("lastTimestamp"), newest_timestamp)
+            if touched_ids:
+                log.info("Merging changelogs for %d items...", len(touched_ids))
+                with phase("merge"):
+                    merge_changelogs(touched_ids)
+        log.info("Item sync successful!")
     except BulkWriteError as e:
-        print(f"Error inserting data: {e}")
+        log.error("Error writing data: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
+        return
+
+    if newest_timestamp is not None:
+        sync_state_collection().update_one(
+            {"_id": CHANGELOG_STATE_ID}, {"$set": {"lastTimestamp": newest_timestamp}}, upsert=True
+        )
+
+    if cache:
+        cache.commit(API_URL)
+        cache.report()
 
 
 if __name__ == "__main__":
-    sync_items()
+    parser = argparse.ArgumentParser(description="Sync the item database and changelogs into item_data.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild item_data in a staging collection and swap it in, instead of applying changes.")
+    args = parser.parse_args()
+
+    setup_logging("sync_items")
+    with job_run("sync_items", get_db()):
+        sync_items(get_response_cache(), rebuild=args.rebuild)
@@ -1,125 +1,243 @@
-import requests
-from pymongo import DeleteOne, MongoClient, UpdateOne
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import OperationFailure
+import argparse
+import asyncio
+import logging
 import os
 import time
-
-# Wynncraft aspect endpoints
-endpoints = [
-    "https://api.wynncraft.com/v3/aspects/mage",
-    "https://api.wynncraft.com/v3/aspects/archer",
-    "https://api.wynncraft.com/v3/aspects/shaman",
-    "https://api.wynncraft.com/v3/aspects/warrior",
-    "https://api.wynncraft.com/v3/aspects/assassin",
-]
-DB_NAME = "wynnpool"
+from http_cache import get_response_cache
+from http_client import wynncraft_client
+from mongo_client import get_client, get_db
+from run_logging import setup_logging
+from run_metrics import count, fail_run, job_run, phase
+from structural_diff import modify_event
+
+log = logging.getLogger('sync_aspects')
+
+# Wynncraft aspect endpoints, one per class
+ASPECT_URL_TEMPLATE = "https://api.wynncraft.com/v3/aspects/{}"
+DEFAULT_CLASSES = ["mage", "archer", "shaman", "warrior", "assassin"]
+# Comma-separated class list overriding DEFAULT_CLASSES
+ASPECT_CLASSES_ENV = "ASPECT_CLASSES"
+
+# Per-endpoint request timeout; retries and backoff are left to the HTTP client
+REQUEST_TIMEOUT = 30
+
+# Server error code for transactions on a standalone deployment
+ILLEGAL_OPERATION = 20
 COLLECTION_ITEM = "aspect_data"
 
-# MongoDB setup
-mongodb_uri = os.getenv('MONGODB_URI')
-client = MongoClient(mongodb_uri)
-db = client[DB_NAME]
-aspects_col = db["aspect_data"]
-changelog_col = db["aspect_changelog"]
 
-# Ensure index on requiredClass
-aspects_col.create_index({"requiredClass": 1})
+# ---------- MongoDB ----------
+def aspects_col():
+    return get_db()[COLLECTION_ITEM]
+
+
+def changelog_col():
+    return get_db()["aspect_changelog"]
+
+
+# ---------- Setup ----------
+def setup_indexes():
+    """Create the collections' indexes; only needs running once per deployment (--setup)."""
+    aspects_col().create_index({"requiredClass": 1})
+    aspects_col().create_index({"aspectId": 1})
+    changelog_col().create_index({"aspectId": 1, "timestamp": -1})
 
 
 # ---------- Fetch API ----------
-def fetch_all_aspects(endpoints):
+def get_aspect_classes(classes=None):
+    """The classes to sync: `classes`, else ASPECT_CLASSES, else DEFAULT_CLASSES."""
+    classes = classes or os.getenv(ASPECT_CLASSES_ENV)
+    if not classes:
+        return list(DEFAULT_CLASSES)
+    return [name.strip().lower() for name in classes.split(",") if name.strip()]
+
+
+async def fetch_class_aspects(api, aspect_class, cache=None):
+    """Fetch one class endpoint; the client retries timeouts, 429s and server errors."""
+    url = ASPECT_URL_TEMPLATE.format(aspect_class)
+    res = await api.get_json_async(url, cache, endpoint="aspects", defer_commit=True)
+    if res.status_code != 200:
+        raise Exception(f"Status code: {res.status_code}")
+    return res
+
+
+async def fetch_all_aspects_async(api, classes, cache=None):
+    async with api:
+        return await asyncio.gather(
+            *(fetch_class_aspects(api, aspect_class, cache) for aspect_class in classes),
+            return_exceptions=True
+        )
+
+
+def fetch_all_aspects(classes, cache=None):
+    """Fetch every class endpoint concurrently and merge the results.
+
+    Returns (aspects, changed, failed_classes). changed is False only when a response cache
+    reports every fetched endpoint unchanged since the last sync; failed_classes lists the
+    classes whose endpoint could not be fetched, so their aspects are not taken as removed.
+    """
+    api = wynncraft_client(concurrency=len(classes), timeout=REQUEST_TIMEOUT)
+    with phase("fetch"):
+        results = asyncio.run(fetch_all_aspects_async(api, classes, cache))
+    api.report()
+
     merged = {}
-    for url in endpoints:
-        try:
-            res = requests.get(url)
-            res.raise_for_status()
-            for aspect in res.json():
-                key = aspect.get("internalName")
-                if key:
-                    merged[key] = aspect
-        except Exception as e:
-            print(f"Failed to fetch {url}: {e}")
-    return merged
+    changed = cache is None
+    failed_classes = []
+    for aspect_class, res in zip(classes, results):
+        if isinstance(res, Exception):
+            log.warning("Failed to fetch %s aspects: %s", aspect_class, res)
+            failed_classes.append(aspect_class)
+            continue
+        changed = changed or not res.unchanged
+        for aspect in res.data:
+            key = aspect.get("internalName")
+            if key:
+                merged[key] = aspect
+    return merged, changed, failed_classes
 
 
 # ---------- Save + Detect changes ----------
-def save_bulk_aspects(aspects):
+def save_bulk_aspects(aspects, failed_classes=()):
     timestamp = int(time.time())
 
     # Load existing documents for comparison
-    existing_docs = list(aspects_col.find({}))
+    with phase("db_read"):
+        existing_docs = list(aspects_col().find({}))
     existing_map = {doc["aspectId"]: doc for doc in existing_docs}
 
-    new_ids = set(aspects.keys())
-    old_ids = set(existing_map.keys())
-
-    ops = []
-
-    # 1. Detect removed aspects
-    removed_ids = old_ids - new_ids
-    for removed in removed_ids:
-        prev_doc = existing_map[removed].copy()
-        del prev_doc["_id"]
-
-        # Log removal
-        changelog_col.insert_one({
-            "aspectId": removed,
-            "status": "remove",
-            "timestamp": timestamp,
-            **prev_doc
-        })
-
-        # Remove from DB
-        ops.append(DeleteOne({"aspectId": removed}))
+    with phase("diff"):
+        new_ids = set(aspects.keys())
+        old_ids = set(existing_map.keys())
+
+        ops = []
+
+        # 1. Detect removed aspects, except for classes whose endpoint failed this run
+        removed_ids = old_ids - new_ids
+        if failed_classes:
+            failed = {aspect_class.lower() for aspect_class in failed_classes}
+            kept = {
+                aspect_id for aspect_id in removed_ids
+                if str(existing_map[aspect_id].get("requiredClass", "")).lower() in failed
+                or not existing_map[aspect_id].get("requiredClass")
+            }
+            if kept:
+                log.warning("Skipping removal of %d aspects from classes that failed to fetch: %s",
+                            len(kept), ', '.join(failed_classes))
+            removed_ids -= kept
+        changelog_entries = []
+        for removed in removed_ids:
+            prev_doc = existing_map[removed].copy()
+            del prev_doc["_id"]
+
+            # Log removal
+            changelog_entries.append({
+                "aspectId": removed,
+                "status": "remove",
+                "timestamp": timestamp,
+                **prev_doc
+            })
 
-    # 2. Handle add/modify + upsert
-    for aspect_id, aspect_data in aspects.items():
+            # Remove from DB
+            ops.append(DeleteOne({"aspectId": removed}))
 
-        # Flatten
-        curr_flat = {
-            "aspectId": aspect_id,
-            **aspect_data
-        }
+        # 2. Handle add/modify, writing only aspects that changed
+        for aspect_id, aspect_data in aspects.items():
 
-        if aspect_id not in existing_map:
-            # NEW aspect
-            changelog_col.insert_one({
+            # Flatten
+            curr_flat = {
                 "aspectId": aspect_id,
-                "status": "add",
-                "timestamp": timestamp,
-                **curr_flat
-            })
+                **aspect_data
+            }
+
+            if aspect_id not in existing_map:
+                # NEW aspect
+                changelog_entries.append({
+                    "aspectId": aspect_id,
+                    "status": "add",
+                    "timestamp": timestamp,
+                    **curr_flat
+                })
 
-        else:
-            # EXISTING aspect → check modify
-            prev = existing_map[aspect_id].copy()
-            prev.pop("_id", None)
+            else:
+                # EXISTING aspect → check modify
+                prev = existing_map[aspect_id].copy()
+                prev.pop("_id", None)
 
-            if prev != curr_flat:
-                changelog_col.insert_one({
+                delta = modify_event(prev, curr_flat)
+                if delta is None:
+                    continue
+                changelog_entries.append({
                     "aspectId": aspect_id,
                     "status": "modify",
                     "timestamp": timestamp,
-                    "before": prev,
-                    "after": curr_flat
+                    **delta
                 })
 
-        # Upsert document
-        ops.append(
-            UpdateOne(
-                {"aspectId": aspect_id},
-                {"$set": curr_flat},
-                upsert=True
-            )
-        )
+            # Replace rather than $set, so fields dropped by the API don't linger and show up as
+            # a modification again on every run
+            ops.append(ReplaceOne({"aspectId": aspect_id}, curr_flat, upsert=True))
 
-    if ops:
-        result = aspects_col.bulk_write(ops)
-        print(f"Upserts: {result.upserted_count}, Updates: {result.modified_count}")
-    else:
-        print("No updates needed.")
+    if not ops:
+        log.info("No updates needed.")
+        return
+    count("aspect_changes", len(changelog_entries))
+    with phase("db_write"):
+        result = write_changes(changelog_entries, ops)
+    log.info("Changelog entries: %d, Upserts: %d, Updates: %d, Removals: %d",
+             len(changelog_entries), result.upserted_count, result.modified_count, result.deleted_count)
+
+
+def _write_changes(changelog_entries, ops, session=None):
+    if changelog_entries:
+        changelog_col().insert_many(changelog_entries, ordered=False, session=session)
+    return aspects_col().bulk_write(ops, ordered=False, session=session)
+
+
+def write_changes(changelog_entries, ops):
+    """Write the changelog entries and aspect changes in one transaction where the deployment
+    supports it (replica sets and sharded clusters), otherwise one after the other."""
+    try:
+        with get_client().start_session() as session:
+            return session.with_transaction(lambda s: _write_changes(changelog_entries, ops, s))
+    except OperationFailure as e:
+        if e.code != ILLEGAL_OPERATION:
+            raise
+        log.info("Transactions are not supported by this deployment, writing without one.")
+        return _write_changes(changelog_entries, ops)
 
 
 # ---------- Main ----------
+def sync_aspects(classes):
+    cache = get_response_cache()
+    aspects, changed, failed_classes = fetch_all_aspects(classes, cache)
+    if len(failed_classes) == len(classes):
+        log.error("Every aspect endpoint failed, nothing to sync.")
+        fail_run("every aspect endpoint failed")
+    elif not changed:
+        log.info("Aspect endpoints are unchanged since the last sync, skipping.")
+    else:
+        save_bulk_aspects(aspects, failed_classes)
+        if cache:
+            for aspect_class in classes:
+                if aspect_class not in failed_classes:
+                    cache.commit(ASPECT_URL_TEMPLATE.format(aspect_class))
+    if cache:
+        cache.report()
+
+
 if __name__ == "__main__":
-    aspects = fetch_all_aspects(endpoints)
-    save_bulk_aspects(aspects)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync aspects from the Wynncraft API into aspect_data.")
+    parser.add_argument("--classes", help=f"Comma-separated classes to sync (default: ${ASPECT_CLASSES_ENV} or all).")
+    parser.add_argument("--setup", action="store_true", help="Create the collections' indexes and exit.")
+    args = parser.parse_args()
+
+    setup_logging("sync_aspects")
+    if args.setup:
+        setup_indexes()
+        log.info("Aspect indexes created.")
+    else:
+        with job_run("sync_aspects", get_db()):
+            sync_aspects(get_aspect_classes(args.classes))
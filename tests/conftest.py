@@ -0,0 +1,13 @@
+import pytest
+
+import mongo_client
+
+
+@pytest.fixture
+def mongo_db():
+    """A fresh mongomock database every job writes to, with the real client put back afterwards."""
+    mongomock = pytest.importorskip('mongomock')
+    saved = mongo_client._client, mongo_client._db
+    mongo_client.use_client(mongomock.MongoClient(), 'test')
+    yield mongo_client.get_db()
+    mongo_client._client, mongo_client._db = saved
@@ -0,0 +1,84 @@
+"""Crawl checkpoints resume where they stopped, and shards split the work between runners."""
+import argparse
+
+import pytest
+
+from checkpoint import CrawlCheckpoint, in_shard, load_checkpoint_extras, parse_shard
+
+ITEMS = ['a', 'b', 'c', 'd']
+
+
+def test_resume_skips_completed_items(mongo_db):
+    checkpoint = CrawlCheckpoint(mongo_db, 'players', interval=0)
+    assert checkpoint.begin(lambda: ITEMS) == ITEMS
+    checkpoint.done('a')
+    checkpoint.done('c')
+
+    resumed = CrawlCheckpoint(mongo_db, 'players')
+    assert resumed.unfinished()
+    assert resumed.begin(lambda: pytest.fail('a resumed crawl must not reload its items'), resume=True) == ['b', 'd']
+
+
+def test_progress_is_saved_every_interval(mongo_db):
+    checkpoint = CrawlCheckpoint(mongo_db, 'players', interval=3600)
+    checkpoint.begin(lambda: ITEMS)
+    checkpoint.done('a')
+    assert CrawlCheckpoint(mongo_db, 'players').begin(list, resume=True) == ITEMS
+    checkpoint.save()
+    assert CrawlCheckpoint(mongo_db, 'players').begin(list, resume=True) == ['b', 'c', 'd']
+
+
+def test_finished_crawl_starts_over(mongo_db):
+    checkpoint = CrawlCheckpoint(mongo_db, 'players')
+    checkpoint.begin(lambda: ITEMS)
+    checkpoint.finish()
+
+    restarted = CrawlCheckpoint(mongo_db, 'players')
+    assert not restarted.unfinished()
+    assert restarted.begin(lambda: ['e'], resume=True) == ['e']
+
+
+def test_empty_work_list_is_not_saved(mongo_db):
+    checkpoint = CrawlCheckpoint(mongo_db, 'players')
+    checkpoint.begin(lambda: ITEMS)
+    assert CrawlCheckpoint(mongo_db, 'players').begin(list) == []
+    assert CrawlCheckpoint(mongo_db, 'players').begin(list, resume=True) == ITEMS
+
+
+def test_key_maps_items_to_completed_ids(mongo_db):
+    items = [{'uuid': 'a'}, {'uuid': 'b'}]
+    checkpoint = CrawlCheckpoint(mongo_db, 'guilds', interval=0)
+    checkpoint.begin(lambda: items, key=lambda item: item['uuid'])
+    checkpoint.done('a')
+    remaining = CrawlCheckpoint(mongo_db, 'guilds').begin(list, resume=True, key=lambda item: item['uuid'])
+    assert remaining == [{'uuid': 'b'}]
+
+
+def test_shards_partition_the_keys():
+    keys = [f'player-{index}' for index in range(200)]
+    shards = [[key for key in keys if in_shard(key, (index, 3))] for index in range(3)]
+    assert sorted(sum(shards, [])) == sorted(keys)
+    assert all(shards)
+    assert all(in_shard(key, None) for key in keys)
+
+
+def test_shards_keep_separate_checkpoints(mongo_db):
+    for index in range(2):
+        checkpoint = CrawlCheckpoint(mongo_db, 'player-guilds', shard=(index, 2))
+        checkpoint.begin(lambda: ITEMS)
+        checkpoint.extra = {'shard': index}
+        checkpoint.finish()
+    CrawlCheckpoint(mongo_db, 'player-guilds').begin(lambda: ITEMS)
+
+    extras = load_checkpoint_extras(mongo_db, 'player-guilds', shard_count=2)
+    assert sorted(extra['shard'] for extra in extras) == [0, 1]
+
+
+@pytest.mark.parametrize('value', ['2/2', '-1/2', '0/0', 'a/b', '1'])
+def test_parse_shard_rejects_bad_values(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(value)
+
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
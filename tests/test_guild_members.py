@@ -0,0 +1,25 @@
+"""Member extraction and diffing over stored guild documents."""
+from guild import detect_member_changes
+from guild_members import extract_members
+
+
+def guild(members):
+    return {'uuid': 'g1', 'name': 'Alpha', 'prefix': 'ALP', 'members': members}
+
+
+def test_duplicate_uuid_is_kept_once():
+    members = extract_members(guild({
+        'total': 2,
+        'chief': {'u1': {'username': 'One'}},
+        'recruit': {'u1': {'username': 'One'}, 'u2': {'username': 'Two'}},
+    }))
+    assert members == {'u1': {'username': 'One', 'rank': 'recruit'},
+                       'u2': {'username': 'Two', 'rank': 'recruit'}}
+
+
+def test_joins_leaves_and_rank_changes():
+    before = guild({'chief': {'u1': {'username': 'One'}}, 'recruit': {'u2': {'username': 'Two'}}})
+    after = guild({'captain': {'u1': {'username': 'One'}, 'u3': {'username': 'Three'}}, 'recruit': {}})
+
+    events = {(event['event'], event['uuid']) for event in detect_member_changes(before, after, 0)}
+    assert events == {('join', 'u3'), ('leave', 'u2'), ('rank_change', 'u1')}
@@ -0,0 +1,88 @@
+"""The pipelined guild path must write what the serial path writes, checked against mongomock."""
+import copy
+
+import guild
+
+
+def make_guild(uuid, name, members, online=0):
+    """A guild payload; `members` maps player UUID -> (username, rank)."""
+    ranks = {'total': len(members)}
+    for player_uuid, (username, rank) in members.items():
+        ranks.setdefault(rank, {})[player_uuid] = {
+            'username': username, 'joined': '2024-01-01', 'online': online > 0, 'server': None,
+        }
+    return {'uuid': uuid, 'name': name, 'prefix': name[:3].upper(), 'members': ranks, 'online': online}
+
+
+# Runs over the same guilds: unchanged and volatile-only updates, joins, leaves and rank changes
+ROUNDS = [
+    [make_guild('g1', 'Alpha', {'p1': ('a', 'owner'), 'p2': ('b', 'chief')}),
+     make_guild('g2', 'Beta', {'p3': ('c', 'recruit')}),
+     make_guild('g3', 'Gamma', {'p4': ('d', 'owner')})],
+    [make_guild('g1', 'Alpha', {'p1': ('a', 'owner'), 'p2': ('b', 'chief')}, online=3),
+     make_guild('g2', 'Beta', {'p3': ('c', 'captain'), 'p5': ('e', 'recruit')}),
+     make_guild('g3', 'Gamma', {'p4': ('d', 'owner')})],
+    [make_guild('g1', 'Alpha', {'p1': ('a', 'owner')}),
+     make_guild('g2', 'Beta', {'p3': ('c', 'captain'), 'p5': ('e', 'recruit')}, online=1),
+     make_guild('g3', 'Gamma', {'p4': ('d', 'owner'), 'p2': ('b', 'recruit')})],
+    [make_guild('g1', 'Alpha', {'p1': ('a', 'owner')}),
+     make_guild('g2', 'Beta', {'p3': ('c', 'captain')}),
+     make_guild('g3', 'Gamma', {'p4': ('d', 'owner'), 'p2': ('b', 'recruit')})],
+]
+# Guilds the response cache reports unchanged, by round
+CACHE_UNCHANGED = {3: {'Alpha', 'Gamma'}}
+START_TIME = 1_700_000_000
+
+
+class FakeApi:
+    concurrency = 4
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def report(self):
+        pass
+
+
+def stored_documents(db):
+    guilds = [{key: value for key, value in doc.items() if key != '_id'}
+              for doc in db[guild.COLLECTION_GUILD_DATA].find().sort('uuid', 1)]
+    events = [{key: value for key, value in doc.items() if key != '_id'}
+              for doc in db[guild.COLLECTION_EVENTS].find().sort('_id', 1)]
+    return guilds, events
+
+
+def run_rounds(db, monkeypatch, concurrency, batch_size=2):
+    db.client.drop_database(db.name)
+    for round_index, payloads in enumerate(ROUNDS):
+        by_name = {payload['name']: payload for payload in payloads}
+
+        def fetch(api, guild_name, cache=None, round_index=round_index):
+            if guild_name in CACHE_UNCHANGED.get(round_index, ()):
+                return guild.UNCHANGED
+            return copy.deepcopy(by_name[guild_name])
+
+        async def fetch_async(api, guild_name, cache=None):
+            return fetch(api, guild_name, cache)
+
+        monkeypatch.setattr(guild, 'fetch_guild_data', fetch)
+        monkeypatch.setattr(guild, 'fetch_guild_data_async', fetch_async)
+        monkeypatch.setattr(guild.time, 'time', lambda: START_TIME + round_index * 600)
+        guild_list = {payload['name']: {'uuid': payload['uuid']} for payload in payloads}
+        guild.process_all_guilds(guild_list, concurrency, batch_size, api=FakeApi())
+    return stored_documents(db)
+
+
+def test_pipelined_path_matches_serial_path(mongo_db, monkeypatch):
+    serial_guilds, serial_events = run_rounds(mongo_db, monkeypatch, concurrency=1)
+    pipelined_guilds, pipelined_events = run_rounds(mongo_db, monkeypatch, concurrency=4)
+
+    assert len(serial_guilds) == 3
+    assert {event['event'] for event in serial_events} == {'join', 'leave', 'rank_change'}
+    assert pipelined_guilds == serial_guilds
+    last_round_time = START_TIME + (len(ROUNDS) - 1) * 600
+    assert all(doc['lastChecked'] == last_round_time for doc in serial_guilds)
+    assert pipelined_events == serial_events
@@ -0,0 +1,83 @@
+"""The response cache: conditional requests, 304s, content-hash hits and deferred commits."""
+import json
+import os
+
+from http_cache import ResponseCache
+
+URL = 'https://api.example/v3/guild/Alpha'
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Serves `body`, answering 304 when the request's If-None-Match is `etag`."""
+
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(headers or {})
+        if self.etag and (headers or {}).get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.body, {'ETag': self.etag} if self.etag else {})
+
+
+def body(data):
+    return json.dumps(data).encode('utf-8')
+
+
+def test_not_modified_serves_the_stored_body(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    session = FakeSession(body({'name': 'Alpha'}), etag='"v1"')
+
+    first = cache.get(URL, session=session)
+    assert (first.status_code, first.data, first.unchanged) == (200, {'name': 'Alpha'}, False)
+
+    second = cache.get(URL, session=session)
+    assert session.requests[1]['If-None-Match'] == '"v1"'
+    assert (second.status_code, second.data, second.unchanged, second.size) == (200, {'name': 'Alpha'}, True, 0)
+    assert (cache.hits, cache.not_modified, cache.misses) == (1, 1, 1)
+
+
+def test_identical_body_without_etag_is_unchanged(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    session = FakeSession(body({'name': 'Alpha'}))
+    cache.get(URL, session=session)
+
+    assert cache.get(URL, session=session).unchanged
+    session.body = body({'name': 'Alpha', 'level': 2})
+    changed = cache.get(URL, session=session)
+    assert not changed.unchanged and changed.data['level'] == 2
+
+
+def test_deferred_body_is_only_cached_once_committed(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    session = FakeSession(body({'name': 'Alpha'}), etag='"v1"')
+
+    cache.get(URL, session=session, defer_commit=True)
+    assert cache.stored_at(URL) is None
+    assert not cache.get(URL, session=session, defer_commit=True).unchanged
+    assert 'If-None-Match' not in session.requests[-1]
+
+    cache.commit(URL)
+    assert cache.stored_at(URL) is not None
+    assert cache.get(URL, session=session, defer_commit=True).unchanged
+
+
+def test_missing_body_drops_the_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    session = FakeSession(body({'name': 'Alpha'}), etag='"v1"')
+    cache.get(URL, session=session)
+    os.remove(cache._path(URL, '.body'))
+
+    response = cache.get(URL, session=session)
+    assert (response.status_code, response.data, response.unchanged) == (304, None, False)
+    assert cache.stored_at(URL) is None
+    assert not cache.get(URL, session=session).unchanged
@@ -0,0 +1,63 @@
+"""Item snapshots: hashes agree with sync_items, migration from JSON, and a failed run leaves no temp files."""
+import json
+import os
+
+import pytest
+
+from item_snapshot import SnapshotWriter, iter_snapshot_items, load_index, migrate_from_json, snapshot_exists
+from item_stream import item_hash
+
+ITEMS = {'Sword': {'internalName': 'Sword', 'tier': 'rare'}, 'Bow': {'internalName': 'Bow', 'tier': 'mythic'}}
+
+
+def test_write_hash_matches_item_hash(tmp_path):
+    writer = SnapshotWriter(str(tmp_path))
+    for name, item in ITEMS.items():
+        assert writer.write(name, item) == item_hash(item)
+    writer.commit()
+    assert load_index(str(tmp_path)) == {name: item_hash(item) for name, item in ITEMS.items()}
+    assert dict(iter_snapshot_items(str(tmp_path))) == ITEMS
+
+
+def test_abort_removes_temp_files(tmp_path):
+    writer = SnapshotWriter(str(tmp_path))
+    writer.write('Sword', ITEMS['Sword'])
+    writer.abort()
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_abort_after_failed_commit(tmp_path, monkeypatch):
+    writer = SnapshotWriter(str(tmp_path))
+    writer.write('Sword', ITEMS['Sword'])
+
+    def fail(src, dst):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        writer.commit()
+    monkeypatch.undo()
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_migrate_from_json(tmp_path):
+    json_path = tmp_path / 'previous_item_data.json'
+    json_path.write_text(json.dumps(ITEMS, indent=4), encoding='utf-8')
+    directory = str(tmp_path / 'snapshot')
+
+    assert migrate_from_json(str(json_path), directory) == 2
+    assert snapshot_exists(directory)
+    assert dict(iter_snapshot_items(directory, {'Bow'})) == {'Bow': ITEMS['Bow']}
+    assert load_index(directory) == {name: item_hash(item) for name, item in ITEMS.items()}
+
+
+def test_failed_migration_leaves_no_snapshot(tmp_path):
+    json_path = tmp_path / 'previous_item_data.json'
+    json_path.write_text('{"Sword": {"internalName": "Sword"}, "Bow": ', encoding='utf-8')
+    directory = str(tmp_path / 'snapshot')
+
+    with pytest.raises(ValueError):
+        migrate_from_json(str(json_path), directory)
+    assert not snapshot_exists(directory)
+    assert os.listdir(directory) == []
@@ -0,0 +1,51 @@
+"""Streamed item parsing must not depend on where the chunks happen to be cut."""
+import json
+
+import pytest
+
+from item_stream import iter_file_chunks, iter_items, iter_json_members
+
+ITEMS = {
+    'Sword': {'internalName': 'Sword', 'lore': 'Ünïcödé ✓ "quoted" {braces}', 'damage': 1234567},
+    'Bow': {'internalName': 'Bow', 'ratio': 0.125, 'tags': [1, [2, 3], {'a': None}], 'sealed': True},
+    'Broken': 'not an item',
+    'Nameless': {'tier': 'rare'},
+}
+EXPECTED = [('Sword', ITEMS['Sword']), ('Bow', ITEMS['Bow'])]
+
+
+def chunks(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1 << 20])
+def test_any_chunk_size(size):
+    data = json.dumps(ITEMS, ensure_ascii=False, indent=2).encode('utf-8')
+    assert list(iter_items(chunks(data, size))) == EXPECTED
+
+
+@pytest.mark.parametrize('size', [1, 5])
+def test_list_and_text_chunks(size):
+    data = json.dumps(list(ITEMS.values()), ensure_ascii=False)
+    assert list(iter_items(chunks(data, size))) == EXPECTED
+
+
+def test_number_split_across_chunks():
+    assert list(iter_json_members([b'{"a": 12', b'34, "b": [1', b'.5]}'])) == [('a', 1234), ('b', [1.5])]
+
+
+def test_empty_documents():
+    assert list(iter_json_members([b' { } '])) == []
+    assert list(iter_json_members([b'[', b']'])) == []
+
+
+@pytest.mark.parametrize('data', [b'"items"', b'{"a": 1 "b": 2}', b'{"a" 1}', b'{"a": 1'])
+def test_malformed_documents(data):
+    with pytest.raises(ValueError):
+        list(iter_json_members(chunks(data, 3)))
+
+
+def test_file_chunks(tmp_path):
+    path = tmp_path / 'items.json'
+    path.write_text(json.dumps(ITEMS), encoding='utf-8')
+    assert list(iter_items(iter_file_chunks(str(path), chunk_size=4))) == EXPECTED
@@ -0,0 +1,53 @@
+"""The member index follows guild_data, re-reading only guilds whose snapshot changed."""
+from member_index import (COLLECTION_GUILD_DATA, COLLECTION_MEMBER_INDEX, find_guild_members,
+                          refresh_member_index)
+
+
+def store_guild(db, uuid, name, members, content_hash):
+    """Replace guild `uuid`'s snapshot; `members` maps player UUID -> username."""
+    db[COLLECTION_GUILD_DATA].replace_one({'uuid': uuid}, {
+        'uuid': uuid, 'name': name, 'contentHash': content_hash,
+        'members': {'total': len(members), 'recruit': {player: {'username': username}
+                                                       for player, username in members.items()}},
+    }, upsert=True)
+
+
+def index(db):
+    return {doc['_id']: (doc['guild_uuid'], doc['username']) for doc in db[COLLECTION_MEMBER_INDEX].find()}
+
+
+def test_reindexes_changed_guilds_only(mongo_db):
+    store_guild(mongo_db, 'g1', 'Alpha', {'p1': 'a', 'p2': 'b'}, 'h1')
+    store_guild(mongo_db, 'g2', 'Beta', {'p3': 'c'}, 'h1')
+    assert refresh_member_index(mongo_db) == (2, 0)
+    assert index(mongo_db) == {'p1': ('g1', 'a'), 'p2': ('g1', 'b'), 'p3': ('g2', 'c')}
+    assert refresh_member_index(mongo_db) == (0, 0)
+
+    # p1 leaves, p2 moves from Alpha to Beta
+    store_guild(mongo_db, 'g1', 'Alpha', {}, 'h2')
+    store_guild(mongo_db, 'g2', 'Beta', {'p3': 'c', 'p2': 'b'}, 'h2')
+    assert refresh_member_index(mongo_db) == (2, 0)
+    assert index(mongo_db) == {'p2': ('g2', 'b'), 'p3': ('g2', 'c')}
+
+
+def test_moved_member_survives_the_old_guild_reindexing_later(mongo_db):
+    store_guild(mongo_db, 'g1', 'Alpha', {'p1': 'a'}, 'h1')
+    store_guild(mongo_db, 'g2', 'Beta', {}, 'h1')
+    refresh_member_index(mongo_db)
+
+    store_guild(mongo_db, 'g2', 'Beta', {'p1': 'a'}, 'h2')
+    refresh_member_index(mongo_db)
+    store_guild(mongo_db, 'g1', 'Alpha', {}, 'h2')
+    refresh_member_index(mongo_db)
+    assert index(mongo_db) == {'p1': ('g2', 'a')}
+
+
+def test_removed_guilds_are_dropped(mongo_db):
+    store_guild(mongo_db, 'g1', 'Alpha', {'p1': 'a'}, 'h1')
+    store_guild(mongo_db, 'g2', 'Beta', {'p2': 'b'}, 'h1')
+    refresh_member_index(mongo_db)
+
+    mongo_db[COLLECTION_GUILD_DATA].delete_one({'uuid': 'g1'})
+    assert refresh_member_index(mongo_db) == (0, 1)
+    assert index(mongo_db) == {'p2': ('g2', 'b')}
+    assert [entry['_id'] for entry in find_guild_members(mongo_db, ['p1', 'p2', 'p9'])] == ['p2']
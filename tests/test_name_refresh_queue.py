@@ -0,0 +1,60 @@
+"""The name refresh queue tracks the sources' UUIDs and hands each due entry to one run at a time."""
+from name_refresh_queue import COLLECTION_NAME_REFRESH_QUEUE, FAILED_RETRY_DELAY, LEASE_SECONDS, NameRefreshQueue
+
+UUID_A = '0123456789abcdef0123456789abcdef'
+DASHED_A = '01234567-89ab-cdef-0123-456789abcdef'
+UUID_B = 'fedcba9876543210fedcba9876543210'
+NOW = 1_700_000_000
+
+
+def queue_entries(db):
+    return {doc['_id']: (sorted(doc['forms']), sorted(doc['sources']))
+            for doc in db[COLLECTION_NAME_REFRESH_QUEUE].find()}
+
+
+def test_discover_follows_the_sources(mongo_db):
+    mongo_db['verified_item_data'].insert_many([{'uuid': DASHED_A, 'owner': 'a'}, {'uuid': DASHED_A}, {'owner': 'x'}])
+    mongo_db['users'].insert_one({'minecraftProfile': {'uuid': UUID_A, 'name': 'a'}})
+    queue = NameRefreshQueue(mongo_db)
+
+    assert queue.discover() == 2
+    assert queue_entries(mongo_db) == {UUID_A: ([DASHED_A, UUID_A], ['users', 'verified_item_data'])}
+    assert queue.discover() == 0
+
+    # A profile linked onto an existing user is queued; an unlinked one loses its source
+    mongo_db['users'].insert_one({'minecraftProfile': {'uuid': UUID_B, 'name': 'b'}})
+    mongo_db['verified_item_data'].delete_many({})
+    assert queue.discover() == 1
+    assert queue_entries(mongo_db) == {UUID_A: ([DASHED_A, UUID_A], ['users']),
+                                       UUID_B: ([UUID_B], ['users'])}
+
+    # Entries no source references any more are dropped
+    mongo_db['users'].delete_many({'minecraftProfile.uuid': UUID_A})
+    queue.discover()
+    assert queue_entries(mongo_db) == {UUID_B: ([UUID_B], ['users'])}
+
+
+def test_claims_are_leased(mongo_db):
+    mongo_db['users'].insert_many([{'minecraftProfile': {'uuid': uuid}} for uuid in (UUID_A, UUID_B)])
+    queue = NameRefreshQueue(mongo_db)
+    queue.discover()
+
+    claimed = queue.claim(10, NOW)
+    assert {entry['_id'] for entry in claimed} == {UUID_A, UUID_B}
+    assert queue.claim(10, NOW) == []
+    # A lease that ran out, say of a run that died, is claimed again
+    assert len(queue.claim(10, NOW + LEASE_SECONDS + 1)) == 2
+
+
+def test_complete_schedules_the_next_refresh(mongo_db):
+    mongo_db['users'].insert_many([{'minecraftProfile': {'uuid': uuid}} for uuid in (UUID_A, UUID_B)])
+    queue = NameRefreshQueue(mongo_db)
+    queue.discover()
+
+    queue.complete(queue.claim(10, NOW), {UUID_A}, NOW)
+    entries = {doc['_id']: doc for doc in mongo_db[COLLECTION_NAME_REFRESH_QUEUE].find()}
+    assert all('lease_owner' not in entry for entry in entries.values())
+    assert entries[UUID_A]['refreshed_at'] == NOW and entries[UUID_A]['due_at'] > NOW
+    assert entries[UUID_B]['retry_at'] == NOW + FAILED_RETRY_DELAY
+    assert queue.claim(10, NOW) == []
+    assert [entry['_id'] for entry in queue.claim(10, NOW + FAILED_RETRY_DELAY)] == [UUID_B]
@@ -0,0 +1,23 @@
+"""Run summaries must record failures, whether the job raises or only logs them."""
+import pytest
+
+from run_metrics import fail_run, finish_run, job_run, start_run
+
+
+def test_logged_failure_marks_the_run_failed():
+    start_run('test')
+    fail_run('RuntimeError: boom')
+    summary = finish_run()
+    assert summary['status'] == 'failed'
+    assert summary['error'] == 'RuntimeError: boom'
+
+
+def test_clean_run_is_ok():
+    start_run('test')
+    assert finish_run()['status'] == 'ok'
+
+
+def test_raised_failure_propagates():
+    with pytest.raises(RuntimeError):
+        with job_run('test'):
+            raise RuntimeError('boom')
@@ -0,0 +1,48 @@
+"""Changelog deltas must rebuild both sides of a modification."""
+from structural_diff import apply_patch, diff, modify_event, revert_patch
+
+BEFORE = {
+    'name': 'Sword',
+    'requirements': {'level': 10, 'quest': 'A/B~C'},
+    'identifications': {'damage': {'min': 1, 'max': 5}, 'speed': 2},
+    'lore': ['one', 'two'],
+    'tags': ['a'],
+    'icon': {'value': {'customModelData': 7}},
+}
+AFTER = {
+    'name': 'Sword',
+    'requirements': {'level': 11},
+    'identifications': {'damage': {'min': 1, 'max': 6}, 'mana': 3},
+    'lore': ['one', 'three'],
+    'tags': ['a', 'b'],
+    'icon': {'value': {'customModelData': 8}},
+}
+
+
+def test_round_trip():
+    operations = diff(BEFORE, AFTER)
+    assert apply_patch(BEFORE, operations) == AFTER
+    assert revert_patch(AFTER, operations) == BEFORE
+
+
+def test_whole_document_replaced():
+    operations = diff([1, 2], {'a': 1})
+    assert operations == [{'op': 'replace', 'path': '', 'value': {'a': 1}, 'oldValue': [1, 2]}]
+    assert revert_patch({'a': 1}, operations) == [1, 2]
+
+
+def test_ignored_paths():
+    ignored = ('/icon/value/customModelData',)
+    operations = diff(BEFORE, AFTER, ignored)
+    assert all(not operation['path'].startswith('/icon') for operation in operations)
+    assert modify_event({'icon': {'value': {'customModelData': 1}}}, {'icon': {'value': {'customModelData': 2}}},
+                        ignored) is None
+
+
+def test_modify_event_keeps_full_documents_by_default(monkeypatch):
+    monkeypatch.delenv('CHANGELOG_FULL_DOCUMENTS', raising=False)
+    event = modify_event(BEFORE, AFTER)
+    assert event['before'] == BEFORE and event['after'] == AFTER
+
+    monkeypatch.setenv('CHANGELOG_FULL_DOCUMENTS', '0')
+    assert set(modify_event(BEFORE, AFTER)) == {'changes'}
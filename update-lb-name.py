@@ -1,28 +1,40 @@
-from pymongo import MongoClient
-import requests
-import os
-import time
+from pymongo import UpdateMany
+import argparse
+import logging
+from mongo_client import get_db
+from name_resolver import DEFAULT_CONCURRENCY, NameResolver
+from run_logging import setup_logging
+from run_metrics import job_run, phase
 
-mongodb_uri = os.getenv('MONGODB_URI')
-client = MongoClient(mongodb_uri)
-db = client["wynnpool"]
-collection = db["verified_item_data"]
+log = logging.getLogger('update_lb_name')
 
-uuids = collection.distinct("uuid")
 
-for uuid in uuids:
-    try:
-        response = requests.get(f"https://sessionserver.mojang.com/session/minecraft/profile/{uuid}")
-        if response.status_code == 200:
-            username = response.json().get("name")
-            if username:
-                result = collection.update_many({"uuid": uuid}, {"$set": {"owner": username}})
-                print(f"Updated {result.modified_count} documents for UUID {uuid} -> {username}")
-        elif response.status_code == 429:
-            print("Rate limited by Mojang API, sleeping for 60 seconds...")
-            time.sleep(60)
-        else:
-            print(f"UUID {uuid} not found or error: {response.status_code}")
-    except Exception as e:
-        print(f"Error processing UUID {uuid}: {e}")
-    # time.sleep(1.1)  # Rate limit safety
\ No newline at end of file
+def main(concurrency=DEFAULT_CONCURRENCY):
+    db = get_db()
+    collection = db["verified_item_data"]
+    uuids = collection.distinct("uuid")
+
+    resolver = NameResolver(db, concurrency)
+    names = resolver.resolve(uuids)
+    resolver.report()
+
+    # Only touch documents whose owner name actually changed
+    ops = [
+        UpdateMany({"uuid": uuid, "owner": {"$ne": username}}, {"$set": {"owner": username}})
+        for uuid, username in names.items()
+    ]
+    if ops:
+        with phase("db_write"):
+            result = collection.bulk_write(ops, ordered=False)
+        log.info("Updated %d documents for %d UUIDs.", result.modified_count, len(names))
+    else:
+        log.info("No owner names to update.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh owner names on verified items from Mojang.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    setup_logging("update_lb_name")
+    with job_run("update_lb_name", get_db()):
+        main(args.concurrency)
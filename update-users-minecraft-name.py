@@ -1,44 +1,47 @@
-from pymongo import MongoClient
-import requests
-import os
-import time
-mongodb_uri = os.getenv("MONGODB_URI")
-client = MongoClient(mongodb_uri)
-db = client["wynnpool"]
-collection = db["users"]
-
-# Find only users that already have minecraftProfile.uuid
-users_with_uuid = collection.find(
-    {"minecraftProfile.uuid": {"$exists": True, "$ne": None}},
-    {"minecraftProfile.uuid": 1}
-)
-
-for user in users_with_uuid:
-    uuid = user["minecraftProfile"]["uuid"]
-
-    try:
-        response = requests.get(f"https://sessionserver.mojang.com/session/minecraft/profile/{uuid}")
-
-        # Mojang success
-        if response.status_code == 200:
-            data = response.json()
-            username = data.get("name")
-
-            if username:
-                result = collection.update_one(
-                    {"_id": user["_id"]},
-                    {"$set": {"minecraftProfile.name": username}}
-                )
-                print(f"Updated user {user['_id']} UUID {uuid} -> name {username}")
-
-        # Mojang rate limit
-        elif response.status_code == 429:
-            print("Rate limited by Mojang API. Sleeping for 60 seconds...")
-            time.sleep(60)
-            continue
-
-        else:
-            print(f"UUID {uuid} lookup error: {response.status_code}")
-
-    except Exception as e:
-        print(f"Error processing user {user['_id']} (UUID {uuid}): {e}")
\ No newline at end of file
+from pymongo import UpdateMany
+import argparse
+import logging
+from mongo_client import get_db
+from name_resolver import DEFAULT_CONCURRENCY, NameResolver
+from run_logging import setup_logging
+from run_metrics import job_run, phase
+
+log = logging.getLogger('update_users_minecraft_name')
+
+
+def main(concurrency=DEFAULT_CONCURRENCY):
+    db = get_db()
+    collection = db["users"]
+    # Find only users that already have minecraftProfile.uuid
+    uuids = collection.distinct(
+        "minecraftProfile.uuid",
+        {"minecraftProfile.uuid": {"$exists": True, "$ne": None}}
+    )
+
+    resolver = NameResolver(db, concurrency)
+    names = resolver.resolve(uuids)
+    resolver.report()
+
+    # Only touch users whose stored name actually changed
+    ops = [
+        UpdateMany(
+            {"minecraftProfile.uuid": uuid, "minecraftProfile.name": {"$ne": username}},
+            {"$set": {"minecraftProfile.name": username}}
+        )
+        for uuid, username in names.items()
+    ]
+    if ops:
+        with phase("db_write"):
+            result = collection.bulk_write(ops, ordered=False)
+        log.info("Updated %d users for %d UUIDs.", result.modified_count, len(names))
+    else:
+        log.info("No user names to update.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh users' Minecraft names from Mojang.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    setup_logging("update_users_minecraft_name")
+    with job_run("update_users_minecraft_name", get_db()):
+        main(args.concurrency)
@@ -1,46 +1,87 @@
-import os
+import argparse
+import logging
 import time
 import asyncio
-import aiohttp
-from pymongo import MongoClient, UpdateOne
+from pymongo import UpdateOne
 from concurrent.futures import ThreadPoolExecutor
+from http_client import wynncraft_client
+from guild_members import extract_members, iter_guild_members
+from member_index import find_guild_members, refresh_member_index
+from mongo_client import get_db
+from online_count_store import get_online_count_store
+from run_logging import Progress, setup_logging
+from run_metrics import fail_run, job_run, phase
+
+log = logging.getLogger('update_last_seen')
 
 # Database configuration
-DB_NAME = 'wynnpool'
 COLLECTION_GUILD_DATA = 'guild_data'
 COLLECTION_GUILD_LAST_SEEN = 'guild_last_seen'
-COLLECTION_GUILD_ONLINE_COUNT = 'guild_online_count'
 
 # API URL for Wynncraft player list
 PLAYER_API_URL = 'https://api.wynncraft.com/v3/player?identifier=uuid'
+PLAYER_LIST_TIMEOUT = 10
+
+# Guilds read per cursor batch in streaming mode; updates are flushed after every batch
+STREAM_BATCH_SIZE = 500
+
+# Reads guild_data as {uuid, name, members: {rank: {uuid: {username}}}}, dropping every field
+# the last seen update never looks at
+GUILD_MEMBERS_PIPELINE = [
+    {'$project': {
+        '_id': 0,
+        'uuid': 1,
+        'name': 1,
+        'members': {'$arrayToObject': {'$map': {
+            'input': {'$filter': {
+                'input': {'$objectToArray': '$members'},
+                'as': 'rank',
+                'cond': {'$and': [
+                    {'$ne': ['$$rank.k', 'total']},
+                    {'$eq': [{'$type': '$$rank.v'}, 'object']},
+                ]},
+            }},
+            'as': 'rank',
+            'in': {
+                'k': '$$rank.k',
+                'v': {'$arrayToObject': {'$map': {
+                    'input': {'$objectToArray': '$$rank.v'},
+                    'as': 'member',
+                    'in': {'k': '$$member.k', 'v': {'username': '$$member.v.username'}},
+                }}},
+            },
+        }}},
+    }},
+]
+
+def guild_last_seen_collection():
+    return get_db()[COLLECTION_GUILD_LAST_SEEN]
 
-# MongoDB connection
-mongodb_uri = os.getenv('MONGODB_URI')
-client = MongoClient(mongodb_uri)
-db = client[DB_NAME]
-guild_last_seen_collection = db[COLLECTION_GUILD_LAST_SEEN]
-guild_online_count_collection = db[COLLECTION_GUILD_ONLINE_COUNT]
+def online_count_store():
+    """The guild_online_count layout picked with ONLINE_COUNT_BACKEND (documents, timeseries or buckets)."""
+    return get_online_count_store(get_db())
 
-async def fetch_player_list(session):
+async def fetch_player_list(api):
     """Fetch the player list from Wynncraft API asynchronously."""
     try:
-        async with session.get(PLAYER_API_URL, timeout=10) as response:
-            if response.status == 200:
-                player_data = await response.json()
-                player_uuids = set(player_data['players'].keys())
-                print(f"Fetched {len(player_uuids)} player UUIDs from Wynncraft API.")
-                return player_uuids
-            else:
-                raise Exception(f"Failed to fetch player list. Status code: {response.status}")
+        with phase('fetch'):
+            response = await api.get_json_async(PLAYER_API_URL, endpoint='player/list')
+        if response.status_code == 200:
+            player_uuids = set(response.data['players'].keys())
+            log.info("Fetched %d player UUIDs from Wynncraft API.", len(player_uuids))
+            return player_uuids
+        else:
+            raise Exception(f"Failed to fetch player list. Status code: {response.status_code}")
     except Exception as e:
-        print(f"Error fetching player list: {e}")
+        log.error("Error fetching player list: %s", e)
+        fail_run(f"{type(e).__name__}: {e}")
         return set()
 
 async def process_guild(guild, player_uuids, current_time, cached_last_seen_data):
     """Process each guild to prepare updates."""
     try:
         if not isinstance(guild, dict):
-            print(f"Error: Guild data is not a dictionary. Got {type(guild).__name__}. Skipping this guild.")
+            log.warning("Guild data is not a dictionary. Got %s. Skipping this guild.", type(guild).__name__)
             return None, None
 
         guild_name = guild.get('name', 'Unknown')
@@ -48,7 +89,7 @@ async def process_guild(guild, player_uuids, current_time, cached_last_seen_data
         
         # Validate guild data
         if not guild_uuid or guild_uuid == 'Unknown':
-            print(f"Error: Guild missing valid UUID. Guild name: {guild_name}. Skipping this guild.")
+            log.warning("Guild missing valid UUID. Guild name: %s. Skipping this guild.", guild_name)
             return None, None
 
         members = extract_members(guild)
@@ -61,13 +102,19 @@ async def process_guild(guild, player_uuids, current_time, cached_last_seen_data
         })
 
         online_count = 0
+        debug = log.isEnabledFor(logging.DEBUG)
 
         for uuid, member in members.items():
             if uuid in player_uuids:
                 guild_last_seen_data['members'][uuid] = {'lastSeen': current_time}
                 online_count += 1
-                print(f"Updated lastSeen for member {member['username']} (UUID: {uuid}) in guild {guild_name}.")
+                if debug:
+                    log.debug("Updated lastSeen for member %s (UUID: %s) in guild %s.", member['username'], uuid,
+                              guild_name)
 
+        if online_count:
+            # Lets readers such as the name refresh queue pick up only guilds with new presence
+            guild_last_seen_data['updated_at'] = current_time
         last_seen_update = (guild_uuid, guild_last_seen_data) if guild_last_seen_data['members'] else None
 
         online_count_update = None
@@ -83,16 +130,14 @@ async def process_guild(guild, player_uuids, current_time, cached_last_seen_data
     except Exception as e:
         guild_name = guild.get('name', 'Unknown') if isinstance(guild, dict) else 'Unknown'
         guild_uuid = guild.get('uuid', 'Unknown') if isinstance(guild, dict) else 'Unknown'
-        print(f"Error processing guild '{guild_name}' (UUID: {guild_uuid}): {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error processing guild '%s' (UUID: %s): %s: %s", guild_name, guild_uuid, type(e).__name__, e)
         return None, None
 
 async def update_last_seen_and_online_count(guilds):
-    async with aiohttp.ClientSession() as session:
-        player_uuids = await fetch_player_list(session)
+    async with wynncraft_client(timeout=PLAYER_LIST_TIMEOUT) as api:
+        player_uuids = await fetch_player_list(api)
         if not player_uuids:
-            print("No player UUIDs fetched. Exiting.")
+            log.info("No player UUIDs fetched. Exiting.")
             return
 
         current_time = int(time.time())
@@ -100,16 +145,18 @@ async def update_last_seen_and_online_count(guilds):
         online_count_updates = []
 
         # Cache last seen data
-        cached_last_seen_data = {
-            data['guild_uuid']: data for data in guild_last_seen_collection.find()
-        }
+        with phase('db_read'):
+            cached_last_seen_data = {
+                data['guild_uuid']: data for data in guild_last_seen_collection().find()
+            }
 
         # Prepare updates concurrently
         tasks = []
         for guild in guilds:
             tasks.append(process_guild(guild, player_uuids, current_time, cached_last_seen_data))
 
-        results = await asyncio.gather(*tasks)
+        with phase('diff'):
+            results = await asyncio.gather(*tasks)
 
         for last_seen_update, online_count_update in results:
             if last_seen_update:
@@ -133,76 +180,174 @@ def batch_update_last_seen(updates):
     operations = [UpdateOne({'guild_uuid': guild_uuid}, {'$set': data}, upsert=True) for guild_uuid, data in updates]
     if operations:
         try:
-            result = guild_last_seen_collection.bulk_write(operations)
-            print(f"Bulk updated last seen data for {result.modified_count} guilds.")
+            with phase('db_write'):
+                result = guild_last_seen_collection().bulk_write(operations)
+            log.info("Bulk updated last seen data for %d guilds.", result.modified_count)
         except Exception as e:
-            print(f"Error during bulk update of last seen data: {e}")
+            log.error("Error during bulk update of last seen data: %s", e)
+            fail_run(f"{type(e).__name__}: {e}")
 
 def batch_insert_online_count(online_counts):
     """Batch insert online count data."""
     if online_counts:
         try:
-            guild_online_count_collection.insert_many(online_counts)
-            print("Inserted online count data for multiple guilds.")
+            with phase('db_write'):
+                online_count_store().insert(online_counts)
+            log.debug("Inserted online count data for %d guilds.", len(online_counts))
         except Exception as e:
-            print(f"Error inserting online count data: {e}")
+            log.error("Error inserting online count data: %s", e)
+            fail_run(f"{type(e).__name__}: {e}")
 
-def extract_members(guild_data):
-    """Extract members as a flat list of users with their ranks."""
-    members = {}
-    try:
-        if not isinstance(guild_data, dict):
-            print(f"Error: guild_data is not a dictionary. Got {type(guild_data).__name__}")
-            return members
-        
-        members_data = guild_data.get('members', {})
-        if not isinstance(members_data, dict):
-            print(f"Error: 'members' field is not a dictionary. Got {type(members_data).__name__}")
-            return members
-        
-        for rank, rank_members in members_data.items():
-            if rank != 'total':  # Skip 'total' field
-                if not isinstance(rank_members, dict):
-                    print(f"Warning: Rank '{rank}' data is not a dictionary. Skipping.")
-                    continue
-                for uuid, member_data in rank_members.items():
-                    if not isinstance(member_data, dict):
-                        print(f"Warning: Member data for UUID '{uuid}' is not a dictionary. Skipping.")
-                        continue
-                    members[uuid] = {
-                        'username': member_data.get('username'),
-                        'rank': rank
-                    }
-    except Exception as e:
-        print(f"Error extracting members from guild data: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-    return members
+async def fetch_online_players():
+    """Fetch the online player UUIDs with a short-lived client."""
+    async with wynncraft_client(timeout=PLAYER_LIST_TIMEOUT) as api:
+        return await fetch_player_list(api)
+
+def build_presence_updates(online_members, current_time):
+    """Group online guild members into per-guild lastSeen paths and online counts."""
+    last_seen_fields = {}
+    online_counts = {}
+    for member in online_members:
+        guild_uuid = member['guild_uuid']
+        fields = last_seen_fields.setdefault(guild_uuid, {
+            'guild_name': member.get('guild_name'),
+            'updated_at': current_time
+        })
+        fields[f"members.{member['_id']}.lastSeen"] = current_time
+
+        if guild_uuid not in online_counts:
+            online_counts[guild_uuid] = {
+                'guild_name': member.get('guild_name'),
+                'guild_uuid': guild_uuid,
+                'timestamp': current_time,
+                'count': 0
+            }
+        online_counts[guild_uuid]['count'] += 1
+    return last_seen_fields, list(online_counts.values())
+
+def batch_update_last_seen_paths(last_seen_fields):
+    """Set only the changed members.<uuid>.lastSeen paths of each guild's last seen document."""
+    operations = [
+        UpdateOne({'guild_uuid': guild_uuid}, {'$set': fields}, upsert=True)
+        for guild_uuid, fields in last_seen_fields.items()
+    ]
+    if operations:
+        try:
+            with phase('db_write'):
+                result = guild_last_seen_collection().bulk_write(operations, ordered=False)
+            log.debug("Bulk updated last seen data for %d guilds.", result.modified_count + result.upserted_count)
+        except Exception as e:
+            log.error("Error during bulk update of last seen data: %s", e)
+            fail_run(f"{type(e).__name__}: {e}")
+
+def update_last_seen_incremental():
+    """Update lastSeen and online counts from the member index instead of every guild document.
+
+    The work done depends on the number of online players, not on the number of guilds.
+    """
+    player_uuids = asyncio.run(fetch_online_players())
+    if not player_uuids:
+        log.info("No player UUIDs fetched. Exiting.")
+        return
+
+    current_time = int(time.time())
+    with phase('db_read'):
+        reindexed, removed = refresh_member_index(get_db())
+        log.info("Member index refreshed: %d guilds re-indexed, %d removed.", reindexed, removed)
+        online_members = list(find_guild_members(get_db(), player_uuids))
+
+    last_seen_fields, online_counts = build_presence_updates(online_members, current_time)
+    log.info("%d online players across %d guilds.", sum(count['count'] for count in online_counts), len(online_counts))
+
+    batch_update_last_seen_paths(last_seen_fields)
+    batch_insert_online_count(online_counts)
+
+def iter_guild_batches(batch_size):
+    """Stream projected guild documents from guild_data in lists of `batch_size`."""
+    cursor = get_db()[COLLECTION_GUILD_DATA].aggregate(GUILD_MEMBERS_PIPELINE, batchSize=batch_size)
+    batch = []
+    for guild in cursor:
+        batch.append(guild)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def update_last_seen_streaming(batch_size=STREAM_BATCH_SIZE):
+    """Update lastSeen and online counts while streaming guild_data, flushing after each batch.
+
+    Only one batch of projected guilds is held in memory at a time, whatever the collection size.
+    """
+    player_uuids = asyncio.run(fetch_online_players())
+    if not player_uuids:
+        log.info("No player UUIDs fetched. Exiting.")
+        return
+
+    current_time = int(time.time())
+    guild_count = 0
+    online_count = 0
+    progress = Progress(log, 'guilds')
+    for guilds in iter_guild_batches(batch_size):
+        online_members = (
+            {'_id': uuid, 'guild_uuid': guild['uuid'], 'guild_name': guild.get('name')}
+            for guild in guilds if guild.get('uuid')
+            for uuid, _ in iter_guild_members(guild) if uuid in player_uuids
+        )
+        last_seen_fields, online_counts = build_presence_updates(online_members, current_time)
+        batch_update_last_seen_paths(last_seen_fields)
+        batch_insert_online_count(online_counts)
+
+        guild_count += len(guilds)
+        online_count += sum(count['count'] for count in online_counts)
+        progress.advance(len(guilds))
+
+    log.info("Streamed %d guilds, %d online members.", guild_count, online_count)
 
 def delete_old_datasets():
-    """Delete datasets older than 14 days."""
-    three_days_ago = int(time.time()) - 14 * 24 * 60 * 60  # Calculate the timestamp for 14 days ago
+    """Delete datasets older than 14 days (a no-op for the TTL-expired online count layouts)."""
     try:
         # Remove old records from the guild_online_count collection
-        deleted_online_count = guild_online_count_collection.delete_many({
-            "timestamp": {"$lt": three_days_ago}
-        })
-        print(f"Deleted {deleted_online_count.deleted_count} outdated records from guild_online_count.")
+        deleted_online_count = online_count_store().expire(int(time.time()))
+        log.info("Deleted %d outdated records from guild_online_count.", deleted_online_count)
     except Exception as e:
-        print(f"An error occurred while deleting outdated datasets: {e}")
+        log.error("An error occurred while deleting outdated datasets: %s", e)
 
-def main():
+def main(mode='full', batch_size=STREAM_BATCH_SIZE):
     try:
         start_time = time.time()
-        guilds = list(db[COLLECTION_GUILD_DATA].find())  # Fetch all guilds once
-        print(f"Processing {len(guilds)} guilds...")
-        asyncio.run(update_last_seen_and_online_count(guilds))
+        online_count_store().setup()
+        if mode == 'incremental':
+            update_last_seen_incremental()
+        elif mode == 'streaming':
+            update_last_seen_streaming(batch_size)
+        else:
+            with phase('db_read'):
+                guilds = list(get_db()[COLLECTION_GUILD_DATA].find())  # Fetch all guilds once
+            log.info("Processing %d guilds...", len(guilds))
+            asyncio.run(update_last_seen_and_online_count(guilds))
         delete_old_datasets()  # Call the function to remove outdated datasets
-        print("Finished updating lastSeen and online counts for all guilds. Operation took:", time.time() - start_time, "sec")
+        log.info("Finished updating lastSeen and online counts for all guilds. Operation took: %.2f sec",
+                 time.time() - start_time)
     except Exception as e:
-        print(f"An error occurred: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("An error occurred: %s: %s", type(e).__name__, e)
+        fail_run(f"{type(e).__name__}: {e}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Update guild members' lastSeen and guild online counts.")
+    parser.add_argument('--mode', choices=['full', 'incremental', 'streaming'], default='full',
+                        help="'incremental' uses the persistent member index instead of reading every guild; "
+                             "'streaming' reads projected guilds in batches and flushes as it goes.")
+    parser.add_argument('--batch-size', type=int, default=STREAM_BATCH_SIZE,
+                        help="Guilds per cursor batch in streaming mode.")
+    parser.add_argument('--setup', action='store_true',
+                        help="Create the online count layout's indexes and exit.")
+    args = parser.parse_args()
+
+    setup_logging('update_last_seen')
+    if args.setup:
+        online_count_store().setup_indexes()
+        log.info("Online count indexes created.")
+    else:
+        with job_run('update_last_seen', get_db()):
+            main(args.mode, args.batch_size)